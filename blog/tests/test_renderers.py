@@ -0,0 +1,137 @@
+import datetime
+import decimal
+import io
+import uuid
+import zoneinfo
+
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from blog import serializers
+from project.test_base.test_models import TestPostsModelBase
+from utils.handlers import custom_exception_handler
+from utils.parsers import ORJSONParser
+from utils.renderers import ORJSONRenderer
+
+
+class ORJSONRendererTestCase(TestPostsModelBase):
+    """ orjson renderer must produce the same bytes as DRF's JSONRenderer """
+
+    def assertSameOutput(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_basic_types(self):
+        """Validate strings, numbers and escaping"""
+
+        self.assertSameOutput(
+            {
+                "text": 'Cancún 漢字 "quoted" \\ / \x00 \x1f    ',
+                "numbers": [1, -0.0, 0.1 + 0.2, 2**63 - 1, 100.0],
+                "flags": [True, False, None],
+                1: "int key",
+            }
+        )
+
+    def test_special_types(self):
+        """Validate DRF encoder types"""
+
+        self.assertSameOutput(
+            {
+                "utc": datetime.datetime(
+                    2025, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc
+                ),
+                "cancun": datetime.datetime(
+                    2025, 1, 2, 3, 4, 5, tzinfo=zoneinfo.ZoneInfo("America/Cancun")
+                ),
+                "naive": datetime.datetime(2025, 1, 2, 3, 4, 5),
+                "date": datetime.date(2025, 1, 2),
+                "time": datetime.time(3, 4, 5, 100),
+                "timedelta": datetime.timedelta(hours=1),
+                "decimal": decimal.Decimal("95.50"),
+                "uuid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+                "lazy": gettext_lazy("Spanish"),
+                "bytes": b"raw",
+                "tuple": (1, 2),
+                "set": {3},
+            }
+        )
+
+    def test_big_int_falls_back(self):
+        """Validate integers orjson can't encode"""
+
+        self.assertSameOutput({"big": 2**70})
+
+    def test_small_floats_fall_back(self):
+        """Validate floats orjson writes without the stdlib exponent"""
+
+        self.assertSameOutput({"small": [1e-7, 0.00001, -4.2e-5, 5e-324, 1e-4]})
+        self.assertSameOutput({"large": [1e16, 1.5e300, 123456.789]})
+
+    def test_non_finite_floats_become_null(self):
+        """Validate the known NaN/Infinity difference"""
+
+        data = {"nan": float("nan"), "inf": float("inf")}
+
+        self.assertEqual(ORJSONRenderer().render(data), b'{"nan":null,"inf":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(data)
+
+    def test_post_list(self):
+        """Validate a serialized post list"""
+
+        self.create_post(title="Cancún airport guide", lang="es")
+        self.create_post(title="Tulum day trip", lang="en")
+        data = serializers.PostListItemSerializer(
+            serializers.models.Post.objects.all(), many=True
+        ).data
+
+        self.assertSameOutput(data)
+
+    def test_exception_envelope(self):
+        """Validate the custom_exception_handler envelope"""
+
+        response = custom_exception_handler(
+            ValidationError({"keyword": ["This field is required."]}), {}
+        )
+
+        self.assertIsInstance(response.data["data"]["keyword"][0], ErrorDetail)
+        self.assertSameOutput(response.data)
+
+    def test_indent_uses_stdlib(self):
+        """Validate indented output requested by the client"""
+
+        renderer = ORJSONRenderer()
+        self.assertEqual(
+            renderer.render({"a": 1}, "application/json; indent=2"),
+            JSONRenderer().render({"a": 1}, "application/json; indent=2"),
+        )
+
+
+class ORJSONParserTestCase(TestPostsModelBase):
+    """ orjson parser must return the same data and errors as DRF's JSONParser """
+
+    def parse(self, parser, body):
+        try:
+            return parser.parse(io.BytesIO(body))
+        except Exception as exc:
+            return type(exc), str(exc)
+
+    def assertSameResult(self, body):
+        self.assertEqual(
+            self.parse(ORJSONParser(), body), self.parse(JSONParser(), body)
+        )
+
+    def test_valid_bodies(self):
+        """Validate parsed data"""
+
+        self.assertSameResult('{"keyword": "Cancún", "passengers": 2}'.encode())
+        self.assertSameResult(b'[1, 2.5e3, "\\u00e9", "\\ud800"]')
+        self.assertSameResult(b'{"big": 123456789012345678901234567890}')
+
+    def test_invalid_bodies(self):
+        """Validate parse errors"""
+
+        self.assertSameResult(b'{"a": NaN}')
+        self.assertSameResult(b"{bad")
@@ -0,0 +1,21 @@
+# Gunicorn picks this file up automatically from the working directory
+
+
+def post_worker_init(worker):
+    """Warm up each worker before it accepts requests."""
+    from django.conf import settings
+
+    if settings.LEGACY_WORKER_WARMUP:
+        from legacy_middleware.warmup import warm_up_worker
+
+        warm_up_worker()
+
+
+def child_exit(server, worker):
+    """Forget the live gauges of a dead worker, its counters keep adding up."""
+    import os
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
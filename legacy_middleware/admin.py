@@ -1,10 +1,62 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.views.decorators.http import require_POST
 from solo.admin import SingletonModelAdmin
 from unfold.admin import ModelAdmin as UnfoldModelAdmin
-from .models import LegacyAPIToken
+from .cache import autocomplete_cache, quote_cache
+from .models import (
+    IdempotencyRecord,
+    LegacyAPIToken,
+    PaymentLinkJob,
+    QuoteRouteDemand,
+)
 
 
 @admin.register(LegacyAPIToken)
 class LegacyAPITokenAdmin(UnfoldModelAdmin, SingletonModelAdmin):
     # This combines Unfold's UI with Solo's singleton logic
     pass
+
+
+@admin.register(IdempotencyRecord)
+class IdempotencyRecordAdmin(UnfoldModelAdmin):
+    list_display = ("key", "endpoint", "status", "response_status", "created_at", "expires_at")
+    list_filter = ("endpoint", "status")
+    search_fields = ("key",)
+    readonly_fields = [field.name for field in IdempotencyRecord._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(PaymentLinkJob)
+class PaymentLinkJobAdmin(UnfoldModelAdmin):
+    list_display = ("id", "reservation_id", "status", "created_at", "completed_at")
+    list_filter = ("status",)
+    search_fields = ("reservation_id",)
+    readonly_fields = [field.name for field in PaymentLinkJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(QuoteRouteDemand)
+class QuoteRouteDemandAdmin(UnfoldModelAdmin):
+    list_display = ("route_key", "requests", "last_requested_at", "last_warmed_at")
+    ordering = ("-requests",)
+    readonly_fields = [field.name for field in QuoteRouteDemand._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@require_POST
+def flush_negative_cache(request):
+    """
+    Dashboard action dropping the cached "no availability" and empty answers
+    of the legacy API on every worker, e.g. once new inventory is loaded.
+    """
+    autocomplete_cache.clear_negative()
+    quote_cache.clear_negative()
+    messages.success(request, "Cached upstream errors and empty results flushed.")
+    return redirect("admin:index")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LegacyMiddlewareConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'legacy_middleware'
+
+    def ready(self):
+        # Connect the token cache invalidation signals
+        from . import tokens  # noqa: F401
@@ -0,0 +1,637 @@
+import asyncio
+import time
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.response import Response
+from rest_framework import status
+
+from .breaker import CircuitOpenError
+from .metrics import (
+    DEBOUNCE_STAGE,
+    TOKEN_REFRESH_STAGE,
+    TOKEN_STAGE,
+    UPSTREAM_STAGE,
+)
+from .autocomplete import autocomplete_debouncer, prefix_keys
+from .cache import (
+    FRESH,
+    SERVABLE_STATES,
+    STALE,
+    autocomplete_cache,
+    normalize_keyword,
+    quote_cache,
+    start_async_refresh,
+)
+from .models import PaymentLinkJob
+from .payment_jobs import start_payment_link_job
+from .idempotency import claim_key, reclaim_key, request_fingerprint
+from .pipeline import BudgetExceeded, ReservationPipeline
+from .prewarm import route_demand
+from .singleflight import autocomplete_flight, quote_flight
+from .streaming import astream_records, streaming_response
+from .services import (
+    afetch_legacy_autocomplete,
+    afetch_quote,
+    afetch_reservation_create,
+    afetch_payment_link,
+    afetch_my_booking,
+)
+from .views import (
+    CACHE_STATUS_HEADER,
+    PAYMENT_LINK_METHODS,
+    AutocompleteProxyView,
+    QuoteBatchProxyView,
+    QuoteCalendarProxyView,
+    QuoteProxyView,
+    ReservationCreateProxyView,
+    MyBookingProxyView,
+    PaymentLinkJobView,
+    get_shared_headers,
+)
+
+# Errors raised by either client (token refresh still uses the sync one)
+UPSTREAM_ERRORS = (requests.RequestException, httpx.HTTPError)
+
+
+class AsyncLegacyProxyMixin:
+    """
+    Native async execution path for the legacy proxy views.
+
+    The upstream call is awaited on the pooled httpx client, so one ASGI
+    worker can keep many upstream requests in flight. Token handling,
+    validation and error mapping are shared with the sync views.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Async version of APIView.dispatch."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication may hit the session table
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_legacy_token(self):
+        return await sync_to_async(self.get_legacy_token)()
+
+    async def arefresh_legacy_token(self, stale_token=None):
+        return await sync_to_async(self.refresh_legacy_token)(stale_token)
+
+    async def astore_result(
+        self, cache, cache_key, response, is_cacheable, cost=None, ttl=None
+    ):
+        """Async version of store_result."""
+        negative_ttl = self.negative_ttl(response)
+        if negative_ttl is None:
+            if is_cacheable(response):
+                await cache.aset(cache_key, response.data, ttl=ttl, cost=cost)
+        elif negative_ttl > 0:
+            if ttl is not None:
+                negative_ttl = min(negative_ttl, ttl)
+            await cache.aset(
+                cache_key, response.data, ttl=negative_ttl, cost=cost, negative=True
+            )
+
+    async def astore_fetched(self, cache, cache_key, fetch_func, is_cacheable):
+        """Async version of store_fetched, fetch_func is a coroutine function."""
+        started = time.monotonic()
+        response = await fetch_func()
+        cost = time.monotonic() - started
+        await self.astore_result(cache, cache_key, response, is_cacheable, cost=cost)
+        return response
+
+    async def arefresh_cached(self, cache, cache_key, fetch_func, is_cacheable):
+        """Async version of refresh_cached, the refresh runs as a loop task."""
+        if not await cache.aclaim_refresh(cache_key):
+            return
+
+        async def refresh():
+            try:
+                await self.astore_fetched(cache, cache_key, fetch_func, is_cacheable)
+            finally:
+                await cache.arelease_refresh(cache_key)
+
+        start_async_refresh(refresh())
+
+    async def acache_lookup(self, cache, cache_key, fetch_func, is_cacheable):
+        """Async version of cache_lookup."""
+        cached, state = await cache.alookup(cache_key)
+        if state in SERVABLE_STATES and state != FRESH:
+            await self.arefresh_cached(cache, cache_key, fetch_func, is_cacheable)
+        return cached, state
+
+    async def afetch_through_cache(
+        self, cache, flight, cache_key, fetch_func, is_cacheable, stale=None
+    ):
+        """Async version of fetch_through_cache."""
+
+        async def fetch():
+            response = await self.astore_fetched(
+                cache, cache_key, fetch_func, is_cacheable
+            )
+            return response.data, response.status_code, get_shared_headers(response)
+
+        async def lookup():
+            cached = await cache.aget(cache_key)
+            return None if cached is None else (cached, status.HTTP_200_OK, {})
+
+        data, status_code, headers = await flight.ado(cache_key, fetch, lookup)
+        if stale is not None and status_code >= 500:
+            return self.make_proxy_response(stale, status.HTTP_200_OK), "STALE"
+        return self.make_proxy_response(data, status_code, headers), "MISS"
+
+    async def acached_proxy_request(
+        self, cache, flight, cache_key, fetch_func, is_cacheable
+    ):
+        """Async version of cached_proxy_request, fetch_func is a coroutine function."""
+        cached, state = await self.acache_lookup(
+            cache, cache_key, fetch_func, is_cacheable
+        )
+        if state in SERVABLE_STATES:
+            response = self.make_proxy_response(cached, status.HTTP_200_OK)
+            return response, self.cached_status(state)
+        return await self.afetch_through_cache(
+            cache,
+            flight,
+            cache_key,
+            fetch_func,
+            is_cacheable,
+            stale=cached if state == STALE else None,
+        )
+
+    async def aexecute_proxy_request(
+        self, request_func, payload, requires_auth=True, validate_func=None
+    ):
+        """Async version of execute_proxy_request."""
+        timings = self.get_request_timings()
+        endpoint = getattr(request_func, "__name__", None)
+        try:
+            token = None
+            if requires_auth:
+                try:
+                    with timings.span(TOKEN_STAGE):
+                        token_obj = await self.aget_legacy_token()
+                    token = token_obj.token
+                except BudgetExceeded:
+                    return self.budget_exceeded_response()
+                except UPSTREAM_ERRORS:
+                    return Response(
+                        {"error": "Upstream authentication failed"},
+                        status=status.HTTP_502_BAD_GATEWAY,
+                    )
+
+            with timings.span(UPSTREAM_STAGE, endpoint):
+                response = await (
+                    request_func(token, payload)
+                    if requires_auth
+                    else request_func(payload)
+                )
+
+            # Retry on 401
+            if requires_auth and response.status_code == 401:
+                try:
+                    with timings.span(TOKEN_REFRESH_STAGE):
+                        token = (await self.arefresh_legacy_token(token)).token
+                    with timings.span(UPSTREAM_STAGE, endpoint):
+                        response = await request_func(token, payload)
+                except BudgetExceeded:
+                    return self.budget_exceeded_response()
+                except UPSTREAM_ERRORS:
+                    return Response(
+                        {"error": "Upstream authentication failed during retry"},
+                        status=status.HTTP_502_BAD_GATEWAY,
+                    )
+
+            return self.build_upstream_response(response, validate_func)
+
+        except CircuitOpenError as exc:
+            return self.circuit_open_response(exc)
+        except BudgetExceeded:
+            return self.budget_exceeded_response()
+        except UPSTREAM_ERRORS:
+            return Response(
+                {"error": "Upstream service unreachable"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+
+
+class AsyncAutocompleteProxyView(AsyncLegacyProxyMixin, AutocompleteProxyView):
+    """
+    Async proxy view for the legacy autocomplete API.
+    """
+
+    async def acached_response(self, keyword):
+        """Async version of cached_response."""
+        cached_key, cached, ttl = await autocomplete_cache.aget_first(
+            prefix_keys(keyword)
+        )
+        response, narrowed = self.reuse_cached(keyword, cached_key, cached)
+        if narrowed is not None:
+            await self.astore_result(
+                autocomplete_cache,
+                keyword,
+                response,
+                self.is_cacheable_autocomplete,
+                ttl=ttl,
+            )
+        return response
+
+    async def amark_keyword(self, request):
+        """Async version of mark_keyword."""
+        session = self.get_debounce_session(request)
+        if session is None:
+            return None
+        return session, await autocomplete_debouncer.amark(session), time.monotonic()
+
+    async def ais_superseded(self, mark):
+        """
+        Async version of is_superseded, the wait holds no thread.
+        """
+        if mark is None:
+            return False
+        wait = self.debounce_wait(mark)
+        if wait:
+            with self.get_request_timings().span(DEBOUNCE_STAGE):
+                await asyncio.sleep(wait)
+        session, token, _ = mark
+        return not await autocomplete_debouncer.ais_latest(session, token)
+
+    async def post(self, request, *args, **kwargs):
+        keyword = request.data.get("keyword")
+        if not keyword:
+            return Response(
+                {"error": "Keyword is required"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        normalized = normalize_keyword(keyword)
+        if len(normalized) < settings.LEGACY_AUTOCOMPLETE_MIN_LENGTH:
+            return self.keyword_too_short_response()
+
+        response = self.gazetteer_response(keyword)
+        if response is not None:
+            return response
+
+        mark = await self.amark_keyword(request)
+
+        def fetch():
+            return self.aexecute_proxy_request(
+                afetch_legacy_autocomplete, keyword, requires_auth=False
+            )
+
+        cached, state = await self.acache_lookup(
+            autocomplete_cache, normalized, fetch, self.is_cacheable_autocomplete
+        )
+        if state in SERVABLE_STATES:
+            return self.make_proxy_response(cached, status.HTTP_200_OK)
+
+        response = await self.acached_response(normalized)
+        if response is not None:
+            return response
+
+        if await self.ais_superseded(mark):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        response, _ = await self.afetch_through_cache(
+            autocomplete_cache,
+            autocomplete_flight,
+            normalized,
+            fetch,
+            self.is_cacheable_autocomplete,
+            stale=cached if state == STALE else None,
+        )
+        return response
+
+
+class AsyncQuoteProxyView(AsyncLegacyProxyMixin, QuoteProxyView):
+    """
+    Async proxy view for the legacy Quote/Search API.
+    """
+
+    async def aquote(self, payload, cache_key):
+        """Async version of quote()."""
+        if cache_key is None:
+            response = await self.aexecute_proxy_request(
+                afetch_quote, payload, validate_func=self.validate_quote_structure
+            )
+            return response, "BYPASS"
+
+        return await self.acached_proxy_request(
+            quote_cache,
+            quote_flight,
+            cache_key,
+            lambda: self.aexecute_proxy_request(
+                afetch_quote, payload, validate_func=self.validate_quote_structure
+            ),
+            self.is_cacheable_quote,
+        )
+
+    async def post(self, request, *args, **kwargs):
+        await route_demand.arecord(request.data)
+        response, cache_status = await self.aquote(
+            request.data, self.get_quote_cache_key(request)
+        )
+        response[CACHE_STATUS_HEADER] = cache_status
+        return response
+
+
+class AsyncQuoteBatchProxyView(AsyncQuoteProxyView, QuoteBatchProxyView):
+    """
+    Async proxy view quoting several payloads in one request.
+    """
+
+    async def aacquire_batch_token(self):
+        """Async version of acquire_batch_token()."""
+        try:
+            with self.get_request_timings().span(TOKEN_STAGE):
+                await self.aget_legacy_token()
+        except CircuitOpenError as exc:
+            return self.circuit_open_response(exc)
+        except UPSTREAM_ERRORS:
+            return Response(
+                {"error": "Upstream authentication failed"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+        return None
+
+    async def aquote_many(self, payloads):
+        """Async version of quote_many()."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def quote_item(payload):
+            async with semaphore:
+                return await self.aquote(
+                    payload, self.get_quote_cache_key(self.request, payload)
+                )
+
+        return await asyncio.gather(*(quote_item(payload) for payload in payloads))
+
+    async def aiter_quotes(self, payloads):
+        """Async version of iter_quotes()."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def quote_item(index, payload):
+            async with semaphore:
+                response, cache_status = await self.aquote(
+                    payload, self.get_quote_cache_key(self.request, payload)
+                )
+            return index, response, cache_status
+
+        tasks = [
+            asyncio.ensure_future(quote_item(index, payload))
+            for index, payload in enumerate(payloads)
+        ]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield await completed
+        finally:
+            # The client may have gone away
+            for task in tasks:
+                task.cancel()
+
+    async def post(self, request, *args, **kwargs):
+        stream_format, error = self.get_stream_format(request)
+        if error:
+            return error
+
+        quotes, error = self.get_batch_payloads(request)
+        if error:
+            return error
+
+        error = await self.aacquire_batch_token()
+        if error:
+            return error
+
+        if stream_format:
+            return streaming_response(
+                stream_format,
+                astream_records(
+                    stream_format, self.aiter_quotes(quotes), self.stream_record
+                ),
+            )
+
+        results = [
+            self.batch_result(*quoted) for quoted in await self.aquote_many(quotes)
+        ]
+        return Response({"results": results})
+
+
+class AsyncQuoteCalendarProxyView(AsyncQuoteBatchProxyView, QuoteCalendarProxyView):
+    """
+    Async proxy view reporting the cheapest price of a route per day.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        stream_format, error = self.get_stream_format(request)
+        if error:
+            return error
+
+        days, error = self.get_calendar_payloads(request)
+        if error:
+            return error
+
+        error = await self.aacquire_batch_token()
+        if error:
+            return error
+
+        payloads = [payload for _, payload in days]
+        if stream_format:
+            self.calendar_dates = [day for day, _ in days]
+            return streaming_response(
+                stream_format,
+                astream_records(
+                    stream_format, self.aiter_quotes(payloads), self.stream_record
+                ),
+            )
+
+        quoted = await self.aquote_many(payloads)
+        return Response(
+            {
+                "currency": request.data["quote"].get("currency"),
+                "days": [
+                    self.calendar_day(day, *result)
+                    for (day, _), result in zip(days, quoted)
+                ],
+            }
+        )
+
+
+class AsyncReservationCreateProxyView(
+    AsyncLegacyProxyMixin, ReservationCreateProxyView
+):
+    """
+    Async proxy view for the legacy Reservation Create API.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        key, error = self.get_idempotency_key(request)
+        if error:
+            return error
+        if key is None:
+            return await self.acreate_reservation(request)
+
+        fingerprint = request_fingerprint(request.data)
+        deadline = time.monotonic() + settings.LEGACY_IDEMPOTENCY_WAIT
+        while True:
+            record, claimed = await sync_to_async(claim_key)(
+                self.idempotency_endpoint, key, fingerprint
+            )
+            if not claimed and self.is_resumable(record, fingerprint):
+                claimed = await sync_to_async(reclaim_key)(record)
+            if claimed:
+                break
+            response = self.replay_idempotent(record, fingerprint)
+            if response is not None:
+                return response
+            if time.monotonic() >= deadline:
+                return self.idempotency_conflict_response()
+            await asyncio.sleep(settings.LEGACY_IDEMPOTENCY_POLL_INTERVAL)
+
+        self.idempotency_record = record
+        try:
+            if record.reservation_id:
+                response = await self.aresume_reservation(
+                    request, record.reservation_id
+                )
+            else:
+                response = await self.acreate_reservation(request)
+        except BaseException:
+            await sync_to_async(self.abandon_idempotent)(record)
+            raise
+        await sync_to_async(self.finish_idempotent)(record, response)
+        return response
+
+    async def acreate_reservation(self, request):
+        self.pipeline = ReservationPipeline()
+
+        # 1. Create Reservation
+        response = await self.aexecute_proxy_request(
+            self.pipeline.abind(afetch_reservation_create),
+            request.data,
+            validate_func=self.validate_reservation_response,
+        )
+
+        if response.status_code != 200:
+            return response
+        self.reservation_created = True
+        await sync_to_async(self.remember_reservation)(response.data)
+
+        # 2. Check for Payment Generation Requirement (Stripe/PayPal)
+        payment_method = self.get_payment_method(request)
+
+        if payment_method in PAYMENT_LINK_METHODS:
+            reservation_id = self.extract_reservation_id(response.data)
+
+            if not reservation_id:
+                return Response(
+                    {
+                        "error": "Failed to extract reservation ID for payment link generation"
+                    },
+                    status=status.HTTP_502_BAD_GATEWAY,
+                )
+
+            return await self.apayment_link_response(request, reservation_id)
+
+        return response
+
+    async def aresume_reservation(self, request, reservation_id):
+        """Async version of resume_reservation."""
+        self.pipeline = ReservationPipeline()
+        self.reservation_created = True
+        if self.get_payment_method(request) in PAYMENT_LINK_METHODS:
+            return await self.apayment_link_response(request, reservation_id)
+        return Response({"reservation_id": reservation_id}, status=status.HTTP_200_OK)
+
+    async def apayment_link_response(self, request, reservation_id):
+        """Async version of payment_link_response."""
+        payment_kwargs = self.get_payment_link_kwargs(
+            request, reservation_id, self.get_payment_method(request)
+        )
+        if self.prefers_async(request):
+            # 3. Let a background job get the link, the client polls it
+            job = await sync_to_async(start_payment_link_job)(
+                reservation_id, payment_kwargs
+            )
+            return self.payment_link_job_response(request, job)
+
+        # 3. Get Payment Link
+        try:
+            payment_response = await self.aget_payment_link(payment_kwargs)
+            payment_response.raise_for_status()
+
+            # 4. Return ONLY the payment link
+            return self.build_payment_link_response(payment_response)
+
+        except BudgetExceeded:
+            return self.payment_link_timeout_response()
+        except Exception:
+            return Response(
+                {"error": "Failed to generate payment link"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+
+    async def aget_payment_link(self, payment_kwargs):
+        """Async version of get_payment_link."""
+        timings = self.get_request_timings()
+        with timings.span(TOKEN_STAGE):
+            token = (await self.aget_legacy_token()).token
+        return await self.pipeline.afetch_payment_link(
+            afetch_payment_link, timings, token, **payment_kwargs
+        )
+
+
+class AsyncPaymentLinkJobView(AsyncLegacyProxyMixin, PaymentLinkJobView):
+    """
+    Async status of a payment link job, long polls don't hold a thread.
+    """
+
+    async def get(self, request, job_id, *args, **kwargs):
+        deadline = time.monotonic() + self.get_wait(request)
+        while True:
+            job = await PaymentLinkJob.objects.filter(pk=job_id).afirst()
+            if job is None or job.is_done or time.monotonic() >= deadline:
+                return self.job_response(job)
+            await asyncio.sleep(settings.LEGACY_PAYMENT_LINK_JOB_POLL_INTERVAL)
+
+
+class AsyncMyBookingProxyView(AsyncLegacyProxyMixin, MyBookingProxyView):
+    """
+    Async proxy view for retrieving existing reservation details.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        code = request.data.get("code")
+        email = request.data.get("email")
+
+        if not code or not email:
+            return Response(
+                {"error": "Both 'code' and 'email' are required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return await self.aexecute_proxy_request(
+            afetch_my_booking,
+            request.data,
+            validate_func=self.validate_my_booking_response,
+        )
@@ -0,0 +1,102 @@
+import hashlib
+import math
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .gazetteer import item_matches
+from .passthrough import load_raw
+
+# Request header naming the typing session of a client, the unit of the
+# autocomplete debounce. Requests without it are never debounced.
+SESSION_HEADER = "X-Autocomplete-Session"
+
+
+def prefix_keys(keyword) -> list:
+    """
+    Cache keys a normalized keyword can be answered from: itself, then its
+    prefixes from the longest down to LEGACY_AUTOCOMPLETE_MIN_LENGTH.
+    """
+    if settings.LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT <= 0:
+        return [keyword]
+    shortest = max(settings.LEGACY_AUTOCOMPLETE_MIN_LENGTH, 1)
+    return [keyword[:end] for end in range(len(keyword), shortest - 1, -1)]
+
+
+def narrow_result(data, keyword):
+    """
+    Result of a longer keyword, filtered out of the cached result of one of
+    its prefixes, or None when that result can't be reused.
+
+    Only results with fewer items than LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT are
+    reused: a full page may have been truncated by the upstream, and the
+    places of the longer keyword could be among the ones left out.
+    """
+    data = load_raw(data)
+    if not isinstance(data, dict) or "error" in data:
+        return None
+    items = data.get("items")
+    if not isinstance(items, list):
+        return None
+    if len(items) >= settings.LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT:
+        return None
+    return {**data, "items": [item for item in items if item_matches(item, keyword)]}
+
+
+class Debouncer:
+    """
+    Keep only the last of the requests a client session sends within a window.
+
+    Each request marks itself as the session's latest, and is dropped if the
+    session marked a newer one before it goes upstream. The marks are kept
+    in the LEGACY_CACHE_ALIAS cache, which must be shared by the workers
+    (e.g. Redis) for requests landing on different workers to see each
+    other.
+
+    Sessions are supplied by the clients: addresses are shared by every
+    guest behind a hotel NAT.
+    """
+
+    def __init__(self, name, window_setting):
+        self.name = name
+        self.window_setting = window_setting
+
+    @property
+    def window(self):
+        return getattr(settings, self.window_setting)
+
+    @property
+    def shared(self):
+        return caches[settings.LEGACY_CACHE_ALIAS]
+
+    def make_key(self, client) -> str:
+        # Client supplied, hashed to keep the key short and safe for memcached
+        digest = hashlib.sha256(str(client).encode("utf-8")).hexdigest()[:32]
+        return f"legacy_middleware:{self.name}:debounce:{digest}"
+
+    def _timeout(self):
+        # Outlives the request, an expired mark would make it look superseded
+        return max(math.ceil(self.window * 2), 30)
+
+    def mark(self, client) -> str:
+        """Mark a new request as the client's latest, returns its token."""
+        token = uuid.uuid4().hex
+        self.shared.set(self.make_key(client), token, timeout=self._timeout())
+        return token
+
+    def is_latest(self, client, token) -> bool:
+        return self.shared.get(self.make_key(client), token) == token
+
+    async def amark(self, client) -> str:
+        token = uuid.uuid4().hex
+        await self.shared.aset(self.make_key(client), token, timeout=self._timeout())
+        return token
+
+    async def ais_latest(self, client, token) -> bool:
+        return await self.shared.aget(self.make_key(client), token) == token
+
+
+autocomplete_debouncer = Debouncer(
+    "autocomplete", window_setting="LEGACY_AUTOCOMPLETE_DEBOUNCE"
+)
@@ -0,0 +1,265 @@
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream endpoint whose circuit is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit for {name} is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker around one legacy API endpoint.
+
+    Each worker tracks the outcome of its own calls over the last
+    LEGACY_BREAKER_WINDOW seconds; errors, 5xx responses and calls slower than
+    LEGACY_BREAKER_SLOW_CALL_SECONDS count as failures. When the failure rate
+    crosses LEGACY_BREAKER_FAILURE_RATE the circuit opens for every worker,
+    through the shared cache, for LEGACY_BREAKER_OPEN_SECONDS. Then a single
+    probe call across the cluster decides whether it closes again.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self._failures = 0
+        self._state = {"state": CLOSED, "opened_at": None}
+        self._synced_at = 0
+
+    @property
+    def shared(self):
+        return caches[settings.LEGACY_CACHE_ALIAS]
+
+    @property
+    def state_key(self) -> str:
+        return f"legacy_middleware:breaker:{self.name}"
+
+    @property
+    def probe_key(self) -> str:
+        return f"legacy_middleware:breaker:{self.name}:probe"
+
+    def _local_state(self):
+        """Local copy of the state, and whether it is due for a sync."""
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._synced_at >= settings.LEGACY_BREAKER_SYNC_INTERVAL
+            return self._state, due
+
+    def _store_state(self, state):
+        with self._lock:
+            self._state = state
+            self._synced_at = time.monotonic()
+        return state
+
+    def _get_state(self, force=False):
+        """
+        Local copy of the shared state, refreshed every
+        LEGACY_BREAKER_SYNC_INTERVAL.
+        """
+        state, due = self._local_state()
+        if force or due:
+            state = self._store_state(
+                self.shared.get(self.state_key) or {"state": CLOSED, "opened_at": None}
+            )
+        return state
+
+    async def _aget_state(self):
+        """Async variant of _get_state()."""
+        state, due = self._local_state()
+        if due:
+            state = self._store_state(
+                await self.shared.aget(self.state_key)
+                or {"state": CLOSED, "opened_at": None}
+            )
+        return state
+
+    def _apply_state(self, new_state):
+        with self._lock:
+            self._state = new_state
+            self._synced_at = time.monotonic()
+            # Start counting afresh after every transition
+            self._calls.clear()
+            self._failures = 0
+
+    def _set_state(self, state, opened_at=None):
+        new_state = {"state": state, "opened_at": opened_at}
+        self.shared.set(self.state_key, new_state, timeout=None)
+        self._apply_state(new_state)
+
+    async def _aset_state(self, state, opened_at=None):
+        new_state = {"state": state, "opened_at": opened_at}
+        await self.shared.aset(self.state_key, new_state, timeout=None)
+        self._apply_state(new_state)
+
+    def _retry_after(self, state) -> float:
+        return state["opened_at"] + settings.LEGACY_BREAKER_OPEN_SECONDS - time.time()
+
+    def _check_open(self, state) -> bool:
+        """
+        True when the circuit is half-open and the call needs the probe lock.
+
+        Raises:
+            CircuitOpenError: The circuit is open.
+        """
+        if state["state"] == CLOSED:
+            return False
+        retry_after = self._retry_after(state)
+        if retry_after > 0:
+            raise CircuitOpenError(self.name, math.ceil(retry_after))
+        return True
+
+    def before_call(self) -> bool:
+        """
+        Check the circuit before an upstream call.
+
+        Returns:
+            bool: True if the call is the half-open recovery probe.
+
+        Raises:
+            CircuitOpenError: The call must not be made.
+        """
+        if not settings.LEGACY_BREAKER_ENABLED:
+            return False
+        if not self._check_open(self._get_state()):
+            return False
+
+        # Half-open: let a single call through, whatever the worker
+        if self.shared.add(
+            self.probe_key, 1, timeout=settings.LEGACY_BREAKER_PROBE_TIMEOUT
+        ):
+            return True
+        raise CircuitOpenError(self.name, 1)
+
+    async def abefore_call(self) -> bool:
+        """Async variant of before_call(), the event loop never waits on the cache."""
+        if not settings.LEGACY_BREAKER_ENABLED:
+            return False
+        if not self._check_open(await self._aget_state()):
+            return False
+
+        if await self.shared.aadd(
+            self.probe_key, 1, timeout=settings.LEGACY_BREAKER_PROBE_TIMEOUT
+        ):
+            return True
+        raise CircuitOpenError(self.name, 1)
+
+    def _add_call(self, failed) -> bool:
+        """Count a call in the window, True when it trips the circuit."""
+        now = time.monotonic()
+        cutoff = now - settings.LEGACY_BREAKER_WINDOW
+        with self._lock:
+            self._calls.append((now, failed))
+            self._failures += failed
+            while self._calls and self._calls[0][0] < cutoff:
+                _, old_failed = self._calls.popleft()
+                self._failures -= old_failed
+            total = len(self._calls)
+            return bool(
+                failed
+                and self._state["state"] == CLOSED
+                and total >= settings.LEGACY_BREAKER_MIN_CALLS
+                and self._failures / total >= settings.LEGACY_BREAKER_FAILURE_RATE
+            )
+
+    def record(self, failed, probe=False):
+        """Record the outcome of a call allowed by before_call()."""
+        if not settings.LEGACY_BREAKER_ENABLED:
+            return
+
+        if probe:
+            if failed:
+                self._set_state(OPEN, time.time())
+            else:
+                self._set_state(CLOSED)
+            self.shared.delete(self.probe_key)
+            return
+
+        if self._add_call(failed):
+            self._set_state(OPEN, time.time())
+
+    async def arecord(self, failed, probe=False):
+        """Async variant of record()."""
+        if not settings.LEGACY_BREAKER_ENABLED:
+            return
+
+        if probe:
+            if failed:
+                await self._aset_state(OPEN, time.time())
+            else:
+                await self._aset_state(CLOSED)
+            await self.shared.adelete(self.probe_key)
+            return
+
+        if self._add_call(failed):
+            await self._aset_state(OPEN, time.time())
+
+    def abandon(self, probe):
+        """Forget a call whose outcome is unknown, letting another probe through."""
+        if probe:
+            self.shared.delete(self.probe_key)
+
+    async def aabandon(self, probe):
+        """Async variant of abandon()."""
+        if probe:
+            await self.shared.adelete(self.probe_key)
+
+    def is_failure(self, status_code, elapsed) -> bool:
+        return status_code >= 500 or elapsed >= settings.LEGACY_BREAKER_SLOW_CALL_SECONDS
+
+    def snapshot(self) -> dict:
+        """Current state of the circuit, as seen by the whole cluster."""
+        state = self._get_state(force=True)
+        name = state["state"]
+        retry_after = 0
+        if name == OPEN:
+            retry_after = max(math.ceil(self._retry_after(state)), 0)
+            if not retry_after:
+                name = HALF_OPEN
+        with self._lock:
+            calls = len(self._calls)
+            failures = self._failures
+        return {
+            "name": self.name,
+            "state": name,
+            "retry_after": retry_after,
+            "calls": calls,
+            "failures": failures,
+            "failure_rate": failures / calls if calls else 0,
+        }
+
+    def reset(self):
+        self._set_state(CLOSED)
+        self.shared.delete(self.probe_key)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name) -> CircuitBreaker:
+    """Return the process-wide breaker of an upstream endpoint."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def reset_breakers():
+    """Close every circuit, e.g. after the upstream was fixed by hand."""
+    for breaker in list(_breakers.values()):
+        breaker.reset()
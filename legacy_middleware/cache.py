@@ -0,0 +1,618 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from .metrics import CACHE_EVENTS, CACHE_LOCAL_ENTRIES
+from .passthrough import RawJSON, load_raw
+
+# TieredCache.lookup() states of a cached entry
+FRESH = "fresh"
+# Within its TTL, but picked to be refreshed ahead of expiry
+EARLY = "early"
+# Expired less than the grace window ago, served while it is refreshed
+GRACE = "grace"
+# Expired less than the stale-if-error window ago, served if the upstream fails
+STALE = "stale"
+
+# States served right away, the others need the upstream
+SERVABLE_STATES = (FRESH, EARLY, GRACE)
+
+# Passthrough bodies up to this size are parsed to spot negative answers,
+# an error or an empty result is never bigger
+NEGATIVE_BODY_MAX_BYTES = 512
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_keyword(keyword) -> str:
+    """
+    Fold case, accents and whitespace so "  Cancún  Aeropuerto" and
+    "cancun aeropuerto" share a cache entry.
+    """
+    decomposed = unicodedata.normalize("NFKD", str(keyword))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def _normalize_pickup(value):
+    """Render pickup times as "YYYY-MM-DD HH:MM" whatever the input format."""
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return str(value).strip()
+    return parsed.strftime("%Y-%m-%d %H:%M")
+
+
+def _canonicalize(value, key=None):
+    if isinstance(value, dict):
+        return {k: _canonicalize(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_canonicalize(v) for v in value]
+    if key in ("lat", "lng") and value not in (None, ""):
+        try:
+            return round(float(value), settings.LEGACY_QUOTE_CACHE_COORD_PRECISION)
+        except (TypeError, ValueError):
+            return value
+    if key == "pickup" and value:
+        return _normalize_pickup(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def canonicalize_quote_payload(payload) -> dict:
+    """
+    Copy of a quote payload with pickup times normalized, coordinates rounded
+    and the default rate_group applied.
+    """
+    canonical = _canonicalize(dict(payload))
+    if "rate_group" not in canonical and settings.LEGACY_API_RATE_GROUP:
+        canonical["rate_group"] = settings.LEGACY_API_RATE_GROUP
+    return canonical
+
+
+def canonical_quote_key(payload) -> str:
+    """
+    Hash of a quote payload that is stable across equivalent searches.
+
+    Keys are sorted, pickup times normalized and coordinates rounded. The
+    default rate_group is applied first, so omitting it or sending the
+    default yields the same key.
+    """
+    canonical = canonicalize_quote_payload(payload)
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def negative_code(data):
+    """
+    Code of an application-level negative answer of the legacy API: the
+    code of an {"error": {"code": ...}} payload, "error" for other errors,
+    "empty" for an empty items list. None for any other payload.
+    """
+    if isinstance(data, RawJSON):
+        if "error" not in data and len(data.content) > NEGATIVE_BODY_MAX_BYTES:
+            return None
+        try:
+            data = load_raw(data)
+        except ValueError:
+            return None
+    if not isinstance(data, dict):
+        return None
+    error = data.get("error")
+    if error:
+        if isinstance(error, dict) and error.get("code"):
+            return str(error["code"])
+        return "error"
+    if data.get("items") == []:
+        return "empty"
+    return None
+
+
+def negative_cache_ttl(data):
+    """
+    Seconds a negative answer is cached for, from LEGACY_NEGATIVE_CACHE_TTLS:
+    0 when it must not be cached, None when `data` isn't a negative answer.
+    """
+    code = negative_code(data)
+    if code is None:
+        return None
+    ttls = settings.LEGACY_NEGATIVE_CACHE_TTLS
+    return ttls.get(code, ttls.get("*", 0))
+
+
+def shift_pickups(payload, days):
+    """Copy of a quote payload with its start/end pickup times moved by `days`."""
+    shifted = dict(payload)
+    for leg in ("start", "end"):
+        location = payload.get(leg)
+        if not isinstance(location, dict) or not location.get("pickup"):
+            continue
+        pickup = datetime.fromisoformat(str(location["pickup"]).strip())
+        shifted[leg] = {
+            **location,
+            "pickup": (pickup + timedelta(days=days)).strftime("%Y-%m-%d %H:%M"),
+        }
+    return shifted
+
+
+class TieredCache:
+    """
+    Two-tier cache: a size-capped in-process LRU in front of a shared Django
+    cache backend.
+
+    Entries are stored with their own expiry so both tiers agree on it.
+    clear() writes a flush marker to the shared cache; other workers pick it
+    up within LEGACY_CACHE_SYNC_INTERVAL seconds and drop their local tier.
+
+    Expired entries are kept for the longer of the grace and stale-if-error
+    windows. get() never returns them, lookup() does along with the state
+    telling how they may be served.
+    """
+
+    def __init__(
+        self,
+        name,
+        ttl_setting,
+        max_entries_setting,
+        grace_setting=None,
+        stale_if_error_setting=None,
+    ):
+        self.name = name
+        self.ttl_setting = ttl_setting
+        self.max_entries_setting = max_entries_setting
+        self.grace_setting = grace_setting
+        self.stale_if_error_setting = stale_if_error_setting
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._flushed_at = 0
+        self._negative_flushed_at = 0
+        self._flush_checked_at = 0
+        self._stats = {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "early_refreshes": 0,
+            "sets": 0,
+            "negative_sets": 0,
+            "evictions": 0,
+        }
+
+    # -------------------------------------------------------------------------
+    # Settings
+    # -------------------------------------------------------------------------
+    @property
+    def ttl(self):
+        return getattr(settings, self.ttl_setting)
+
+    @property
+    def max_entries(self):
+        return getattr(settings, self.max_entries_setting)
+
+    @property
+    def grace(self):
+        return getattr(settings, self.grace_setting, 0) if self.grace_setting else 0
+
+    @property
+    def stale_if_error(self):
+        if not self.stale_if_error_setting:
+            return 0
+        return getattr(settings, self.stale_if_error_setting, 0)
+
+    @property
+    def shared(self):
+        return caches[settings.LEGACY_CACHE_ALIAS]
+
+    # -------------------------------------------------------------------------
+    # Keys
+    # -------------------------------------------------------------------------
+    def make_key(self, key) -> str:
+        digest = hashlib.sha1(str(key).encode("utf-8")).hexdigest()
+        return f"legacy_middleware:{self.name}:{digest}"
+
+    @property
+    def flush_key(self) -> str:
+        return f"legacy_middleware:{self.name}:flushed_at"
+
+    @property
+    def negative_flush_key(self) -> str:
+        return f"legacy_middleware:{self.name}:negative_flushed_at"
+
+    @property
+    def marker_keys(self) -> list:
+        return [self.flush_key, self.negative_flush_key]
+
+    def refresh_key(self, key) -> str:
+        return f"{self.make_key(key)}:refresh"
+
+    # -------------------------------------------------------------------------
+    # Local tier
+    # -------------------------------------------------------------------------
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+        CACHE_EVENTS.labels(self.name, name).inc()
+
+    def _size_changed(self):
+        """Export the local tier size, called with the lock held."""
+        CACHE_LOCAL_ENTRIES.labels(self.name).set(len(self._local))
+
+    def _flush_check_due(self):
+        elapsed = time.monotonic() - self._flush_checked_at
+        return elapsed >= settings.LEGACY_CACHE_SYNC_INTERVAL
+
+    def _apply_flush_markers(self, found):
+        """
+        Drop the local tier when another worker flushed the cache, or only its
+        negative entries when those were flushed.
+
+        Returns:
+            tuple: (flushed_at, negative_flushed_at) markers read in `found`
+        """
+        flushed_at = found.get(self.flush_key, 0)
+        negative_flushed_at = found.get(self.negative_flush_key, 0)
+        with self._lock:
+            self._flush_checked_at = time.monotonic()
+            if flushed_at > self._flushed_at:
+                self._flushed_at = flushed_at
+                self._local.clear()
+            if negative_flushed_at > self._negative_flushed_at:
+                self._negative_flushed_at = negative_flushed_at
+                negative = [
+                    cache_key
+                    for cache_key, entry in self._local.items()
+                    if entry.get("negative")
+                ]
+                for cache_key in negative:
+                    del self._local[cache_key]
+            self._size_changed()
+        return flushed_at, negative_flushed_at
+
+    def _get_local(self, cache_key):
+        """Local entry of a key, expired or not, None once past its stale window."""
+        with self._lock:
+            entry = self._local.get(cache_key)
+            if entry is None:
+                return None
+            if _stale_until(entry) <= time.time():
+                del self._local[cache_key]
+                self._size_changed()
+                return None
+            self._local.move_to_end(cache_key)
+            return entry
+
+    def _set_local(self, cache_key, entry):
+        with self._lock:
+            self._local[cache_key] = entry
+            self._local.move_to_end(cache_key)
+            evicted = 0
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+                evicted += 1
+            self._stats["evictions"] += evicted
+            self._size_changed()
+        if evicted:
+            CACHE_EVENTS.labels(self.name, "evictions").inc(evicted)
+
+    def _is_flushed(self, entry, markers):
+        flushed_at, negative_flushed_at = markers
+        if entry.get("negative"):
+            flushed_at = max(flushed_at, negative_flushed_at)
+        return entry["stored_at"] <= flushed_at
+
+    def _is_fresh(self, entry, markers):
+        return (
+            entry is not None
+            and not self._is_flushed(entry, markers)
+            and entry["expires_at"] > time.time()
+        )
+
+    def _is_usable(self, entry, markers):
+        return (
+            entry is not None
+            and not self._is_flushed(entry, markers)
+            and _stale_until(entry) > time.time()
+        )
+
+    def _make_entry(self, value, ttl, cost, negative):
+        """Entry of a value and the shared tier timeout keeping it stale."""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        # Negative entries are never served past their TTL
+        stale_for = 0 if negative else max(self.grace, self.stale_if_error)
+        entry = {
+            "value": value,
+            "stored_at": now,
+            "expires_at": now + ttl,
+            "stale_until": now + ttl + stale_for,
+            "cost": cost,
+            "negative": negative,
+        }
+        return entry, ttl + stale_for
+
+    def _recompute_early(self, entry, now) -> bool:
+        """
+        Probabilistic early expiration (XFetch): the closer to expiry and the
+        slower the entry was to fetch, the likelier a request refreshes it
+        ahead of time, so a hot key never expires for every worker at once.
+        """
+        beta = settings.LEGACY_CACHE_EARLY_RECOMPUTE_BETA
+        cost = entry.get("cost")
+        if not cost or beta <= 0:
+            return False
+        # 1 - random() is in (0, 1], log() of it is never undefined
+        jitter = -cost * beta * math.log(1.0 - random.random())
+        return now + jitter >= entry["expires_at"]
+
+    def _state(self, entry):
+        now = time.time()
+        if entry["expires_at"] > now:
+            if self._recompute_early(entry, now):
+                self._count("early_refreshes")
+                return EARLY
+            return FRESH
+        self._count("stale_hits")
+        if now < entry["expires_at"] + self.grace:
+            return GRACE
+        return STALE
+
+    def _lookup_shared(self, cache_key, found, local_entry):
+        markers = self._apply_flush_markers(found)
+        shared_entry = found.get(cache_key)
+        usable = [
+            entry
+            for entry in (shared_entry, local_entry)
+            if self._is_usable(entry, markers)
+        ]
+        if not usable:
+            self._count("misses")
+            return None, None
+        entry = max(usable, key=lambda entry: entry["stored_at"])
+        if entry is shared_entry:
+            self._set_local(cache_key, entry)
+            self._count("shared_hits")
+        else:
+            self._count("local_hits")
+        return entry["value"], self._state(entry)
+
+    # -------------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------------
+    def get(self, key):
+        """Return the cached value or None."""
+        return self.get_first([key])[1]
+
+    def _local_first(self, keys, cache_keys):
+        for key, cache_key in zip(keys, cache_keys):
+            entry = self._get_local(cache_key)
+            now = time.time()
+            if entry is not None and entry["expires_at"] > now:
+                self._count("local_hits")
+                return key, entry["value"], entry["expires_at"] - now
+        return None
+
+    def _shared_first(self, keys, cache_keys, found):
+        markers = self._apply_flush_markers(found)
+        for key, cache_key in zip(keys, cache_keys):
+            entry = found.get(cache_key)
+            if self._is_fresh(entry, markers):
+                self._set_local(cache_key, entry)
+                self._count("shared_hits")
+                return key, entry["value"], entry["expires_at"] - time.time()
+        self._count("misses")
+        return None, None, None
+
+    def get_first(self, keys):
+        """
+        Return (key, value, seconds until it expires) of the first of `keys`
+        cached, (None, None, None) if none is. The local tier is tried first,
+        then all the keys are read from the shared tier at once.
+        """
+        cache_keys = [self.make_key(key) for key in keys]
+        if self._flush_check_due():
+            self._apply_flush_markers(self.shared.get_many(self.marker_keys))
+
+        hit = self._local_first(keys, cache_keys)
+        if hit is not None:
+            return hit
+
+        found = self.shared.get_many([*cache_keys, *self.marker_keys])
+        return self._shared_first(keys, cache_keys, found)
+
+    def lookup(self, key):
+        """
+        Return (value, state) of a key, expired entries included, or
+        (None, None) when nothing usable is cached. The state is one of
+        FRESH, EARLY, GRACE and STALE.
+        """
+        cache_key = self.make_key(key)
+        if self._flush_check_due():
+            self._apply_flush_markers(self.shared.get_many(self.marker_keys))
+
+        entry = self._get_local(cache_key)
+        if entry is not None and entry["expires_at"] > time.time():
+            self._count("local_hits")
+            return entry["value"], self._state(entry)
+
+        # Another worker may have refreshed it already
+        found = self.shared.get_many([cache_key, *self.marker_keys])
+        return self._lookup_shared(cache_key, found, entry)
+
+    def set(self, key, value, ttl=None, cost=None, negative=False):
+        """
+        Store a value in both tiers. `cost` is the number of seconds it took
+        to fetch, it makes slow entries likelier to be refreshed early.
+        Negative entries (cached upstream errors) can be flushed on their own
+        with clear_negative().
+        """
+        cache_key = self.make_key(key)
+        entry, timeout = self._make_entry(value, ttl, cost, negative)
+
+        self.shared.set(cache_key, entry, timeout=timeout)
+        self._set_local(cache_key, entry)
+        self._count("negative_sets" if negative else "sets")
+
+    def claim_refresh(self, key) -> bool:
+        """Take the refresh of a key for every worker, False if it is taken."""
+        return self.shared.add(
+            self.refresh_key(key), 1, timeout=settings.LEGACY_SINGLEFLIGHT_LOCK_TTL
+        )
+
+    def release_refresh(self, key):
+        self.shared.delete(self.refresh_key(key))
+
+    async def aget(self, key):
+        """Async variant of get()."""
+        return (await self.aget_first([key]))[1]
+
+    async def aget_first(self, keys):
+        """Async variant of get_first()."""
+        cache_keys = [self.make_key(key) for key in keys]
+        if self._flush_check_due():
+            self._apply_flush_markers(await self.shared.aget_many(self.marker_keys))
+
+        hit = self._local_first(keys, cache_keys)
+        if hit is not None:
+            return hit
+
+        found = await self.shared.aget_many([*cache_keys, *self.marker_keys])
+        return self._shared_first(keys, cache_keys, found)
+
+    async def alookup(self, key):
+        """Async variant of lookup()."""
+        cache_key = self.make_key(key)
+        if self._flush_check_due():
+            self._apply_flush_markers(await self.shared.aget_many(self.marker_keys))
+
+        entry = self._get_local(cache_key)
+        if entry is not None and entry["expires_at"] > time.time():
+            self._count("local_hits")
+            return entry["value"], self._state(entry)
+
+        found = await self.shared.aget_many([cache_key, *self.marker_keys])
+        return self._lookup_shared(cache_key, found, entry)
+
+    async def aset(self, key, value, ttl=None, cost=None, negative=False):
+        """Async variant of set()."""
+        cache_key = self.make_key(key)
+        entry, timeout = self._make_entry(value, ttl, cost, negative)
+
+        await self.shared.aset(cache_key, entry, timeout=timeout)
+        self._set_local(cache_key, entry)
+        self._count("negative_sets" if negative else "sets")
+
+    async def aclaim_refresh(self, key) -> bool:
+        """Async variant of claim_refresh()."""
+        return await self.shared.aadd(
+            self.refresh_key(key), 1, timeout=settings.LEGACY_SINGLEFLIGHT_LOCK_TTL
+        )
+
+    async def arelease_refresh(self, key):
+        await self.shared.adelete(self.refresh_key(key))
+
+    def clear(self):
+        """Invalidate every entry in both tiers, on all workers."""
+        flushed_at = time.time()
+        self.shared.set(self.flush_key, flushed_at, timeout=None)
+        self._apply_flush_markers({self.flush_key: flushed_at})
+
+    def clear_negative(self):
+        """Invalidate the negative entries in both tiers, on all workers."""
+        flushed_at = time.time()
+        self.shared.set(self.negative_flush_key, flushed_at, timeout=None)
+        self._apply_flush_markers({self.negative_flush_key: flushed_at})
+
+    def stats(self) -> dict:
+        """
+        Hit/miss/eviction counters for this worker, also exported on /metrics
+        as legacy_cache_events_total and legacy_cache_local_entries.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._local)
+        stats["hits"] = stats["local_hits"] + stats["shared_hits"]
+        return stats
+
+
+def _stale_until(entry):
+    # Entries stored before stale serving existed end at their TTL
+    return entry.get("stale_until", entry["expires_at"])
+
+
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+_refresh_tasks = set()
+
+
+def get_refresh_executor():
+    """Thread pool of this worker refreshing cache entries in the background."""
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _refresh_executor_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(
+                    max_workers=settings.LEGACY_CACHE_REFRESH_WORKERS,
+                    thread_name_prefix="legacy-cache-refresh",
+                )
+    return _refresh_executor
+
+
+def _refresh_in_thread(func):
+    try:
+        func()
+    except Exception:
+        logger.exception("Background cache refresh failed")
+    finally:
+        # Refresh threads outlive requests, don't leak their connections
+        close_old_connections()
+
+
+def start_refresh(func):
+    """Run func() on the refresh threads, the request doesn't wait for it."""
+    return get_refresh_executor().submit(_refresh_in_thread, func)
+
+
+def _refresh_task_done(task):
+    _refresh_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background cache refresh failed", exc_info=task.exception())
+
+
+def start_async_refresh(coroutine):
+    """Run a coroutine as a task of the running loop, the request doesn't await it."""
+    task = asyncio.ensure_future(coroutine)
+    # The loop only keeps weak references to its tasks
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_task_done)
+    return task
+
+
+autocomplete_cache = TieredCache(
+    "autocomplete",
+    ttl_setting="LEGACY_AUTOCOMPLETE_CACHE_TTL",
+    max_entries_setting="LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES",
+    grace_setting="LEGACY_AUTOCOMPLETE_CACHE_GRACE",
+    stale_if_error_setting="LEGACY_AUTOCOMPLETE_CACHE_STALE_IF_ERROR",
+)
+
+quote_cache = TieredCache(
+    "quote",
+    ttl_setting="LEGACY_QUOTE_CACHE_TTL",
+    max_entries_setting="LEGACY_QUOTE_CACHE_MAX_ENTRIES",
+    grace_setting="LEGACY_QUOTE_CACHE_GRACE",
+    stale_if_error_setting="LEGACY_QUOTE_CACHE_STALE_IF_ERROR",
+)
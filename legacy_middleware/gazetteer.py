@@ -0,0 +1,397 @@
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+import orjson
+from django.conf import settings
+
+from .cache import normalize_keyword
+
+MAGIC = b"LGZ1"
+VERSION = 3
+
+# Sections of the snapshot, in file order
+SECTIONS = (
+    "record_offsets",
+    "records",
+    "gram_offsets",
+    "grams",
+    "gram_starts",
+    "gram_postings",
+    "covered",
+)
+
+# Sections holding bytes, the others are uint32 arrays
+BYTE_SECTIONS = {"records", "grams", "covered"}
+
+# magic, version, little endian flag, record count, built at, then
+# (offset, length) of every section
+HEADER = struct.Struct(f"<4sIIId{2 * len(SECTIONS)}I")
+
+# Item fields searched, the others are only returned
+SEARCHED_FIELDS = ("name", "address")
+
+# Length of the substrings indexed, longer keywords are looked up by theirs
+GRAM = 3
+
+# Characters appended to a keyword whose upstream page came back full
+EXPANSION_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789 "
+
+logger = logging.getLogger(__name__)
+
+
+def _searched_text(item) -> str:
+    return " ".join(str(item.get(field) or "") for field in SEARCHED_FIELDS)
+
+
+def _searched_values(item) -> list:
+    """Searched fields of an item, with case, accents and whitespace folded."""
+    if not isinstance(item, dict):
+        return [normalize_keyword(item)]
+    return [
+        normalize_keyword(item[field])
+        for field in SEARCHED_FIELDS
+        if isinstance(item.get(field), str)
+    ]
+
+
+def item_matches(item, keyword) -> bool:
+    """
+    Whether the upstream would match the item for a normalized keyword: its
+    name or address contains it. Cached results and the snapshot are both
+    searched with it.
+    """
+    return any(keyword in value for value in _searched_values(item))
+
+
+def _grams(value) -> set:
+    """Substrings of GRAM characters of a value, and the shorter ones at its end."""
+    return {value[start : start + GRAM] for start in range(len(value))}
+
+
+def _term_table(postings_by_term):
+    """Sorted keys blob with offsets, and posting list starts into one array."""
+    key_offsets, posting_starts = array("I", [0]), array("I", [0])
+    keys, postings = bytearray(), array("I")
+    for term in sorted(postings_by_term, key=lambda term: term.encode("utf-8")):
+        keys += term.encode("utf-8")
+        key_offsets.append(len(keys))
+        postings.extend(sorted(postings_by_term[term]))
+        posting_starts.append(len(postings))
+    return key_offsets, keys, posting_starts, postings
+
+
+def build_snapshot(items, path, covered):
+    """
+    Write the index of autocomplete items to `path`.
+
+    `covered` are the normalized keywords the upstream returned every place
+    for, only keywords starting with one of them are answered from it.
+
+    The file is replaced atomically, workers mapping the previous snapshot
+    keep reading it until they notice the new one.
+
+    Returns:
+        int: Number of items indexed.
+    """
+    grams = defaultdict(set)
+    record_offsets, records = array("I", [0]), bytearray()
+    for record_id, item in enumerate(items):
+        records += orjson.dumps(item)
+        record_offsets.append(len(records))
+        for value in _searched_values(item):
+            for gram in _grams(value):
+                grams[gram].add(record_id)
+
+    covered = "\n".join(sorted(set(covered))).encode("utf-8")
+    sections = [record_offsets, bytes(records), *_term_table(grams), covered]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".gazetteer-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            spans, chunks = [], []
+            offset = HEADER.size
+            for section in sections:
+                data = section.tobytes() if isinstance(section, array) else section
+                # uint32 arrays are cast from the map, keep them aligned
+                padding = -offset % 4
+                chunks += [b"\0" * padding, data]
+                spans += [offset + padding, len(data)]
+                offset += padding + len(data)
+            count = len(record_offsets) - 1
+            little_endian = sys.byteorder == "little"
+            fh.write(
+                HEADER.pack(MAGIC, VERSION, little_endian, count, time.time(), *spans)
+            )
+            fh.writelines(chunks)
+        # mkstemp creates it private, the workers may run as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return count
+
+
+class _Keys:
+    """Sorted byte strings of a term table, as a sequence for bisect."""
+
+    __slots__ = ("offsets", "blob")
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.blob[self.offsets[index] : self.offsets[index + 1]].tobytes()
+
+
+class _TermTable:
+    __slots__ = ("keys", "starts", "postings")
+
+    def __init__(self, offsets, blob, starts, postings):
+        self.keys = _Keys(offsets, blob)
+        self.starts = starts
+        self.postings = postings
+
+    def postings_of(self, index):
+        return self.postings[self.starts[index] : self.starts[index + 1]]
+
+    def find(self, term):
+        key = term.encode("utf-8")
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.postings_of(index)
+        return ()
+
+    def with_prefix(self, prefix) -> set:
+        """Records with a term starting with `prefix`."""
+        key = prefix.encode("utf-8")
+        start = bisect_left(self.keys, key)
+        # 0xff never appears in UTF-8, every key with the prefix sorts before
+        end = bisect_left(self.keys, key + b"\xff", start)
+        found = set()
+        for index in range(start, end):
+            found.update(self.postings_of(index))
+        return found
+
+
+class GazetteerIndex:
+    """
+    Read-only view of a snapshot file, mapped so every worker shares the same
+    pages.
+
+    A keyword matches the items whose name or address contains it, as in
+    item_matches(). Its substrings of GRAM characters narrow the records
+    down, which are then checked. Only keywords the snapshot covers are
+    searched: the others may match places that were never harvested, and go
+    upstream.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as fh:
+            self.map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stat = os.stat(path)
+        view = memoryview(self.map)
+        header = HEADER.unpack_from(view)
+        magic, version, little_endian, self.count, self.built_at = header[:5]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a gazetteer snapshot")
+        if bool(little_endian) != (sys.byteorder == "little"):
+            raise ValueError(f"{path} was built on a machine of another byte order")
+
+        spans = header[5:]
+        sections = {}
+        for position, name in enumerate(SECTIONS):
+            start, length = spans[2 * position], spans[2 * position + 1]
+            section = view[start : start + length]
+            sections[name] = section if name in BYTE_SECTIONS else section.cast("I")
+
+        self.record_offsets = sections["record_offsets"]
+        self.records = sections["records"]
+        self.grams = _TermTable(
+            sections["gram_offsets"],
+            sections["grams"],
+            sections["gram_starts"],
+            sections["gram_postings"],
+        )
+        covered = sections["covered"].tobytes().decode("utf-8")
+        self.covered = frozenset(covered.split("\n")) if covered else frozenset()
+
+    def record(self, record_id) -> bytes:
+        start, end = self.record_offsets[record_id], self.record_offsets[record_id + 1]
+        return self.records[start:end].tobytes()
+
+    def candidates(self, keyword) -> list:
+        """Records holding every substring of GRAM characters of the keyword."""
+        if len(keyword) <= GRAM:
+            # Every substring this short starts one of the indexed grams
+            return sorted(self.grams.with_prefix(keyword))
+        matches = None
+        for start in range(len(keyword) - GRAM + 1):
+            found = self.grams.find(keyword[start : start + GRAM])
+            matches = set(found) if matches is None else matches.intersection(found)
+            if not matches:
+                return []
+        return sorted(matches)
+
+    def covers(self, keyword) -> bool:
+        """
+        Whether every place of the keyword was harvested: the upstream
+        returned a full result for the keyword or one of its prefixes.
+        """
+        keyword = normalize_keyword(keyword)
+        return any(
+            keyword[:end] in self.covered for end in range(len(keyword), 0, -1)
+        )
+
+    def search(self, keyword, limit=None):
+        """
+        Record ids matching a keyword, at most `limit`. Keywords the snapshot
+        doesn't cover match nothing.
+        """
+        limit = settings.LEGACY_GAZETTEER_MAX_RESULTS if limit is None else limit
+        keyword = normalize_keyword(keyword)
+        if not keyword or not self.covers(keyword):
+            return []
+        matches = []
+        for record_id in self.candidates(keyword):
+            if len(matches) >= limit:
+                break
+            if item_matches(orjson.loads(self.record(record_id)), keyword):
+                matches.append(record_id)
+        return matches
+
+    def response_body(self, record_ids) -> bytes:
+        """{"items": [...]} body of the records, without decoding them."""
+        return b'{"items":[%s]}' % b",".join(map(self.record, record_ids))
+
+
+_index = {"index": None, "checked_at": 0.0}
+_index_lock = threading.Lock()
+
+
+def _load_index(path, current):
+    """The index of `path`, reusing `current` while the file is unchanged."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if current is not None and (stat.st_ino, stat.st_mtime_ns) == (
+        current.stat.st_ino,
+        current.stat.st_mtime_ns,
+    ):
+        return current
+    try:
+        return GazetteerIndex(path)
+    except (OSError, ValueError, struct.error):
+        logger.exception("Could not load the gazetteer snapshot %s", path)
+        return current
+
+
+def get_gazetteer():
+    """
+    The snapshot index of this worker, None when there is none.
+
+    The file is checked for a new snapshot at most every
+    LEGACY_CACHE_SYNC_INTERVAL seconds.
+    """
+    path = settings.LEGACY_GAZETTEER_PATH
+    if not path:
+        return None
+    now = time.monotonic()
+    if now - _index["checked_at"] < settings.LEGACY_CACHE_SYNC_INTERVAL:
+        return _index["index"]
+    with _index_lock:
+        if now - _index["checked_at"] >= settings.LEGACY_CACHE_SYNC_INTERVAL:
+            _index["index"] = _load_index(path, _index["index"])
+            _index["checked_at"] = now
+        return _index["index"]
+
+
+def reset_gazetteer():
+    """Forget the index of this worker, the next lookup maps the file again."""
+    with _index_lock:
+        _index.update(index=None, checked_at=0.0)
+
+
+def item_key(item):
+    """Identity of an autocomplete item across keywords."""
+    if isinstance(item, dict) and item.get("id") is not None:
+        return ("id", str(item["id"]))
+    return ("text", _searched_text(item) if isinstance(item, dict) else str(item))
+
+
+def harvest_places(fetch, keywords, max_keywords=None, rate=None):
+    """
+    Unique items returned by the upstream autocomplete for `keywords`, in the
+    order they first appeared.
+
+    fetch(keyword) returns the parsed upstream body. Keywords failing
+    upstream are logged and skipped.
+
+    A page of LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT items may have been
+    truncated by the upstream, so its keyword is expanded into the longer
+    keywords of EXPANSION_CHARS, up to `max_keywords` upstream calls spaced
+    by 1 / `rate` seconds. Only the keywords with a shorter page are covered.
+
+    Returns:
+        tuple: (items, covered keywords, number of failed keywords)
+    """
+    if max_keywords is None:
+        max_keywords = settings.LEGACY_GAZETTEER_MAX_KEYWORDS
+    rate = settings.LEGACY_GAZETTEER_RATE if rate is None else rate
+    interval = 1 / rate if rate > 0 else 0
+    next_call_at = time.monotonic()
+    page_size = settings.LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT
+    places, covered, failed = {}, [], 0
+    pending = deque(dict.fromkeys(normalize_keyword(k) for k in keywords if k))
+    fetched = 0
+    while pending and fetched < max_keywords:
+        keyword = pending.popleft()
+        fetched += 1
+        delay = next_call_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        next_call_at = time.monotonic() + interval
+        try:
+            data = fetch(keyword)
+        except Exception:
+            logger.exception("Gazetteer sync failed for %r", keyword)
+            failed += 1
+            continue
+        items = (data or {}).get("items") or []
+        for item in items:
+            if isinstance(item, dict):
+                places.setdefault(item_key(item), item)
+        if page_size <= 0:
+            # Truncated pages can't be told apart, nothing is covered
+            continue
+        if len(items) < page_size:
+            covered.append(keyword)
+        else:
+            chars = EXPANSION_CHARS
+            if keyword.endswith(" "):
+                # Normalized keywords never hold two spaces in a row
+                chars = chars.rstrip()
+            pending.extend(keyword + char for char in chars)
+    if pending:
+        logger.warning(
+            "Gazetteer sync stopped after %s keywords, %s left uncovered",
+            fetched,
+            len(pending),
+        )
+    return list(places.values()), covered, failed
@@ -0,0 +1,125 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+# Set on responses replayed from an IdempotencyRecord
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Longest accepted Idempotency-Key, IdempotencyRecord.key max_length
+MAX_KEY_LENGTH = 255
+
+# Response headers stored with the record and sent back on replay
+REPLAYED_HEADERS = ("Location", "Preference-Applied")
+
+
+def request_fingerprint(data) -> str:
+    """Hash of the request body, to refuse a key reused for another request."""
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def claim_key(endpoint, key, fingerprint):
+    """
+    Create the "processing" record of an idempotency key, or return the
+    existing one.
+
+    Expired records are replaced, and records left "processing" for more
+    than LEGACY_IDEMPOTENCY_LOCK_TTL seconds (worker killed mid-request) are
+    taken over.
+
+    Returns:
+        tuple: (IdempotencyRecord, True if this request owns it)
+    """
+    now = timezone.now()
+    IdempotencyRecord.objects.filter(
+        endpoint=endpoint, key=key, expires_at__lte=now
+    ).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(
+                endpoint=endpoint,
+                key=key,
+                request_hash=fingerprint,
+                locked_at=now,
+                expires_at=now + timedelta(seconds=settings.LEGACY_IDEMPOTENCY_TTL),
+            )
+        return record, True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyRecord.objects.filter(endpoint=endpoint, key=key).first()
+    if record is None:
+        # Deleted in between (expired or released), try again
+        return claim_key(endpoint, key, fingerprint)
+
+    stale_before = now - timedelta(seconds=settings.LEGACY_IDEMPOTENCY_LOCK_TTL)
+    if (
+        record.status == IdempotencyRecord.PROCESSING
+        and record.request_hash == fingerprint
+        and record.locked_at <= stale_before
+    ):
+        # Only one of the waiting requests wins the takeover
+        taken = IdempotencyRecord.objects.filter(
+            pk=record.pk,
+            status=IdempotencyRecord.PROCESSING,
+            locked_at=record.locked_at,
+        ).update(locked_at=now)
+        if taken:
+            record.locked_at = now
+            return record, True
+    return record, False
+
+
+def complete_key(record, status_code, body, headers=None):
+    """Store the response to replay for the key."""
+    record.status = IdempotencyRecord.COMPLETED
+    record.response_status = status_code
+    record.response_body = body
+    record.response_headers = headers or {}
+    record.save(
+        update_fields=["status", "response_status", "response_body", "response_headers"]
+    )
+
+
+def remember_reservation(record, reservation_id):
+    """Store the id of the reservation the upstream created for the key."""
+    record.reservation_id = str(reservation_id)
+    record.save(update_fields=["reservation_id"])
+
+
+def reclaim_key(record):
+    """
+    Take a completed record back to "processing", for this request to redo
+    its failed last stage. False if another request took it first.
+    """
+    now = timezone.now()
+    taken = IdempotencyRecord.objects.filter(
+        pk=record.pk,
+        status=IdempotencyRecord.COMPLETED,
+        locked_at=record.locked_at,
+    ).update(status=IdempotencyRecord.PROCESSING, locked_at=now)
+    if taken:
+        record.status = IdempotencyRecord.PROCESSING
+        record.locked_at = now
+    return bool(taken)
+
+
+def release_key(record):
+    """Forget the key, letting a retry reach the upstream again."""
+    IdempotencyRecord.objects.filter(pk=record.pk).delete()
+
+
+def purge_expired_keys() -> int:
+    """Delete expired records, returns how many."""
+    deleted, _ = IdempotencyRecord.objects.filter(
+        expires_at__lte=timezone.now()
+    ).delete()
+    return deleted
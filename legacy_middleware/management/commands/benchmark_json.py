@@ -0,0 +1,83 @@
+import datetime
+import io
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from blog.models import Post
+from blog.serializers import PostListItemSerializer
+from legacy_middleware.management.commands.benchmark_proxy import sample_quote
+from utils.parsers import ORJSONParser
+from utils.renderers import ORJSONRenderer
+
+
+def sample_post_list(posts):
+    """Serialized post list, datetimes and all, without touching the database."""
+    now = timezone.now()
+    return PostListItemSerializer(
+        [
+            Post(
+                id=index,
+                title=f"Things to do in Cancún #{index}",
+                slug=f"things-to-do-in-cancun-{index}",
+                lang="es" if index % 2 else "en",
+                banner_image_url=f"https://cdn.example.com/posts/{index}.jpg",
+                description="Playas, cenotes y zona arqueológica. " * 4,
+                author="Nyx Transfers",
+                created_at=now - datetime.timedelta(days=index),
+                updated_at=now,
+            )
+            for index in range(posts)
+        ],
+        many=True,
+    ).data
+
+
+class Command(BaseCommand):
+    help = "Compare render and parse throughput of the stdlib and orjson engines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quote", help="JSON file with a real quote response.")
+        parser.add_argument("--items", type=int, default=300)
+        parser.add_argument("--posts", type=int, default=50)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options["quote"]:
+            with open(options["quote"], "rb") as payload:
+                quote = json.loads(payload.read())
+        else:
+            quote = sample_quote(options["items"])
+
+        engines = (
+            ("stdlib", JSONRenderer(), JSONParser()),
+            ("orjson", ORJSONRenderer(), ORJSONParser()),
+        )
+        payloads = (("quote", quote), ("post list", sample_post_list(options["posts"])))
+        for label, data in payloads:
+            body = JSONRenderer().render(data)
+            self.stdout.write(f"{label}: {len(body) / 1024:.1f} KiB")
+            for name, renderer, parser in engines:
+                render_ops = self.measure(
+                    lambda: renderer.render(data), options["iterations"]
+                )
+                parse_ops = self.measure(
+                    lambda: parser.parse(io.BytesIO(body)), options["iterations"]
+                )
+                self.stdout.write(
+                    f"  {name:<7} render {render_ops:9.0f} ops/s "
+                    f"({render_ops * len(body) / 2**20:7.1f} MiB/s)   "
+                    f"parse {parse_ops:9.0f} ops/s "
+                    f"({parse_ops * len(body) / 2**20:7.1f} MiB/s)"
+                )
+
+    def measure(self, func, iterations):
+        func()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return iterations / (time.perf_counter() - started)
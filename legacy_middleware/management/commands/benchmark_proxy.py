@@ -0,0 +1,79 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from legacy_middleware.passthrough import peek_top_level
+from legacy_middleware.views import QuoteProxyView
+
+
+def sample_quote(items):
+    """Quote response shaped like the legacy API's."""
+    return {
+        "items": [
+            {
+                "id": index,
+                "name": f"Private SUV {index}",
+                "description": "Private transportation, meet and greet included. " * 4,
+                "price": {"amount": 95.5 + index, "currency": "USD"},
+                "capacity": 8,
+                "features": ["wifi", "water", "child seat"],
+                "image": f"https://cdn.example.com/vehicles/{index}.jpg",
+            }
+            for index in range(items)
+        ],
+        "places": {
+            "from": {"name": "Cancun International Airport", "lat": 21.0365},
+            "to": {"name": "Hotel Zone", "lat": 21.1358},
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Measure CPU time and peak memory per quote for the proxy response modes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payload", help="JSON file with a real quote response.")
+        parser.add_argument("--items", type=int, default=300)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options["payload"]:
+            with open(options["payload"], "rb") as payload:
+                body = payload.read()
+        else:
+            body = json.dumps(sample_quote(options["items"])).encode()
+
+        validate = QuoteProxyView().validate_quote_structure
+        renderer = JSONRenderer()
+
+        def parse():
+            data = json.loads(body)
+            validate(data)
+            return renderer.render(data)
+
+        def passthrough():
+            validate(peek_top_level(body))
+            return body
+
+        self.stdout.write(f"Quote body: {len(body) / 1024:.1f} KiB")
+        for name, func in (("parse", parse), ("passthrough", passthrough)):
+            cpu_ms, peak_kib = self.measure(func, options["iterations"])
+            self.stdout.write(
+                f"{name:<12} cpu {cpu_ms:8.3f} ms/quote   peak {peak_kib:10.1f} KiB"
+            )
+
+    def measure(self, func, iterations):
+        func()
+        started = time.process_time()
+        for _ in range(iterations):
+            func()
+        cpu_ms = (time.process_time() - started) / iterations * 1000
+
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return cpu_ms, peak / 1024
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from legacy_middleware.prewarm import prewarm_quotes, purge_stale_route_demand
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch the quotes of the most quoted routes into the quote cache ahead "
+        "of demand, and forget routes nobody quoted lately."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--routes",
+            type=int,
+            default=settings.LEGACY_QUOTE_PREWARM_ROUTES,
+            help="Number of routes, defaults to LEGACY_QUOTE_PREWARM_ROUTES.",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.LEGACY_QUOTE_PREWARM_DAYS,
+            help="Days ahead, defaults to LEGACY_QUOTE_PREWARM_DAYS.",
+        )
+        parser.add_argument(
+            "--max-requests",
+            type=int,
+            default=settings.LEGACY_QUOTE_PREWARM_MAX_REQUESTS,
+            help="Upstream calls, defaults to LEGACY_QUOTE_PREWARM_MAX_REQUESTS.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_stale_route_demand()
+        result = prewarm_quotes(
+            limit=options["routes"],
+            days=options["days"],
+            max_requests=options["max_requests"],
+        )
+        self.stdout.write(
+            f"Warmed {result['warmed']} quotes for {result['routes']} routes, "
+            f"{result['failed']} failed, {result['skipped']} skipped, "
+            f"forgot {deleted} stale routes"
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from legacy_middleware.payment_jobs import (
+    purge_expired_payment_link_jobs,
+    run_stale_payment_link_jobs,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run payment link jobs lost by a restarted worker and delete jobs older "
+        "than LEGACY_PAYMENT_LINK_JOB_TTL."
+    )
+
+    def handle(self, *args, **options):
+        ran = run_stale_payment_link_jobs()
+        deleted = purge_expired_payment_link_jobs()
+        self.stdout.write(
+            f"Ran {ran} stale payment link jobs, deleted {deleted} expired jobs"
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from legacy_middleware.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete Idempotency-Key records older than LEGACY_IDEMPOTENCY_TTL."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(f"Deleted {deleted} expired idempotency records")
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from legacy_middleware.gazetteer import build_snapshot, harvest_places
+from legacy_middleware.services import fetch_legacy_autocomplete
+
+
+def fetch_places(keyword):
+    response = fetch_legacy_autocomplete(keyword)
+    response.raise_for_status()
+    return response.json()
+
+
+class Command(BaseCommand):
+    help = (
+        "Collect the autocomplete places from the legacy API and write the "
+        "gazetteer snapshot the workers answer autocomplete from."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keyword",
+            action="append",
+            dest="keywords",
+            help="Keyword to collect places for (repeatable), "
+            "defaults to LEGACY_GAZETTEER_SEEDS.",
+        )
+        parser.add_argument(
+            "--path",
+            default=settings.LEGACY_GAZETTEER_PATH,
+            help="Snapshot file, defaults to LEGACY_GAZETTEER_PATH.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.LEGACY_GAZETTEER_RATE,
+            help="Upstream calls per second, defaults to LEGACY_GAZETTEER_RATE.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["path"]:
+            raise CommandError("LEGACY_GAZETTEER_PATH is not set")
+        keywords = options["keywords"] or settings.LEGACY_GAZETTEER_SEEDS
+        items, covered, failed = harvest_places(
+            fetch_places, keywords, rate=options["rate"]
+        )
+        if failed:
+            # A partial snapshot would turn upstream hits into wrong answers
+            raise CommandError(
+                f"{failed} keywords failed upstream, snapshot not written"
+            )
+        count = build_snapshot(items, options["path"], covered)
+        self.stdout.write(
+            f"Indexed {count} places for {len(covered)} keywords "
+            f"into {options['path']}"
+        )
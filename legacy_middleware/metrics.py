@@ -0,0 +1,153 @@
+import functools
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGE_LATENCY = Histogram(
+    "legacy_proxy_stage_duration_seconds",
+    "Time spent in each stage of a legacy proxy request.",
+    ["route", "stage"],
+)
+
+UPSTREAM_RESPONSES = Counter(
+    "legacy_upstream_responses_total",
+    "Legacy API responses by fetch function and status code.",
+    ["function", "status"],
+)
+
+# Counters of TieredCache.stats(), SingleFlight.stats() and get_pool_stats().
+# Gauges are summed over the live workers when PROMETHEUS_MULTIPROC_DIR is set.
+CACHE_EVENTS = Counter(
+    "legacy_cache_events_total",
+    "Tiered cache hits, misses, writes and evictions by cache.",
+    ["cache", "event"],
+)
+
+CACHE_LOCAL_ENTRIES = Gauge(
+    "legacy_cache_local_entries",
+    "Entries held in the local tier of each cache.",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+
+SINGLEFLIGHT_CALLS = Counter(
+    "legacy_singleflight_calls_total",
+    "Coalesced upstream calls by flight and outcome.",
+    ["flight", "outcome"],
+)
+
+SINGLEFLIGHT_IN_FLIGHT = Gauge(
+    "legacy_singleflight_in_flight",
+    "Upstream calls currently led by each flight.",
+    ["flight"],
+    multiprocess_mode="livesum",
+)
+
+POOL_EVENTS = Counter(
+    "legacy_http_pool_events_total",
+    "Connection checkouts, pool misses and new connections of the legacy client.",
+    ["event"],
+)
+
+# Stages of BaseLegacyProxyView.execute_proxy_request
+TOKEN_STAGE = "token"
+TOKEN_REFRESH_STAGE = "token_refresh"
+UPSTREAM_STAGE = "upstream"
+JSON_PARSE_STAGE = "json_parse"
+VALIDATION_STAGE = "validation"
+SERIALIZATION_STAGE = "serialization"
+
+# Autocomplete lookup in the local gazetteer snapshot
+GAZETTEER_STAGE = "gazetteer"
+
+# Wait for a newer autocomplete keyword from the same client
+DEBOUNCE_STAGE = "debounce"
+
+# Wait before retrying an idempotent upstream call
+BACKOFF_STAGE = "backoff"
+
+
+class RequestTimings:
+    """
+    Stage spans of one proxy request. Each span feeds STAGE_LATENCY and is
+    kept for the Server-Timing header and the timing log line.
+    """
+
+    __slots__ = ("route", "spans")
+
+    def __init__(self, route):
+        self.route = route
+        self.spans = []
+
+    @contextmanager
+    def span(self, stage, description=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            STAGE_LATENCY.labels(self.route, stage).observe(duration)
+            self.spans.append((stage, duration, description))
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        parts = []
+        for stage, duration, description in self.spans:
+            part = f"{stage};dur={duration * 1000:.1f}"
+            if description:
+                part += f';desc="{description}"'
+            parts.append(part)
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            "route": self.route,
+            "spans": [
+                {"name": stage, "ms": round(duration * 1000, 1), "desc": description}
+                for stage, duration, description in self.spans
+            ],
+        }
+
+
+def _status_label(response=None, exc=None) -> str:
+    if exc is not None:
+        # raise_for_status() errors still carry the upstream status
+        response = getattr(exc, "response", None)
+        if response is None:
+            return type(exc).__name__
+    # fetch_legacy_token returns the parsed token, not the response
+    status_code = getattr(response, "status_code", None)
+    return str(status_code) if status_code is not None else "ok"
+
+
+def instrument_upstream(func):
+    """Count the responses of a fetch_* function by status code."""
+    counter = functools.partial(UPSTREAM_RESPONSES.labels, func.__name__)
+
+    if iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                response = await func(*args, **kwargs)
+            except Exception as exc:
+                counter(_status_label(exc=exc)).inc()
+                raise
+            counter(_status_label(response)).inc()
+            return response
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            response = func(*args, **kwargs)
+        except Exception as exc:
+            counter(_status_label(exc=exc)).inc()
+            raise
+        counter(_status_label(response)).inc()
+        return response
+
+    return wrapper
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legacy_middleware', '0002_alter_legacyapitoken_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legacyapitoken',
+            name='refreshed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legacy_middleware', '0005_paymentlinkjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuoteRouteDemand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route_key', models.CharField(max_length=64, unique=True)),
+                ('template', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('last_requested_at', models.DateTimeField(db_index=True)),
+                ('last_warmed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('legacy_middleware', '0006_quoteroutedemand'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='reservation_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='response_headers',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
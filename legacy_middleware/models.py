@@ -1,3 +1,6 @@
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 from solo.models import SingletonModel
@@ -7,6 +10,7 @@ from solo.models import SingletonModel
 class LegacyAPIToken(SingletonModel):
     token = models.TextField()
     expires_at = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     @classmethod
@@ -18,3 +22,106 @@ class LegacyAPIToken(SingletonModel):
         if instance.expires_at <= timezone.now():
             return None
         return instance
+
+    def get_renewal_time(self, fraction):
+        """Moment at which `fraction` of the token lifetime has elapsed."""
+        issued_at = self.refreshed_at or self.created_at
+        return issued_at + (self.expires_at - issued_at) * fraction
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Outcome of a request sent with an Idempotency-Key header.
+
+    The row is created in the "processing" state by the first request, so
+    concurrent duplicates wait for it, and holds the response to replay once
+    "completed". Rows are dropped after LEGACY_IDEMPOTENCY_TTL.
+    """
+
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    STATUS_CHOICES = [(PROCESSING, "Processing"), (COMPLETED, "Completed")]
+
+    endpoint = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PROCESSING)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    # Headers replayed with the response (Location of a 202...)
+    response_headers = models.JSONField(default=dict, blank=True)
+    # Set once the upstream created the reservation, a retry of a failed
+    # payment link stage resumes from it instead of creating another one
+    reservation_id = models.CharField(max_length=64, blank=True, default="")
+    locked_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["endpoint", "key"], name="unique_idempotency_key"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint}:{self.key}"
+
+
+class PaymentLinkJob(models.Model):
+    """
+    Payment link of a reservation generated in the background.
+
+    Created instead of fetching the link inline when the client sends
+    "Prefer: respond-async"; the id is the handle the client polls.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    reservation_id = models.CharField(max_length=64, db_index=True)
+    # Keyword arguments of fetch_payment_link, minus the token
+    params = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    payment_link = models.TextField(blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_done(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def __str__(self):
+        return f"{self.reservation_id}:{self.id}"
+
+
+class QuoteRouteDemand(models.Model):
+    """
+    How often a route was quoted, the top ones are pre-warmed into the quote
+    cache.
+
+    A route is a canonical quote payload with its start pickup moved to
+    prewarm.TEMPLATE_DATE: the same trip at the same time of day, whatever
+    the day.
+    """
+
+    route_key = models.CharField(max_length=64, unique=True)
+    template = models.JSONField(encoder=DjangoJSONEncoder)
+    requests = models.PositiveIntegerField(default=0)
+    last_requested_at = models.DateTimeField(db_index=True)
+    last_warmed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.route_key
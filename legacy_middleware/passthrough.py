@@ -0,0 +1,98 @@
+import json
+
+import orjson
+from django.http import HttpResponse
+
+from utils.parsers import loads
+
+DEFAULT_CONTENT_TYPE = "application/json"
+
+
+class RawJSON:
+    """
+    Upstream JSON body kept as bytes, so it can be cached and sent as is.
+
+    ``top_level`` is the shallow view returned by peek_top_level(), or None
+    when the body was never inspected. ``compressed`` maps content codings to
+    the compressed body, filled by CompressionMiddleware and kept only in
+    this worker.
+    """
+
+    __slots__ = ("content", "content_type", "top_level", "compressed")
+
+    def __init__(self, content, content_type=DEFAULT_CONTENT_TYPE, top_level=None):
+        self.content = content
+        self.content_type = content_type
+        self.top_level = top_level
+        self.compressed = {}
+
+    def __contains__(self, key):
+        return isinstance(self.top_level, dict) and key in self.top_level
+
+    def __getstate__(self):
+        return self.content, self.content_type, self.top_level
+
+    def __setstate__(self, state):
+        self.content, self.content_type, self.top_level = state
+        self.compressed = {}
+
+
+def _placeholder(value):
+    if isinstance(value, dict):
+        return {}
+    if isinstance(value, list):
+        return []
+    return value
+
+
+def _loads(content):
+    try:
+        return loads(content)
+    except orjson.JSONDecodeError:
+        # Same leniency as the stdlib (e.g. integers over 64 bits)
+        return json.loads(content)
+
+
+def peek_top_level(content):
+    """
+    Shallow view of a JSON document: top-level keys with their scalar values,
+    nested objects and arrays replaced by empty ones. Validators written for
+    the parsed payload run unchanged on it, as long as they only look at
+    top-level keys and value types.
+
+    This is not a partial parse: the whole body is decoded by orjson, then
+    everything below the top level is dropped. Validated passthrough routes
+    (quote, my_booking) therefore still pay for a full decode, and only save
+    building the DRF response and encoding it again. Scanning the bytes in
+    Python to skip nested values was measured several times slower than that
+    decode.
+
+    Raises:
+        ValueError: The body is not valid JSON.
+    """
+    data = _loads(content)
+    if isinstance(data, dict):
+        return {key: _placeholder(value) for key, value in data.items()}
+    return _placeholder(data)
+
+
+def load_raw(data):
+    """Parsed payload of a RawJSON, for embedding it in a larger response."""
+    if isinstance(data, RawJSON):
+        return _loads(data.content)
+    return data
+
+
+class PassthroughResponse(HttpResponse):
+    """
+    Response sending the upstream bytes untouched. ``data`` holds the RawJSON,
+    like DRF's Response.data holds the payload, and ``compressed_content``
+    its compressed bodies.
+    """
+
+    def __init__(self, raw, status=200, headers=None):
+        super().__init__(
+            raw.content, status=status, content_type=raw.content_type, headers=headers
+        )
+        self.data = raw
+        self.compressed_content = raw.compressed
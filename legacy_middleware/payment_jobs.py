@@ -0,0 +1,153 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .metrics import TOKEN_STAGE, RequestTimings
+from .models import PaymentLinkJob
+from .pipeline import BudgetExceeded, ReservationPipeline
+from .services import fetch_payment_link
+from .tokens import get_cached_token, refresh_token
+
+# Route label of the job stage latencies
+JOB_ROUTE = "payment_link_job"
+
+# PaymentLinkJob.error values, worded like the inline responses
+FAILED_ERROR = "Failed to generate payment link"
+BUDGET_EXCEEDED_ERROR = "Payment link not generated within the time budget"
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    """Thread pool of this worker running the payment link jobs."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.LEGACY_PAYMENT_LINK_WORKERS,
+                    thread_name_prefix="legacy-payment-link",
+                )
+    return _executor
+
+
+def start_payment_link_job(reservation_id, payment_kwargs):
+    """
+    Create the job of a reservation and run it in the background once the
+    row is committed.
+    """
+    job = PaymentLinkJob.objects.create(
+        reservation_id=str(reservation_id), params=payment_kwargs
+    )
+    transaction.on_commit(lambda: get_job_executor().submit(_run_in_thread, job.pk))
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        run_payment_link_job(job_id)
+    finally:
+        # Job threads outlive requests, don't leak their connections
+        close_old_connections()
+
+
+def claim_job(job_id) -> bool:
+    """
+    Mark a job running. Pending jobs and jobs left running for more than
+    LEGACY_PAYMENT_LINK_JOB_LOCK_TTL seconds (worker killed) can be claimed,
+    by a single caller.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.LEGACY_PAYMENT_LINK_JOB_LOCK_TTL)
+    claimable = Q(status=PaymentLinkJob.PENDING) | Q(
+        status=PaymentLinkJob.RUNNING, started_at__lte=stale_before
+    )
+    return bool(
+        PaymentLinkJob.objects.filter(claimable, pk=job_id).update(
+            status=PaymentLinkJob.RUNNING, started_at=now
+        )
+    )
+
+
+def finish_job(job_id, payment_link="", error=""):
+    PaymentLinkJob.objects.filter(pk=job_id).update(
+        status=PaymentLinkJob.FAILED if error else PaymentLinkJob.SUCCEEDED,
+        payment_link=payment_link or "",
+        error=error,
+        completed_at=timezone.now(),
+    )
+
+
+def run_payment_link_job(job_id):
+    """Fetch the payment link of a job, with the retries and budget of the view."""
+    if not claim_job(job_id):
+        return
+    job = PaymentLinkJob.objects.get(pk=job_id)
+    timings = RequestTimings(JOB_ROUTE)
+    try:
+        with timings.span(TOKEN_STAGE):
+            token_obj = get_cached_token() or refresh_token()
+        response = ReservationPipeline().fetch_payment_link(
+            fetch_payment_link, timings, token_obj.token, **job.params
+        )
+        response.raise_for_status()
+        link = response.json().get("url")
+    except BudgetExceeded:
+        logger.warning("Payment link job %s timed out", job_id)
+        finish_job(job_id, error=BUDGET_EXCEEDED_ERROR)
+    except Exception:
+        logger.exception("Payment link job %s failed", job_id)
+        finish_job(job_id, error=FAILED_ERROR)
+    else:
+        finish_job(job_id, payment_link=link)
+
+
+def run_stale_payment_link_jobs(min_age=5) -> int:
+    """
+    Run the jobs no worker picked up `min_age` seconds after their creation
+    (worker restarted), or abandoned while running. Returns how many.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.LEGACY_PAYMENT_LINK_JOB_LOCK_TTL)
+    unclaimed = Q(
+        status=PaymentLinkJob.PENDING,
+        created_at__lte=now - timedelta(seconds=min_age),
+    )
+    abandoned = Q(status=PaymentLinkJob.RUNNING, started_at__lte=stale_before)
+    job_ids = list(
+        PaymentLinkJob.objects.filter(unclaimed | abandoned).values_list(
+            "pk", flat=True
+        )
+    )
+    for job_id in job_ids:
+        run_payment_link_job(job_id)
+    return len(job_ids)
+
+
+def purge_expired_payment_link_jobs() -> int:
+    """Delete jobs older than LEGACY_PAYMENT_LINK_JOB_TTL, returns how many."""
+    expired_before = timezone.now() - timedelta(
+        seconds=settings.LEGACY_PAYMENT_LINK_JOB_TTL
+    )
+    deleted, _ = PaymentLinkJob.objects.filter(created_at__lte=expired_before).delete()
+    return deleted
+
+
+def job_status(job) -> dict:
+    """Body of the job status endpoint."""
+    return {
+        "id": str(job.pk),
+        "reservation_id": job.reservation_id,
+        "status": job.status,
+        "payment_link": job.payment_link or None,
+        "error": job.error or None,
+    }
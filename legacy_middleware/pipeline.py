@@ -0,0 +1,192 @@
+import asyncio
+import functools
+import logging
+import time
+
+import httpx
+import requests
+from django.conf import settings
+
+from .metrics import BACKOFF_STAGE, UPSTREAM_STAGE
+from .services import DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Errors of either client worth retrying an idempotent call for
+RETRYABLE_ERRORS = (requests.RequestException, httpx.HTTPError)
+
+# Not worth starting an upstream call with less time than this left
+MIN_STAGE_TIMEOUT = 0.5
+
+
+class BudgetExceeded(requests.Timeout):
+    """Raised instead of starting a stage once the pipeline budget is spent."""
+
+
+def is_retryable_status(status_code) -> bool:
+    """Upstream statuses worth retrying an idempotent call for."""
+    return status_code == 429 or status_code >= 500
+
+
+def payment_link_span(attempt):
+    """Server-Timing description of a payment link attempt."""
+    if attempt == 1:
+        return "fetch_payment_link"
+    return f"fetch_payment_link retry {attempt - 1}"
+
+
+class ReservationPipeline:
+    """
+    Auth context and deadline of one reservation create → payment link flow.
+
+    The token is acquired once and shared by every stage, and each upstream
+    call gets the time left of LEGACY_RESERVATION_BUDGET as its timeout.
+
+    requests applies that timeout to the connect and to each socket read,
+    not to the whole call: a sync upstream trickling its response can run
+    past the deadline. The deadline is checked again after every call, so no
+    retry or later stage starts once it passed. Async calls are cancelled at
+    the deadline instead, which makes the budget a hard end-to-end limit.
+    """
+
+    __slots__ = ("deadline", "token_obj")
+
+    def __init__(self, budget=None):
+        if budget is None:
+            budget = settings.LEGACY_RESERVATION_BUDGET
+        self.deadline = time.monotonic() + budget
+        self.token_obj = None
+
+    def remaining(self) -> float:
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def timeout(self) -> float:
+        """
+        Timeout of the next upstream call.
+
+        Raises:
+            BudgetExceeded: Too little of the budget is left to make the call.
+        """
+        remaining = self.remaining()
+        if remaining < MIN_STAGE_TIMEOUT:
+            raise BudgetExceeded("Reservation time budget exceeded")
+        return min(remaining, DEFAULT_TIMEOUT)
+
+    def bind(self, fetch_func):
+        """fetch_func(token, payload) called with the pipeline timeout."""
+
+        @functools.wraps(fetch_func)
+        def bound(token, payload):
+            return fetch_func(token, payload, timeout=self.timeout())
+
+        return bound
+
+    def abind(self, fetch_func):
+        """Async version of bind(), the call is cancelled at the deadline."""
+
+        @functools.wraps(fetch_func)
+        async def bound(token, payload):
+            timeout = self.timeout()
+            return await self.within_budget(fetch_func(token, payload, timeout=timeout))
+
+        return bound
+
+    async def within_budget(self, awaitable):
+        """
+        Await an upstream call, cancelling it once the budget is spent: httpx
+        timeouts, like the requests ones, apply to each read, not the call.
+
+        Raises:
+            BudgetExceeded: The call was still running at the deadline.
+        """
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError as error:
+            raise BudgetExceeded("Reservation time budget exceeded") from error
+
+    def retry_delays(self):
+        """
+        Exponential backoff delays before each retry of an idempotent stage,
+        stopping early when a retry would no longer fit in the budget.
+        """
+        delay = settings.LEGACY_PAYMENT_LINK_BACKOFF
+        for _ in range(settings.LEGACY_PAYMENT_LINK_RETRIES):
+            if self.remaining() < delay + MIN_STAGE_TIMEOUT:
+                return
+            yield delay
+            delay *= 2
+
+    def next_retry_delay(self, delays, attempt, response, error):
+        """
+        Delay before the next attempt of a failed call, or None when out of
+        retries. Raises the last error if there is nothing to return.
+        """
+        delay = next(delays, None)
+        if delay is None:
+            # A call may have read past the deadline, don't blame the upstream
+            if self.remaining() < MIN_STAGE_TIMEOUT:
+                raise BudgetExceeded("Reservation time budget exceeded") from error
+            if error is None:
+                return None
+            raise error
+
+        logger.warning(
+            "Payment link attempt %s failed (%s), retrying in %ss",
+            attempt,
+            repr(error) if error else response.status_code,
+            delay,
+        )
+        return delay
+
+    def fetch_payment_link(self, fetch_func, timings, token, **kwargs):
+        """
+        Call fetch_func (fetch_payment_link) with the pipeline token, retrying
+        failures with backoff while the budget allows. The lookup is a GET,
+        unlike the create it is safe to repeat.
+        """
+        delays = self.retry_delays()
+        attempt = 1
+        while True:
+            response = error = None
+            try:
+                with timings.span(UPSTREAM_STAGE, payment_link_span(attempt)):
+                    response = fetch_func(token=token, timeout=self.timeout(), **kwargs)
+                if not is_retryable_status(response.status_code):
+                    return response
+            except BudgetExceeded:
+                raise
+            except RETRYABLE_ERRORS as exc:
+                error = exc
+
+            delay = self.next_retry_delay(delays, attempt, response, error)
+            if delay is None:
+                return response
+            with timings.span(BACKOFF_STAGE):
+                time.sleep(delay)
+            attempt += 1
+
+    async def afetch_payment_link(self, fetch_func, timings, token, **kwargs):
+        """Async version of fetch_payment_link(), fetch_func is a coroutine function."""
+        delays = self.retry_delays()
+        attempt = 1
+        while True:
+            response = error = None
+            try:
+                with timings.span(UPSTREAM_STAGE, payment_link_span(attempt)):
+                    timeout = self.timeout()
+                    response = await self.within_budget(
+                        fetch_func(token=token, timeout=timeout, **kwargs)
+                    )
+                if not is_retryable_status(response.status_code):
+                    return response
+            except BudgetExceeded:
+                raise
+            except RETRYABLE_ERRORS as exc:
+                error = exc
+
+            delay = self.next_retry_delay(delays, attempt, response, error)
+            if delay is None:
+                return response
+            with timings.span(BACKOFF_STAGE):
+                await asyncio.sleep(delay)
+            attempt += 1
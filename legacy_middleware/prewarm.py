@@ -0,0 +1,306 @@
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .breaker import CircuitOpenError
+from .cache import (
+    canonical_quote_key,
+    canonicalize_quote_payload,
+    quote_cache,
+    shift_pickups,
+)
+from .models import QuoteRouteDemand
+from .services import fetch_quote
+from .tokens import get_cached_token, refresh_token
+
+# Route templates have their start pickup on this day, the end pickup keeps
+# its distance to it
+TEMPLATE_DATE = date(2000, 1, 1)
+
+# Taken for LEGACY_QUOTE_PREWARM_INTERVAL by the worker warming the quotes
+PREWARM_LOCK_KEY = "legacy_middleware:quote_prewarm:lock"
+
+logger = logging.getLogger(__name__)
+
+
+def route_template(payload):
+    """
+    Canonical quote payload with its start pickup moved to TEMPLATE_DATE,
+    None when it has no start pickup to move.
+    """
+    if not isinstance(payload, dict):
+        return None
+    canonical = canonicalize_quote_payload(payload)
+    start = canonical.get("start")
+    if not isinstance(start, dict) or not start.get("pickup"):
+        return None
+    try:
+        pickup = datetime.fromisoformat(start["pickup"])
+        return shift_pickups(canonical, (TEMPLATE_DATE - pickup.date()).days)
+    except (TypeError, ValueError):
+        return None
+
+
+class RouteDemandRecorder:
+    """
+    Count the routes quoted by this worker.
+
+    The counts are written to QuoteRouteDemand at most every
+    LEGACY_QUOTE_DEMAND_FLUSH_INTERVAL seconds, so only one quote request
+    in a while pays for the writes.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def add(self, payload) -> bool:
+        """Count a quoted payload, True when the counts are due to be written."""
+        template = route_template(payload)
+        if template is None:
+            return False
+        route_key = canonical_quote_key(template)
+        with self._lock:
+            count, _ = self._counts.get(route_key, (0, None))
+            self._counts[route_key] = (count + 1, template)
+            elapsed = time.monotonic() - self._flushed_at
+        return elapsed >= settings.LEGACY_QUOTE_DEMAND_FLUSH_INTERVAL
+
+    def flush(self):
+        """
+        Write the counts to the database.
+
+        Returns:
+            int: Number of routes written.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._flushed_at = time.monotonic()
+
+        now = timezone.now()
+        for route_key, (count, template) in counts.items():
+            if _add_requests(route_key, count, now):
+                continue
+            try:
+                with transaction.atomic():
+                    QuoteRouteDemand.objects.create(
+                        route_key=route_key,
+                        template=template,
+                        requests=count,
+                        last_requested_at=now,
+                    )
+            except IntegrityError:
+                # Created by another worker meanwhile
+                _add_requests(route_key, count, now)
+        return len(counts)
+
+    def record(self, payload):
+        """Count a quoted payload, writing the counts when due."""
+        if settings.LEGACY_QUOTE_PREWARM_ROUTES <= 0:
+            return
+        try:
+            if self.add(payload):
+                self.flush()
+        except Exception:
+            # Demand tracking never fails a quote
+            logger.exception("Could not record the quoted route")
+
+    async def arecord(self, payload):
+        """Async variant of record(), the writes run in a thread."""
+        if settings.LEGACY_QUOTE_PREWARM_ROUTES <= 0:
+            return
+        try:
+            if self.add(payload):
+                await sync_to_async(self.flush)()
+        except Exception:
+            logger.exception("Could not record the quoted route")
+
+
+def _add_requests(route_key, count, now) -> bool:
+    return bool(
+        QuoteRouteDemand.objects.filter(route_key=route_key).update(
+            requests=F("requests") + count, last_requested_at=now
+        )
+    )
+
+
+route_demand = RouteDemandRecorder()
+
+
+def popular_routes(limit=None):
+    """Most quoted routes of the last LEGACY_QUOTE_DEMAND_WINDOW_DAYS days."""
+    limit = settings.LEGACY_QUOTE_PREWARM_ROUTES if limit is None else limit
+    since = timezone.now() - timedelta(days=settings.LEGACY_QUOTE_DEMAND_WINDOW_DAYS)
+    return list(
+        QuoteRouteDemand.objects.filter(last_requested_at__gte=since).order_by(
+            "-requests", "-last_requested_at"
+        )[:limit]
+    )
+
+
+def purge_stale_route_demand():
+    """Delete the routes nobody quoted within LEGACY_QUOTE_DEMAND_WINDOW_DAYS."""
+    since = timezone.now() - timedelta(days=settings.LEGACY_QUOTE_DEMAND_WINDOW_DAYS)
+    deleted, _ = QuoteRouteDemand.objects.filter(last_requested_at__lt=since).delete()
+    return deleted
+
+
+def prewarm_payloads(routes, days):
+    """
+    Quote payloads of the routes for today and the next `days - 1` days,
+    nearest day first. Pickups already past are left out.
+    """
+    today = timezone.localdate()
+    now = timezone.localtime().strftime("%Y-%m-%d %H:%M")
+    for day in range(days):
+        shift = (today + timedelta(days=day) - TEMPLATE_DATE).days
+        for route in routes:
+            payload = shift_pickups(route.template, shift)
+            if payload["start"]["pickup"] > now:
+                yield payload
+
+
+def is_prewarmable(data) -> bool:
+    """Same rule as QuoteProxyView: complete quotes only, no application errors."""
+    return (
+        isinstance(data, dict)
+        and "error" not in data
+        and isinstance(data.get("items"), list)
+        and isinstance(data.get("places"), dict)
+    )
+
+
+def prewarm_quotes(limit=None, days=None, max_requests=None):
+    """
+    Fetch the quotes of the most popular routes into the quote cache, for
+    LEGACY_QUOTE_PREWARM_DAYS days ahead.
+
+    Upstream calls are spaced by 1 / LEGACY_QUOTE_PREWARM_RATE seconds and
+    capped at `max_requests` per run. An open circuit ends the run.
+
+    Returns:
+        dict: Number of routes, warmed quotes, failed and skipped calls.
+    """
+    days = settings.LEGACY_QUOTE_PREWARM_DAYS if days is None else days
+    if max_requests is None:
+        max_requests = settings.LEGACY_QUOTE_PREWARM_MAX_REQUESTS
+    result = {"routes": 0, "warmed": 0, "failed": 0, "skipped": 0}
+    if not settings.LEGACY_QUOTE_CACHE_TTL:
+        return result
+    routes = popular_routes(limit)
+    result["routes"] = len(routes)
+    if not routes:
+        return result
+
+    token_obj = get_cached_token() or refresh_token()
+    token = token_obj.token
+    rate = settings.LEGACY_QUOTE_PREWARM_RATE
+    interval = 1 / rate if rate > 0 else 0
+    next_call_at = time.monotonic()
+    payloads = list(prewarm_payloads(routes, days))
+
+    for position, payload in enumerate(payloads):
+        if position >= max_requests:
+            result["skipped"] = len(payloads) - position
+            break
+        delay = next_call_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        next_call_at = time.monotonic() + interval
+
+        started = time.monotonic()
+        try:
+            response = fetch_quote(token, payload)
+            if response.status_code == 401:
+                token = refresh_token(stale_token=token).token
+                response = fetch_quote(token, payload)
+            data = response.json() if response.status_code == 200 else None
+        except CircuitOpenError:
+            logger.warning("Quote pre-warming stopped, the quote circuit is open")
+            result["skipped"] = len(payloads) - position
+            break
+        except (requests.RequestException, ValueError):
+            logger.warning("Quote pre-warming call failed", exc_info=True)
+            result["failed"] += 1
+            continue
+
+        if not is_prewarmable(data):
+            result["failed"] += 1
+            continue
+        # Same lifetime as a quote fetched by a visitor, the next run (every
+        # LEGACY_QUOTE_PREWARM_INTERVAL seconds or cron) fetches it again
+        quote_cache.set(
+            canonical_quote_key(payload), data, cost=time.monotonic() - started
+        )
+        result["warmed"] += 1
+
+    QuoteRouteDemand.objects.filter(pk__in=[route.pk for route in routes]).update(
+        last_warmed_at=timezone.now()
+    )
+    return result
+
+
+_prewarmer = {"thread": None, "stop": None}
+
+
+def _prewarmer_loop(stop):
+    while not stop.is_set():
+        interval = settings.LEGACY_QUOTE_PREWARM_INTERVAL
+        try:
+            # A single worker of the cluster warms the quotes each interval
+            shared = caches[settings.LEGACY_CACHE_ALIAS]
+            if shared.add(PREWARM_LOCK_KEY, 1, timeout=interval):
+                result = prewarm_quotes()
+                logger.info("Quote pre-warming %s", result)
+        except Exception:
+            logger.exception("Quote pre-warming failed")
+        finally:
+            close_old_connections()
+        stop.wait(interval)
+
+
+def start_quote_prewarmer():
+    """
+    Start the pre-warming thread of this worker (idempotent), unless
+    LEGACY_QUOTE_PREWARM_INTERVAL is 0.
+
+    The lock electing the worker that warms the quotes lives in
+    LEGACY_CACHE_ALIAS. A per-process cache would let every worker warm
+    them, multiplying the upstream calls, so the thread isn't started then.
+    """
+    if settings.LEGACY_QUOTE_PREWARM_INTERVAL <= 0:
+        return None
+    if isinstance(caches[settings.LEGACY_CACHE_ALIAS], (LocMemCache, DummyCache)):
+        logger.warning(
+            "Quote pre-warmer not started: LEGACY_CACHE_ALIAS isn't shared by "
+            "the workers, use `manage.py prewarm_quotes` on a cron instead"
+        )
+        return None
+    thread = _prewarmer["thread"]
+    if thread is not None and thread.is_alive():
+        return thread
+
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=_prewarmer_loop, args=(stop,), name="legacy-quote-prewarmer", daemon=True
+    )
+    _prewarmer.update(thread=thread, stop=stop)
+    thread.start()
+    return thread
+
+
+def stop_quote_prewarmer():
+    if _prewarmer["stop"] is not None:
+        _prewarmer["stop"].set()
@@ -1,6 +1,197 @@
+import asyncio
+import threading
+import time
+import weakref
+from http.cookiejar import DefaultCookiePolicy
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from django.conf import settings
 
+from .breaker import get_breaker
+from .metrics import POOL_EVENTS, instrument_upstream
+
+# Upstream endpoints, each guarded by its own circuit breaker
+LEGACY_ENDPOINTS = (
+    "api/v1/autocomplete-affiliates",
+    "api/v1/oauth",
+    "api/v1/quote",
+    "api/v1/create",
+    "api/v1/reservation/payment/handler",
+    "api/v1/reservation/get",
+)
+
+# Seconds a legacy API call may wait, unless the caller passes a timeout
+DEFAULT_TIMEOUT = 10
+
+# Process-wide counters for the pooled legacy API client
+_pool_stats = {"checkouts": 0, "pool_misses": 0, "new_connections": 0}
+_pool_stats_lock = threading.Lock()
+
+_session = None
+_session_lock = threading.Lock()
+
+# One async client per event loop, httpx clients can't be shared across loops
+_async_clients = weakref.WeakKeyDictionary()
+
+# Coroutine function given the client of the first event loop, and its task
+_async_warmup = {"func": None, "task": None}
+
+_DEFAULT_HEADERS = {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+
+
+def _record_pool_event(name: str):
+    with _pool_stats_lock:
+        _pool_stats[name] += 1
+    POOL_EVENTS.labels(name).inc()
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        _record_pool_event("new_connections")
+        super().connect()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        _record_pool_event("new_connections")
+        super().connect()
+
+
+class _CountingPoolMixin:
+    """Count connection checkouts and the ones the pool could not serve."""
+
+    def _get_conn(self, timeout=None):
+        _record_pool_event("checkouts")
+        return super()._get_conn(timeout=timeout)
+
+    def _new_conn(self):
+        _record_pool_event("pool_misses")
+        return super()._new_conn()
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class LegacyHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter whose connection pools report hits, misses and new connections.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+def get_legacy_session() -> requests.Session:
+    """
+    Return the process-wide keep-alive session shared by all legacy API calls.
+
+    The session is created lazily so each gunicorn worker builds its own pool
+    after forking.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                adapter = LegacyHTTPAdapter(
+                    pool_connections=settings.LEGACY_API_POOL_CONNECTIONS,
+                    pool_maxsize=settings.LEGACY_API_POOL_SIZE,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(_DEFAULT_HEADERS)
+                # The session is shared by every visitor, never keep cookies
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _session = session
+    return _session
+
+
+def reset_legacy_session():
+    """Close the shared session so the next call builds a fresh pool."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_legacy_async_client() -> httpx.AsyncClient:
+    """
+    Return the pooled async client bound to the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LEGACY_API_ASYNC_POOL_SIZE,
+                max_keepalive_connections=settings.LEGACY_API_POOL_SIZE,
+            ),
+            headers=_DEFAULT_HEADERS,
+            follow_redirects=True,
+        )
+        client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        _async_clients[loop] = client
+        func, _async_warmup["func"] = _async_warmup["func"], None
+        if func is not None:
+            _async_warmup["task"] = loop.create_task(func(client))
+    return client
+
+
+def warm_up_first_async_client(func):
+    """
+    Run ``await func(client)`` in the background once the first event loop
+    of this worker creates its async client. ASGI workers start their loop
+    after the gunicorn hooks, so its connections can't be opened earlier.
+    """
+    _async_warmup["func"] = func
+
+
+def get_pool_stats() -> dict:
+    """
+    Snapshot of the legacy client connection pool counters.
+
+    Returns:
+        dict: checkouts, pool_hits (reused keep-alive connections),
+        pool_misses (no idle connection available) and new_connections
+        (TCP/TLS handshakes actually performed). The counters are also
+        exported on /metrics as legacy_http_pool_events_total.
+    """
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    stats["pool_hits"] = stats["checkouts"] - stats["pool_misses"]
+    return stats
+
+
+def _build_legacy_request(endpoint: str, token: str = None, headers: dict = None):
+    """Build the absolute URL and headers for a legacy API call."""
+    url = f"{settings.LEGACY_API_BASE_URL.rstrip('/')}/{endpoint.lstrip('/')}"
+
+    final_headers = {
+        "Content-Type": "application/json",
+    }
+
+    if token:
+        final_headers["Authorization"] = f"Bearer {token}"
+
+    if headers:
+        final_headers.update(headers)
+
+    return url, final_headers
+
 
 def _legacy_request(
     endpoint: str,
@@ -9,40 +200,122 @@ def _legacy_request(
     params: dict = None,
     token: str = None,
     headers: dict = None,
-    timeout: int = 10,
+    timeout: float = DEFAULT_TIMEOUT,
 ) -> requests.Response:
     """
     Internal helper to send a request to the legacy API.
+
+    Raises:
+        CircuitOpenError: The endpoint's circuit breaker is open.
     """
-    url = f"{settings.LEGACY_API_BASE_URL.rstrip('/')}/{endpoint.lstrip('/')}"
+    url, final_headers = _build_legacy_request(endpoint, token, headers)
+
+    session = get_legacy_session()
+    breaker = get_breaker(endpoint)
+    probe = breaker.before_call()
+    started = time.monotonic()
+
+    try:
+        if method.upper() == "POST":
+            response = session.post(
+                url, json=payload, headers=final_headers, timeout=timeout, params=params
+            )
+        elif method.upper() == "GET":
+            response = session.get(
+                url, headers=final_headers, timeout=timeout, params=params
+            )
+        else:
+            response = session.request(
+                method,
+                url,
+                json=payload,
+                headers=final_headers,
+                timeout=timeout,
+                params=params,
+            )
+    except Exception:
+        breaker.record(True, probe)
+        raise
+
+    breaker.record(
+        breaker.is_failure(response.status_code, time.monotonic() - started), probe
+    )
+    return response
 
-    final_headers = {
-        "Content-Type": "application/json",
-    }
 
-    if token:
-        final_headers["Authorization"] = f"Bearer {token}"
+async def _alegacy_request(
+    endpoint: str,
+    method: str = "POST",
+    payload: dict = None,
+    params: dict = None,
+    token: str = None,
+    headers: dict = None,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> httpx.Response:
+    """
+    Async counterpart of _legacy_request using the pooled httpx client.
+    """
+    url, final_headers = _build_legacy_request(endpoint, token, headers)
+    client = get_legacy_async_client()
+    breaker = get_breaker(endpoint)
+    probe = await breaker.abefore_call()
+    started = time.monotonic()
+
+    try:
+        if method.upper() == "GET":
+            response = await client.get(
+                url, headers=final_headers, timeout=timeout, params=params
+            )
+        else:
+            response = await client.request(
+                method.upper(),
+                url,
+                json=payload,
+                headers=final_headers,
+                timeout=timeout,
+                params=params,
+            )
+    except asyncio.CancelledError:
+        # The client went away, that says nothing about the upstream
+        await breaker.aabandon(probe)
+        raise
+    except Exception:
+        await breaker.arecord(True, probe)
+        raise
+
+    await breaker.arecord(
+        breaker.is_failure(response.status_code, time.monotonic() - started), probe
+    )
+    return response
 
-    if headers:
-        final_headers.update(headers)
 
-    if method.upper() == "POST":
-        return requests.post(
-            url, json=payload, headers=final_headers, timeout=timeout, params=params
-        )
-    elif method.upper() == "GET":
-        return requests.get(url, headers=final_headers, timeout=timeout, params=params)
-    else:
-        return requests.request(
-            method,
-            url,
-            json=payload,
-            headers=final_headers,
-            timeout=timeout,
-            params=params,
-        )
+def _inject_rate_group(payload: dict) -> dict:
+    """Inject default rate_group if missing."""
+    if "rate_group" not in payload and settings.LEGACY_API_RATE_GROUP:
+        payload["rate_group"] = settings.LEGACY_API_RATE_GROUP
+    return payload
+
+
+def _inject_site_id(payload: dict) -> dict:
+    """Inject default site_id if missing."""
+    if "site_id" not in payload and settings.LEGACY_API_SITE_ID:
+        payload["site_id"] = int(settings.LEGACY_API_SITE_ID)
+    return payload
 
 
+def _payment_link_params(
+    reservation_id, payment_provider, language, success_url, cancel_url
+) -> dict:
+    return {
+        "type": payment_provider,
+        "id": reservation_id,
+        "language": language,
+        "success_url": success_url,
+        "cancel_url": cancel_url,
+    }
+
+
+@instrument_upstream
 def fetch_legacy_autocomplete(keyword: str) -> requests.Response:
     """
     Fetch autocomplete results from the legacy API.
@@ -64,7 +337,8 @@ def fetch_legacy_autocomplete(keyword: str) -> requests.Response:
     )
 
 
-def fetch_legacy_token():
+@instrument_upstream
+def fetch_legacy_token(timeout: float = DEFAULT_TIMEOUT):
     """
     Fetch a new OAuth token from the legacy API.
 
@@ -76,7 +350,9 @@ def fetch_legacy_token():
         "secret": settings.LEGACY_API_SECRET,
     }
 
-    response = _legacy_request("api/v1/oauth", method="POST", payload=payload)
+    response = _legacy_request(
+        "api/v1/oauth", method="POST", payload=payload, timeout=timeout
+    )
     response.raise_for_status()
     data = response.json()
 
@@ -92,6 +368,7 @@ def fetch_legacy_token():
     return token, expires_at
 
 
+@instrument_upstream
 def fetch_quote(token, payload):
     """
     Fetch a quote from the legacy API using the provided token.
@@ -103,33 +380,40 @@ def fetch_quote(token, payload):
     Returns:
         requests.Response: The response from the legacy API.
     """
-    # Inject default rate_group if missing
-    if "rate_group" not in payload and settings.LEGACY_API_RATE_GROUP:
-        payload["rate_group"] = settings.LEGACY_API_RATE_GROUP
+    payload = _inject_rate_group(payload)
 
     return _legacy_request("api/v1/quote", method="POST", payload=payload, token=token)
 
 
-def fetch_reservation_create(token, payload):
+@instrument_upstream
+def fetch_reservation_create(token, payload, timeout=DEFAULT_TIMEOUT):
     """
     Create a new reservation in the legacy API.
 
     Args:
         token (str): The OAuth token.
         payload (dict): The reservation creation payload.
+        timeout (float): Seconds to wait for the legacy API.
 
     Returns:
         requests.Response: The response from the legacy API.
     """
-    # Inject default site_id if missing
-    if "site_id" not in payload and settings.LEGACY_API_SITE_ID:
-        payload["site_id"] = int(settings.LEGACY_API_SITE_ID)
+    payload = _inject_site_id(payload)
 
-    return _legacy_request("api/v1/create", method="POST", payload=payload, token=token)
+    return _legacy_request(
+        "api/v1/create", method="POST", payload=payload, token=token, timeout=timeout
+    )
 
 
+@instrument_upstream
 def fetch_payment_link(
-    token, reservation_id, payment_provider, language, success_url, cancel_url
+    token,
+    reservation_id,
+    payment_provider,
+    language,
+    success_url,
+    cancel_url,
+    timeout=DEFAULT_TIMEOUT,
 ):
     """
     Fetch the payment link for a reservation.
@@ -142,25 +426,24 @@ def fetch_payment_link(
         language (str): Language code (e.g. 'en').
         success_url (str): Redirect URL on success.
         cancel_url (str): Redirect URL on cancel.
+        timeout (float): Seconds to wait for the legacy API.
 
     Returns:
         requests.Response: The response containing the payment link.
     """
-    params = {
-        "type": payment_provider,
-        "id": reservation_id,
-        "language": language,
-        "success_url": success_url,
-        "cancel_url": cancel_url,
-    }
+    params = _payment_link_params(
+        reservation_id, payment_provider, language, success_url, cancel_url
+    )
     return _legacy_request(
         "api/v1/reservation/payment/handler",
         method="GET",
         params=params,
         token=token,
+        timeout=timeout,
     )
 
 
+@instrument_upstream
 def fetch_my_booking(token, payload):
     """
     Fetch reservation details from the legacy API.
@@ -173,10 +456,85 @@ def fetch_my_booking(token, payload):
     Returns:
         requests.Response: The response from the legacy API.
     """
-    # Inject default site_id if missing
-    if "site_id" not in payload and settings.LEGACY_API_SITE_ID:
-        payload["site_id"] = int(settings.LEGACY_API_SITE_ID)
+    payload = _inject_site_id(payload)
 
     return _legacy_request(
         "api/v1/reservation/get", method="POST", payload=payload, token=token
     )
+
+
+@instrument_upstream
+async def afetch_legacy_autocomplete(keyword: str) -> httpx.Response:
+    """
+    Async variant of fetch_legacy_autocomplete.
+    """
+    headers = {"app-key": settings.LEGACY_API_KEY}
+    payload = {"keyword": keyword}
+
+    return await _alegacy_request(
+        "api/v1/autocomplete-affiliates",
+        method="POST",
+        payload=payload,
+        headers=headers,
+    )
+
+
+@instrument_upstream
+async def afetch_quote(token, payload):
+    """
+    Async variant of fetch_quote.
+    """
+    payload = _inject_rate_group(payload)
+
+    return await _alegacy_request(
+        "api/v1/quote", method="POST", payload=payload, token=token
+    )
+
+
+@instrument_upstream
+async def afetch_reservation_create(token, payload, timeout=DEFAULT_TIMEOUT):
+    """
+    Async variant of fetch_reservation_create.
+    """
+    payload = _inject_site_id(payload)
+
+    return await _alegacy_request(
+        "api/v1/create", method="POST", payload=payload, token=token, timeout=timeout
+    )
+
+
+@instrument_upstream
+async def afetch_payment_link(
+    token,
+    reservation_id,
+    payment_provider,
+    language,
+    success_url,
+    cancel_url,
+    timeout=DEFAULT_TIMEOUT,
+):
+    """
+    Async variant of fetch_payment_link.
+    """
+    params = _payment_link_params(
+        reservation_id, payment_provider, language, success_url, cancel_url
+    )
+    return await _alegacy_request(
+        "api/v1/reservation/payment/handler",
+        method="GET",
+        params=params,
+        token=token,
+        timeout=timeout,
+    )
+
+
+@instrument_upstream
+async def afetch_my_booking(token, payload):
+    """
+    Async variant of fetch_my_booking.
+    """
+    payload = _inject_site_id(payload)
+
+    return await _alegacy_request(
+        "api/v1/reservation/get", method="POST", payload=payload, token=token
+    )
@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import SINGLEFLIGHT_CALLS, SINGLEFLIGHT_IN_FLIGHT
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single upstream call.
+
+    Within a worker, followers block on the leader and reuse its result.
+    With LEGACY_SINGLEFLIGHT_SHARED enabled, the leader also takes a lock in
+    the shared cache; leaders on other workers then poll ``lookup`` (usually
+    the response cache the leader writes to) instead of calling upstream.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "leaders": 0,
+            "coalesced": 0,
+            "coalesced_shared": 0,
+            "wait_timeouts": 0,
+        }
+
+    @property
+    def shared(self):
+        return caches[settings.LEGACY_CACHE_ALIAS]
+
+    def lock_key(self, key) -> str:
+        return f"legacy_middleware:singleflight:{self.name}:{key}"
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+        SINGLEFLIGHT_CALLS.labels(self.name, name).inc()
+
+    def stats(self) -> dict:
+        """
+        Counters for this worker, also exported on /metrics as
+        legacy_singleflight_calls_total and legacy_singleflight_in_flight.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls) + len(self._async_calls)
+        return stats
+
+    # -------------------------------------------------------------------------
+    # Threads
+    # -------------------------------------------------------------------------
+    def do(self, key, func, lookup=None):
+        """
+        Run ``func()`` once for all concurrent callers with the same key.
+
+        Args:
+            key (str): Canonical key of the upstream call.
+            func (callable): Performs the upstream call.
+            lookup (callable): Optional, returns another worker's result or None.
+
+        Returns:
+            The leader's result, shared with every follower.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+        self._count("leaders" if leader else "coalesced")
+
+        if not leader:
+            if call.event.wait(settings.LEGACY_SINGLEFLIGHT_TIMEOUT):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # The leader is stuck, don't wait any longer than it would take us
+            self._count("wait_timeouts")
+            return func()
+
+        SINGLEFLIGHT_IN_FLIGHT.labels(self.name).inc()
+        try:
+            call.result = self._run_leader(key, func, lookup)
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            SINGLEFLIGHT_IN_FLIGHT.labels(self.name).dec()
+            call.event.set()
+
+    def _run_leader(self, key, func, lookup):
+        if not (settings.LEGACY_SINGLEFLIGHT_SHARED and lookup):
+            return func()
+
+        lock_key = self.lock_key(key)
+        acquired = self.shared.add(
+            lock_key, 1, timeout=settings.LEGACY_SINGLEFLIGHT_LOCK_TTL
+        )
+        if not acquired:
+            deadline = time.monotonic() + settings.LEGACY_SINGLEFLIGHT_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(settings.LEGACY_SINGLEFLIGHT_POLL_INTERVAL)
+                result = lookup()
+                if result is not None:
+                    self._count("coalesced_shared")
+                    return result
+                # The other worker finished without a cacheable result
+                if self.shared.get(lock_key) is None:
+                    break
+            return func()
+
+        try:
+            return func()
+        finally:
+            self.shared.delete(lock_key)
+
+    # -------------------------------------------------------------------------
+    # Event loop
+    # -------------------------------------------------------------------------
+    async def ado(self, key, func, lookup=None):
+        """Async variant of do(), ``func`` and ``lookup`` are coroutine functions."""
+        future = self._async_calls.get(key)
+        if future is not None:
+            self._count("coalesced")
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(future), settings.LEGACY_SINGLEFLIGHT_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                self._count("wait_timeouts")
+                return await func()
+            except asyncio.CancelledError:
+                # The leader's request was cancelled, not ours
+                if future.cancelled():
+                    return await func()
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        self._count("leaders")
+        SINGLEFLIGHT_IN_FLIGHT.labels(self.name).inc()
+        try:
+            result = await self._arun_leader(key, func, lookup)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Don't warn about exceptions nobody awaited
+            future.exception()
+            raise
+        finally:
+            del self._async_calls[key]
+            SINGLEFLIGHT_IN_FLIGHT.labels(self.name).dec()
+
+    async def _arun_leader(self, key, func, lookup):
+        if not (settings.LEGACY_SINGLEFLIGHT_SHARED and lookup):
+            return await func()
+
+        lock_key = self.lock_key(key)
+        acquired = await self.shared.aadd(
+            lock_key, 1, timeout=settings.LEGACY_SINGLEFLIGHT_LOCK_TTL
+        )
+        if not acquired:
+            deadline = time.monotonic() + settings.LEGACY_SINGLEFLIGHT_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(settings.LEGACY_SINGLEFLIGHT_POLL_INTERVAL)
+                result = await lookup()
+                if result is not None:
+                    self._count("coalesced_shared")
+                    return result
+                if await self.shared.aget(lock_key) is None:
+                    break
+            return await func()
+
+        try:
+            return await func()
+        finally:
+            await self.shared.adelete(lock_key)
+
+
+autocomplete_flight = SingleFlight("autocomplete")
+quote_flight = SingleFlight("quote")
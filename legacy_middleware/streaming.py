@@ -0,0 +1,86 @@
+import time
+
+from django.http import StreamingHttpResponse
+from rest_framework.settings import api_settings
+
+# ?stream= values and their content types
+NDJSON = "ndjson"
+SSE = "sse"
+STREAM_CONTENT_TYPES = {
+    NDJSON: "application/x-ndjson",
+    SSE: "text/event-stream",
+}
+
+SUMMARY_RECORD = "summary"
+
+
+class StreamSummary:
+    """Counters of a streamed fan-out, sent as the final record."""
+
+    __slots__ = ("count", "ok", "errors", "cache_hits", "started")
+
+    def __init__(self):
+        self.count = 0
+        self.ok = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.started = time.perf_counter()
+
+    def add(self, response, cache_status):
+        self.count += 1
+        if response.status_code == 200:
+            self.ok += 1
+        else:
+            self.errors += 1
+        if cache_status == "HIT":
+            self.cache_hits += 1
+
+    def as_record(self) -> dict:
+        return {
+            "type": SUMMARY_RECORD,
+            "count": self.count,
+            "ok": self.ok,
+            "errors": self.errors,
+            "cache_hits": self.cache_hits,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+
+def encode_record(stream_format, record) -> bytes:
+    """One NDJSON line or server-sent event, rendered like the rest of the API."""
+    body = api_settings.DEFAULT_RENDERER_CLASSES[0]().render(record)
+    if stream_format == SSE:
+        return b"event: %s\ndata: %s\n\n" % (record["type"].encode(), body)
+    return body + b"\n"
+
+
+def stream_records(stream_format, results, make_record):
+    """
+    Encode (index, Response, cache status) tuples as they come, then the summary.
+
+    make_record(index, response, cache_status) builds the record of a result.
+    """
+    summary = StreamSummary()
+    for index, response, cache_status in results:
+        summary.add(response, cache_status)
+        yield encode_record(stream_format, make_record(index, response, cache_status))
+    yield encode_record(stream_format, summary.as_record())
+
+
+async def astream_records(stream_format, results, make_record):
+    """Async version of stream_records(), results is an async iterator."""
+    summary = StreamSummary()
+    async for index, response, cache_status in results:
+        summary.add(response, cache_status)
+        yield encode_record(stream_format, make_record(index, response, cache_status))
+    yield encode_record(stream_format, summary.as_record())
+
+
+def streaming_response(stream_format, records):
+    response = StreamingHttpResponse(
+        records, content_type=STREAM_CONTENT_TYPES[stream_format]
+    )
+    response["Cache-Control"] = "no-cache"
+    # Don't let nginx hold the records back
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,254 @@
+import asyncio
+import json
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from legacy_middleware.async_views import (
+    AsyncAutocompleteProxyView,
+    AsyncQuoteBatchProxyView,
+    AsyncQuoteCalendarProxyView,
+    AsyncQuoteProxyView,
+    AsyncReservationCreateProxyView,
+    AsyncMyBookingProxyView,
+)
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.cache import autocomplete_cache, quote_cache
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.services import afetch_quote
+from legacy_middleware.tokens import clear_token_cache
+
+
+def mock_upstream_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    return response
+
+
+class AsyncProxyViewTests(TestCase):
+    """
+    The async views must behave exactly like their sync counterparts.
+    """
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        autocomplete_cache.clear()
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def post(self, view_class, data):
+        request = self.factory.post(
+            "/api/legacy/", json.dumps(data), content_type="application/json"
+        )
+        return view_class.as_view()(request)
+
+    def test_views_are_async(self):
+        for view_class in (
+            AsyncAutocompleteProxyView,
+            AsyncQuoteProxyView,
+            AsyncQuoteBatchProxyView,
+            AsyncQuoteCalendarProxyView,
+            AsyncReservationCreateProxyView,
+            AsyncMyBookingProxyView,
+        ):
+            self.assertTrue(view_class.view_is_async)
+
+    @patch("legacy_middleware.async_views.afetch_quote", new_callable=AsyncMock)
+    async def test_quote_success(self, mock_quote):
+        mock_quote.return_value = mock_upstream_response(
+            200, {"items": [], "places": {}}
+        )
+
+        response = await self.post(AsyncQuoteProxyView, {"passengers": 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"items": [], "places": {}})
+        self.assertEqual(response["X-Cache-Status"], "MISS")
+        args, _ = mock_quote.call_args
+        self.assertEqual(args[0], "valid_token")
+
+        cached = await self.post(AsyncQuoteProxyView, {"passengers": 2})
+        self.assertEqual(cached["X-Cache-Status"], "HIT")
+        mock_quote.assert_called_once()
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch("legacy_middleware.async_views.afetch_quote", new_callable=AsyncMock)
+    async def test_quote_retry_on_401(self, mock_quote, mock_oauth):
+        mock_oauth.return_value = ("fresh_token", timezone.now() + timedelta(hours=1))
+        mock_quote.side_effect = [
+            mock_upstream_response(401, {}),
+            mock_upstream_response(200, {"items": [], "places": {}}),
+        ]
+
+        response = await self.post(AsyncQuoteProxyView, {})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_oauth.assert_called_once()
+        args, _ = mock_quote.call_args_list[1]
+        self.assertEqual(args[0], "fresh_token")
+
+    @patch("legacy_middleware.async_views.afetch_quote", new_callable=AsyncMock)
+    async def test_quote_malformed_response(self, mock_quote):
+        mock_quote.return_value = mock_upstream_response(200, {"places": {}})
+
+        response = await self.post(AsyncQuoteProxyView, {})
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+
+    @patch(
+        "legacy_middleware.async_views.afetch_legacy_autocomplete",
+        new_callable=AsyncMock,
+    )
+    async def test_autocomplete_unreachable(self, mock_autocomplete):
+        mock_autocomplete.side_effect = httpx.ConnectError("Connection error")
+
+        response = await self.post(AsyncAutocompleteProxyView, {"keyword": "cancun"})
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(response.data["error"], "Upstream service unreachable")
+
+    async def test_autocomplete_validation(self):
+        response = await self.post(AsyncAutocompleteProxyView, {})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch("legacy_middleware.async_views.afetch_my_booking", new_callable=AsyncMock)
+    async def test_my_booking_upstream_500(self, mock_fetch):
+        mock_fetch.return_value = mock_upstream_response(500, {})
+
+        response = await self.post(
+            AsyncMyBookingProxyView, {"code": "ABC123", "email": "john@example.com"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+
+    @patch("legacy_middleware.async_views.afetch_payment_link", new_callable=AsyncMock)
+    @patch(
+        "legacy_middleware.async_views.afetch_reservation_create",
+        new_callable=AsyncMock,
+    )
+    async def test_create_success_stripe(self, mock_create, mock_payment):
+        mock_create.return_value = mock_upstream_response(
+            200, {"reservation_id": "RES100"}
+        )
+        mock_payment.return_value = mock_upstream_response(
+            200, {"url": "http://stripe.com/pay/123"}
+        )
+
+        response = await self.post(
+            AsyncReservationCreateProxyView,
+            {"payment_method": "stripe", "success_url": "http://ok.com/thanks"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"payment_link": "http://stripe.com/pay/123"})
+        _, kwargs = mock_payment.call_args
+        self.assertEqual(kwargs["reservation_id"], "RES100")
+        self.assertEqual(kwargs["success_url"], "/thanks")
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch("legacy_middleware.async_views.afetch_quote", new_callable=AsyncMock)
+    async def test_quote_batch(self, mock_quote, mock_oauth):
+        mock_oauth.return_value = ("fresh_token", timezone.now() + timedelta(hours=1))
+        valid = {"items": [], "places": {}}
+        # Every quote is rejected once with the stale token
+        mock_quote.side_effect = lambda token, payload: mock_upstream_response(
+            *((401, {}) if token == "valid_token" else (200, valid))
+        )
+
+        response = await self.post(
+            AsyncQuoteBatchProxyView, {"quotes": [{"n": n} for n in range(3)]}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [{"status": 200, "cache": "MISS", "data": valid}] * 3,
+        )
+        # A single refresh for the whole batch
+        mock_oauth.assert_called_once()
+
+    @override_settings(LEGACY_QUOTE_BATCH_CONCURRENCY=2)
+    @patch("legacy_middleware.async_views.afetch_quote", new_callable=AsyncMock)
+    async def test_quote_batch_bounded_concurrency(self, mock_quote):
+        in_flight = {"now": 0, "max": 0}
+
+        async def slow_fetch(token, payload):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            return mock_upstream_response(200, {"error": "no_availability"})
+
+        mock_quote.side_effect = slow_fetch
+
+        response = await self.post(
+            AsyncQuoteBatchProxyView, {"quotes": [{"n": n} for n in range(5)]}
+        )
+
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertEqual(in_flight["max"], 2)
+
+    @patch("legacy_middleware.async_views.afetch_quote", new_callable=AsyncMock)
+    async def test_quote_calendar(self, mock_quote):
+        mock_quote.side_effect = lambda token, payload: mock_upstream_response(
+            200,
+            {
+                "items": [{"price": int(payload["start"]["pickup"][8:10])}],
+                "places": {},
+            },
+        )
+
+        response = await self.post(
+            AsyncQuoteCalendarProxyView,
+            {
+                "quote": {"start": {"pickup": "2026-11-02 10:00"}},
+                "start_date": "2026-11-20",
+                "end_date": "2026-11-22",
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(day["date"], day["min_price"]) for day in response.data["days"]],
+            [("2026-11-20", 20), ("2026-11-21", 21), ("2026-11-22", 22)],
+        )
+
+
+class AsyncServiceTests(TestCase):
+    """
+    Test the async fetch_* functions against a mocked transport.
+    """
+
+    @override_settings(
+        LEGACY_API_BASE_URL="http://test-api.com",
+        LEGACY_API_RATE_GROUP="premium",
+    )
+    async def test_afetch_quote(self):
+        captured = {}
+
+        def handler(request):
+            captured["request"] = request
+            return httpx.Response(200, json={"items": [], "places": {}})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch(
+            "legacy_middleware.services.get_legacy_async_client", return_value=client
+        ):
+            response = await afetch_quote("test_token", {"origin": "A"})
+
+        request = captured["request"]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(str(request.url), "http://test-api.com/api/v1/quote")
+        self.assertEqual(request.headers["Authorization"], "Bearer test_token")
+        self.assertEqual(
+            json.loads(request.content), {"origin": "A", "rate_group": "premium"}
+        )
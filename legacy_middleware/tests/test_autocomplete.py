@@ -0,0 +1,256 @@
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.test import (
+    AsyncRequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from rest_framework import status
+
+from legacy_middleware import views
+from legacy_middleware.async_views import AsyncAutocompleteProxyView
+from legacy_middleware.autocomplete import (
+    autocomplete_debouncer,
+    narrow_result,
+    prefix_keys,
+)
+from legacy_middleware.cache import autocomplete_cache
+from legacy_middleware.passthrough import RawJSON
+
+HOTELS = {
+    "items": [
+        {"id": 1, "name": "Hotel Riu Cancún"},
+        {"id": 2, "name": "Hostal Mar"},
+        {"id": 3, "name": "Hotelito Tulum", "address": "Tulum"},
+    ]
+}
+
+
+def upstream_response(data):
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = data
+    return response
+
+
+@override_settings(
+    LEGACY_AUTOCOMPLETE_MIN_LENGTH=2, LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=3
+)
+class NarrowResultTests(SimpleTestCase):
+    def test_prefix_keys(self):
+        self.assertEqual(prefix_keys("hote"), ["hote", "hot", "ho"])
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=0)
+    def test_prefix_keys_disabled(self):
+        self.assertEqual(prefix_keys("hote"), ["hote"])
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=4)
+    def test_filters_with_accent_folding(self):
+        narrowed = narrow_result(HOTELS, "hotel riu cancun")
+
+        self.assertEqual(narrowed, {"items": [HOTELS["items"][0]]})
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=4)
+    def test_raw_json(self):
+        raw = RawJSON(json.dumps(HOTELS).encode())
+
+        self.assertEqual(len(narrow_result(raw, "hotel")["items"]), 2)
+
+    def test_truncated_result_not_reused(self):
+        self.assertIsNone(narrow_result(HOTELS, "hotel"))
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=4)
+    def test_only_searched_fields_match(self):
+        data = {
+            "items": [
+                {"id": 4, "name": "Villa Mar", "zone": "Zona Hotelera"},
+                {"id": 5, "name": "Casa Sol", "code": "HOTEL5"},
+            ]
+        }
+
+        self.assertEqual(narrow_result(data, "hotel"), {"items": []})
+
+    def test_error_not_reused(self):
+        self.assertIsNone(narrow_result({"error": "keyword too short"}, "hotel"))
+
+
+@override_settings(
+    LEGACY_AUTOCOMPLETE_MIN_LENGTH=2, LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=10
+)
+class IncrementalAutocompleteTests(TestCase):
+    def setUp(self):
+        self.url = reverse("legacy_autocomplete")
+        autocomplete_cache.clear()
+
+    def post(self, keyword, session=None):
+        headers = {"X-Autocomplete-Session": session} if session else {}
+        return self.client.post(
+            self.url,
+            {"keyword": keyword},
+            content_type="application/json",
+            headers=headers,
+        )
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_typing_calls_upstream_once(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(HOTELS)
+
+        keystrokes = ("h", "ho", "hot", "hote", "hotel")
+        responses = [self.post(keyword) for keyword in keystrokes]
+
+        self.assertEqual(
+            responses[0].status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        mock_fetch.assert_called_once_with("ho")
+        self.assertEqual(
+            [item["id"] for item in responses[-1].json()["items"]], [1, 3]
+        )
+        # The narrowed result is cached for the next keystrokes
+        self.assertEqual(len(autocomplete_cache.get("hotel")["items"]), 2)
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_full_page_goes_upstream(self, mock_fetch):
+        full_page = {
+            "items": [{"id": i, "name": f"Hotel {i}"} for i in range(10)]
+        }
+        mock_fetch.return_value = upstream_response(full_page)
+
+        self.post("ho")
+        self.post("hotel")
+
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    @override_settings(LEGACY_AUTOCOMPLETE_CACHE_TTL=100)
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_narrowed_result_expires_with_prefix(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(HOTELS)
+        now = time.time()
+        self.post("ho")
+
+        with patch("legacy_middleware.cache.time.time", return_value=now + 60):
+            self.post("hotel")
+            self.assertIsNotNone(autocomplete_cache.get("hotel"))
+        with patch("legacy_middleware.cache.time.time", return_value=now + 101):
+            self.assertIsNone(autocomplete_cache.get("hotel"))
+
+    def newer_keyword_arrives(self, session):
+        """Patch the cache lookups to let `session` send a newer keyword."""
+
+        def cached_response(keyword):
+            autocomplete_debouncer.mark(session)
+            return None
+
+        return patch.object(
+            views.AutocompleteProxyView,
+            "cached_response",
+            side_effect=cached_response,
+        )
+
+    @override_settings(LEGACY_AUTOCOMPLETE_DEBOUNCE=0.05)
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_superseded_keyword_dropped(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(HOTELS)
+
+        with self.newer_keyword_arrives("guest-1"):
+            response = self.post("hot", session="guest-1")
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        mock_fetch.assert_not_called()
+
+    @override_settings(LEGACY_AUTOCOMPLETE_DEBOUNCE=0.05)
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_other_sessions_not_dropped(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(HOTELS)
+
+        # Another guest behind the same address keeps typing
+        with self.newer_keyword_arrives("guest-2"):
+            response = self.post("hot", session="guest-1")
+            anonymous = self.post("tul")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(anonymous.status_code, status.HTTP_200_OK)
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    @override_settings(LEGACY_AUTOCOMPLETE_DEBOUNCE=0.2)
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_latest_keyword_waits_out_window(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(HOTELS)
+        started = time.monotonic()
+
+        response = self.post("hot", session="guest-1")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertIn("debounce", response["Server-Timing"])
+        mock_fetch.assert_called_once()
+
+    @override_settings(LEGACY_AUTOCOMPLETE_DEBOUNCE=0.3)
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_only_last_keystroke_goes_upstream(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(HOTELS)
+        responses = {}
+
+        def type_keyword(keyword):
+            responses[keyword] = self.post(keyword, session="guest-1")
+
+        first = threading.Thread(target=type_keyword, args=("hot",))
+        first.start()
+        time.sleep(0.1)
+        type_keyword("hote")
+        first.join()
+
+        self.assertEqual(responses["hot"].status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(responses["hote"].status_code, status.HTTP_200_OK)
+        mock_fetch.assert_called_once_with("hote")
+
+    @override_settings(LEGACY_AUTOCOMPLETE_DEBOUNCE=5)
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_no_session_not_debounced(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(HOTELS)
+        started = time.monotonic()
+
+        response = self.post("hot")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertNotIn("debounce", response["Server-Timing"])
+
+
+@override_settings(
+    LEGACY_AUTOCOMPLETE_MIN_LENGTH=2,
+    LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=10,
+    LEGACY_AUTOCOMPLETE_DEBOUNCE=0.05,
+)
+class AsyncIncrementalAutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete_cache.clear()
+
+    async def post(self, keyword):
+        request = AsyncRequestFactory().post(
+            "/api/legacy/autocomplete/",
+            json.dumps({"keyword": keyword}),
+            content_type="application/json",
+            headers={"X-Autocomplete-Session": "guest-1"},
+        )
+        return await AsyncAutocompleteProxyView.as_view()(request)
+
+    @patch(
+        "legacy_middleware.async_views.afetch_legacy_autocomplete",
+        new_callable=AsyncMock,
+    )
+    async def test_only_last_keystroke_goes_upstream(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(HOTELS)
+
+        first, last = await asyncio.gather(self.post("hot"), self.post("hote"))
+        narrowed = await self.post("hotel")
+
+        self.assertEqual(first.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(last.data, HOTELS)
+        mock_fetch.assert_awaited_once_with("hote")
+        self.assertEqual([item["id"] for item in narrowed.data["items"]], [1, 3])
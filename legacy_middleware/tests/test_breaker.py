@@ -0,0 +1,244 @@
+import asyncio
+import json
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import requests
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from legacy_middleware.async_views import AsyncQuoteProxyView
+from legacy_middleware.breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    get_breaker,
+    reset_breakers,
+)
+from legacy_middleware.cache import quote_cache
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.services import fetch_legacy_autocomplete
+from legacy_middleware.tokens import clear_token_cache
+from legacy_middleware.views import AutocompleteProxyView, QuoteProxyView
+from utils.callbacks import dashboard_callback
+
+BREAKER_SETTINGS = {
+    "LEGACY_BREAKER_ENABLED": True,
+    "LEGACY_BREAKER_WINDOW": 30,
+    "LEGACY_BREAKER_MIN_CALLS": 4,
+    "LEGACY_BREAKER_FAILURE_RATE": 0.5,
+    "LEGACY_BREAKER_SLOW_CALL_SECONDS": 5,
+    "LEGACY_BREAKER_OPEN_SECONDS": 30,
+    "LEGACY_BREAKER_PROBE_TIMEOUT": 15,
+    "LEGACY_BREAKER_SYNC_INTERVAL": 0,
+}
+
+
+@override_settings(**BREAKER_SETTINGS)
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker("api/v1/quote")
+
+    def record_failures(self, breaker=None, count=1):
+        breaker = breaker or self.breaker
+        for _ in range(count):
+            breaker.record(True, breaker.before_call())
+
+    def open_breaker(self):
+        self.breaker.record(False)
+        self.record_failures(count=3)
+        self.assertEqual(self.breaker.snapshot()["state"], OPEN)
+
+    def expire_open_period(self):
+        state = cache.get(self.breaker.state_key)
+        state["opened_at"] -= 31
+        cache.set(self.breaker.state_key, state)
+
+    def test_stays_closed_below_min_calls(self):
+        self.record_failures(count=3)
+        self.assertEqual(self.breaker.snapshot()["state"], CLOSED)
+        self.assertFalse(self.breaker.before_call())
+
+    def test_stays_closed_below_failure_rate(self):
+        for _ in range(3):
+            self.breaker.record(False)
+        self.record_failures(count=2)
+        self.assertEqual(self.breaker.snapshot()["state"], CLOSED)
+
+    def test_opens_on_failure_rate_and_fails_fast(self):
+        self.open_breaker()
+
+        with self.assertRaises(CircuitOpenError) as ctx:
+            self.breaker.before_call()
+        self.assertEqual(ctx.exception.retry_after, 30)
+
+    def test_slow_calls_count_as_failures(self):
+        self.assertTrue(self.breaker.is_failure(200, 6))
+        self.assertTrue(self.breaker.is_failure(503, 0.1))
+        self.assertFalse(self.breaker.is_failure(404, 0.1))
+
+    def test_state_shared_across_workers(self):
+        self.open_breaker()
+        other_worker = CircuitBreaker("api/v1/quote")
+
+        with self.assertRaises(CircuitOpenError):
+            other_worker.before_call()
+
+    def test_half_open_lets_a_single_probe_through(self):
+        self.open_breaker()
+        self.expire_open_period()
+
+        self.assertEqual(self.breaker.snapshot()["state"], HALF_OPEN)
+        self.assertTrue(self.breaker.before_call())
+        with self.assertRaises(CircuitOpenError):
+            CircuitBreaker("api/v1/quote").before_call()
+
+    def test_successful_probe_closes(self):
+        self.open_breaker()
+        self.expire_open_period()
+
+        self.breaker.record(False, self.breaker.before_call())
+
+        self.assertEqual(self.breaker.snapshot()["state"], CLOSED)
+        self.assertFalse(self.breaker.before_call())
+
+    def test_failed_probe_reopens(self):
+        self.open_breaker()
+        self.expire_open_period()
+
+        self.breaker.record(True, self.breaker.before_call())
+
+        snapshot = self.breaker.snapshot()
+        self.assertEqual(snapshot["state"], OPEN)
+        self.assertEqual(snapshot["retry_after"], 30)
+
+    @override_settings(LEGACY_BREAKER_ENABLED=False)
+    def test_disabled(self):
+        self.record_failures(count=10)
+        self.assertFalse(self.breaker.before_call())
+
+
+@override_settings(LEGACY_API_BASE_URL="http://test-api.com", **BREAKER_SETTINGS)
+class CircuitBreakerProxyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        reset_breakers()
+
+    @patch("legacy_middleware.services.requests.Session.post")
+    def test_upstream_outage_fails_fast(self, mock_post):
+        """
+        Once the circuit opens, requests get a 503 without calling upstream.
+        """
+        mock_post.side_effect = requests.Timeout("Read timed out")
+        view = QuoteProxyView()
+
+        with patch("legacy_middleware.views.get_cached_token") as mock_token:
+            mock_token.return_value = MagicMock(token="valid_token")
+            statuses = [
+                view.execute_proxy_request(
+                    lambda token, payload: fetch_legacy_autocomplete("x"), {}
+                ).status_code
+                for _ in range(6)
+            ]
+
+        self.assertEqual(statuses[:4], [status.HTTP_502_BAD_GATEWAY] * 4)
+        self.assertEqual(statuses[4:], [status.HTTP_503_SERVICE_UNAVAILABLE] * 2)
+        self.assertEqual(mock_post.call_count, 4)
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_retry_after_survives_coalescing(self, mock_fetch):
+        mock_fetch.side_effect = CircuitOpenError("api/v1/autocomplete-affiliates", 12)
+        request = MagicMock(data={"keyword": "cancun"})
+
+        response = AutocompleteProxyView().post(request)
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "12")
+
+
+@override_settings(LEGACY_API_BASE_URL="http://test-api.com", **BREAKER_SETTINGS)
+class AsyncCircuitBreakerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        self.blocking_calls = []
+        for name in ("get", "add", "set", "delete"):
+            patcher = patch.object(
+                LocMemCache, name, self.guard(getattr(LocMemCache, name))
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        reset_breakers()
+
+    def guard(self, method):
+        """Record breaker cache calls made on the event loop thread."""
+        blocking_calls = self.blocking_calls
+
+        def guarded(cache, key, *args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                if key.startswith("legacy_middleware:breaker"):
+                    blocking_calls.append((method.__name__, key))
+            return method(cache, key, *args, **kwargs)
+
+        return guarded
+
+    @patch("legacy_middleware.services.get_legacy_async_client")
+    async def test_opens_without_blocking_the_loop(self, mock_client):
+        mock_client.return_value.request = AsyncMock(
+            side_effect=httpx.ConnectError("refused")
+        )
+        statuses = []
+        for _ in range(6):
+            request = AsyncRequestFactory().post(
+                "/api/legacy/quote/",
+                json.dumps({"passengers": 2}),
+                content_type="application/json",
+            )
+            response = await AsyncQuoteProxyView.as_view()(request)
+            statuses.append(response.status_code)
+
+        self.assertEqual(statuses[:4], [status.HTTP_502_BAD_GATEWAY] * 4)
+        self.assertEqual(statuses[4:], [status.HTTP_503_SERVICE_UNAVAILABLE] * 2)
+        self.assertEqual(mock_client.return_value.request.await_count, 4)
+        self.assertEqual(self.blocking_calls, [])
+
+
+@override_settings(**BREAKER_SETTINGS)
+class CircuitBreakerDashboardTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        reset_breakers()
+
+    def test_dashboard_lists_breakers(self):
+        breaker = get_breaker("api/v1/quote")
+        for _ in range(4):
+            breaker.record(True)
+
+        table = dashboard_callback(None, {})["legacy_breakers_table"]
+
+        rows = {row[0]: row for row in table["rows"]}
+        self.assertEqual(rows["api/v1/quote"][1], "open")
+        self.assertEqual(rows["api/v1/quote"][2], "30s")
+        self.assertEqual(rows["api/v1/oauth"][1], "closed")
@@ -0,0 +1,369 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.core.cache import cache
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from legacy_middleware.async_views import AsyncAutocompleteProxyView
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.cache import (
+    EARLY,
+    FRESH,
+    GRACE,
+    STALE,
+    TieredCache,
+    autocomplete_cache,
+    canonical_quote_key,
+    normalize_keyword,
+    quote_cache,
+)
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.tokens import clear_token_cache
+
+
+class NormalizeKeywordTests(TestCase):
+    def test_folds_case_accents_and_whitespace(self):
+        self.assertEqual(normalize_keyword("  Cancún   AEROPUERTO "), "cancun aeropuerto")
+        self.assertEqual(normalize_keyword("Playa del Cármen"), "playa del carmen")
+        self.assertEqual(normalize_keyword("Tulum\tCentro"), "tulum centro")
+
+
+@override_settings(LEGACY_API_RATE_GROUP="web", LEGACY_QUOTE_CACHE_COORD_PRECISION=4)
+class CanonicalQuoteKeyTests(TestCase):
+    def setUp(self):
+        self.payload = {
+            "type": "one-way",
+            "start": {"lat": 21.0365123, "lng": -86.8770941, "pickup": "2026-11-02 10:00"},
+            "end": {"lat": 21.1, "lng": -86.8, "pickup": "2026-11-02 10:00"},
+            "passengers": 2,
+            "currency": "USD",
+            "language": "en",
+        }
+
+    def test_equivalent_payloads_share_key(self):
+        equivalent = {
+            "language": "en",
+            "currency": "USD",
+            "passengers": 2,
+            "end": {"pickup": "2026-11-02T10:00:00", "lng": "-86.8", "lat": 21.1},
+            "start": {"pickup": " 2026-11-02 10:00", "lng": -86.87709, "lat": 21.03651},
+            "type": "one-way ",
+            "rate_group": "web",
+        }
+        self.assertEqual(canonical_quote_key(self.payload), canonical_quote_key(equivalent))
+
+    def test_relevant_fields_change_key(self):
+        base = canonical_quote_key(self.payload)
+        for field, value in (
+            ("currency", "MXN"),
+            ("language", "es"),
+            ("rate_group", "vip"),
+            ("passengers", 3),
+        ):
+            changed = dict(self.payload, **{field: value})
+            self.assertNotEqual(canonical_quote_key(changed), base, field)
+
+        moved = dict(self.payload, start=dict(self.payload["start"], lat=21.04))
+        self.assertNotEqual(canonical_quote_key(moved), base)
+
+    def test_payload_not_mutated(self):
+        canonical_quote_key(self.payload)
+        self.assertNotIn("rate_group", self.payload)
+        self.assertEqual(self.payload["start"]["lat"], 21.0365123)
+
+
+@override_settings(
+    LEGACY_AUTOCOMPLETE_CACHE_TTL=60,
+    LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES=2,
+    LEGACY_CACHE_SYNC_INTERVAL=5,
+)
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = TieredCache(
+            "test",
+            ttl_setting="LEGACY_AUTOCOMPLETE_CACHE_TTL",
+            max_entries_setting="LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES",
+        )
+
+    def test_miss_then_local_hit(self):
+        self.assertIsNone(self.cache.get("hotel"))
+        self.cache.set("hotel", {"items": []})
+
+        self.assertEqual(self.cache.get("hotel"), {"items": []})
+        stats = self.cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["local_hits"], 1)
+
+    def test_shared_hit_from_other_worker(self):
+        """
+        An entry written by another worker is served from the shared tier.
+        """
+        other_worker = TieredCache(
+            "test",
+            ttl_setting="LEGACY_AUTOCOMPLETE_CACHE_TTL",
+            max_entries_setting="LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES",
+        )
+        other_worker.set("hotel", {"items": [1]})
+
+        self.assertEqual(self.cache.get("hotel"), {"items": [1]})
+        self.assertEqual(self.cache.get("hotel"), {"items": [1]})
+        stats = self.cache.stats()
+        self.assertEqual(stats["shared_hits"], 1)
+        self.assertEqual(stats["local_hits"], 1)
+
+    def test_lru_eviction(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")  # "b" is now the least recently used
+        self.cache.set("c", 3)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["size"], 2)
+        self.assertIn(self.cache.make_key("a"), self.cache._local)
+        self.assertNotIn(self.cache.make_key("b"), self.cache._local)
+
+    def test_expiry(self):
+        self.cache.set("hotel", {"items": []}, ttl=10)
+        with patch("legacy_middleware.cache.time.time", return_value=time.time() + 11):
+            self.assertIsNone(self.cache.get("hotel"))
+
+    def test_clear_reaches_other_workers(self):
+        other_worker = TieredCache(
+            "test",
+            ttl_setting="LEGACY_AUTOCOMPLETE_CACHE_TTL",
+            max_entries_setting="LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES",
+        )
+        self.cache.set("hotel", {"items": []})
+        other_worker.get("hotel")
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("hotel"))
+
+        # The other worker drops its local copy on its next flush check
+        other_worker._flush_checked_at = 0
+        self.assertIsNone(other_worker.get("hotel"))
+
+
+def upstream_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    return response
+
+
+def later(seconds):
+    """Move the cache clock `seconds` ahead."""
+    now = time.time()
+    return patch("legacy_middleware.cache.time.time", return_value=now + seconds)
+
+
+@override_settings(
+    LEGACY_AUTOCOMPLETE_CACHE_TTL=60,
+    LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES=10,
+    LEGACY_AUTOCOMPLETE_CACHE_GRACE=30,
+    LEGACY_AUTOCOMPLETE_CACHE_STALE_IF_ERROR=300,
+    LEGACY_CACHE_EARLY_RECOMPUTE_BETA=1.0,
+)
+class TieredCacheLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = TieredCache(
+            "test",
+            ttl_setting="LEGACY_AUTOCOMPLETE_CACHE_TTL",
+            max_entries_setting="LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES",
+            grace_setting="LEGACY_AUTOCOMPLETE_CACHE_GRACE",
+            stale_if_error_setting="LEGACY_AUTOCOMPLETE_CACHE_STALE_IF_ERROR",
+        )
+
+    def test_states(self):
+        self.cache.set("hotel", {"items": []}, ttl=10)
+
+        self.assertEqual(self.cache.lookup("hotel"), ({"items": []}, FRESH))
+        with later(20):
+            self.assertEqual(self.cache.lookup("hotel"), ({"items": []}, GRACE))
+            self.assertIsNone(self.cache.get("hotel"))
+        with later(100):
+            self.assertEqual(self.cache.lookup("hotel"), ({"items": []}, STALE))
+        with later(400):
+            self.assertEqual(self.cache.lookup("hotel"), (None, None))
+
+    def test_stale_entry_kept_in_shared_tier(self):
+        self.cache.set("hotel", {"items": []}, ttl=10)
+        self.cache._local.clear()
+
+        with later(100):
+            self.assertEqual(self.cache.lookup("hotel"), ({"items": []}, STALE))
+
+    @patch("legacy_middleware.cache.random.random", return_value=0.99)
+    def test_slow_entry_refreshed_early(self, mock_random):
+        self.cache.set("slow", 1, ttl=10, cost=5)
+        self.cache.set("fast", 2, ttl=10, cost=0.001)
+
+        with later(1):
+            self.assertEqual(self.cache.lookup("slow"), (1, EARLY))
+            self.assertEqual(self.cache.lookup("fast"), (2, FRESH))
+        self.assertEqual(self.cache.stats()["early_refreshes"], 1)
+
+    @override_settings(LEGACY_CACHE_EARLY_RECOMPUTE_BETA=0)
+    @patch("legacy_middleware.cache.random.random", return_value=0.99)
+    def test_early_refresh_disabled(self, mock_random):
+        self.cache.set("slow", 1, ttl=10, cost=5)
+
+        self.assertEqual(self.cache.lookup("slow"), (1, FRESH))
+
+    def test_flushed_entry_not_served_stale(self):
+        self.cache.set("hotel", {"items": []}, ttl=10)
+        self.cache.clear()
+
+        with later(20):
+            self.assertEqual(self.cache.lookup("hotel"), (None, None))
+
+    def test_refresh_claimed_once(self):
+        self.assertTrue(self.cache.claim_refresh("hotel"))
+        self.assertFalse(self.cache.claim_refresh("hotel"))
+
+        self.cache.release_refresh("hotel")
+        self.assertTrue(self.cache.claim_refresh("hotel"))
+
+
+@override_settings(
+    LEGACY_AUTOCOMPLETE_CACHE_GRACE=30,
+    LEGACY_AUTOCOMPLETE_CACHE_STALE_IF_ERROR=300,
+    LEGACY_QUOTE_CACHE_TTL=60,
+    LEGACY_QUOTE_CACHE_GRACE=30,
+    LEGACY_GAZETTEER_PATH="",
+)
+@patch("legacy_middleware.views.start_refresh", side_effect=lambda func: func())
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        autocomplete_cache.clear()
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+
+    def autocomplete(self, keyword="cancun"):
+        return self.client.post(
+            reverse("legacy_autocomplete"),
+            {"keyword": keyword},
+            content_type="application/json",
+        )
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_expired_served_while_refreshed(self, mock_fetch, mock_refresh):
+        autocomplete_cache.set("cancun", {"items": [1]}, ttl=10)
+        mock_fetch.return_value = upstream_response(200, {"items": [2]})
+
+        with later(20):
+            response = self.autocomplete()
+            refreshed = self.autocomplete()
+
+        self.assertEqual(response.json(), {"items": [1]})
+        self.assertEqual(refreshed.json(), {"items": [2]})
+        mock_refresh.assert_called_once()
+        mock_fetch.assert_called_once_with("cancun")
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_refresh_runs_once(self, mock_fetch, mock_refresh):
+        autocomplete_cache.set("cancun", {"items": [1]}, ttl=10)
+        autocomplete_cache.claim_refresh("cancun")
+
+        with later(12):
+            response = self.autocomplete()
+
+        self.assertEqual(response.json(), {"items": [1]})
+        mock_refresh.assert_not_called()
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_stale_if_error(self, mock_fetch, mock_refresh):
+        autocomplete_cache.set("cancun", {"items": [1]}, ttl=10)
+        mock_fetch.return_value = upstream_response(503, {})
+
+        with later(100):
+            response = self.autocomplete()
+            uncached = self.autocomplete("tulum")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"items": [1]})
+        self.assertEqual(uncached.status_code, 502)
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_updating(self, mock_quote, mock_refresh):
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        mock_quote.return_value = upstream_response(
+            200, {"items": [{"id": 1}], "places": {}}
+        )
+        url = reverse("legacy_quote")
+        self.client.post(url, {"passengers": 2}, content_type="application/json")
+
+        with later(70):
+            response = self.client.post(
+                url, {"passengers": 2}, content_type="application/json"
+            )
+
+        self.assertEqual(response["X-Cache-Status"], "UPDATING")
+        self.assertEqual(mock_quote.call_count, 2)
+
+
+@override_settings(
+    LEGACY_AUTOCOMPLETE_CACHE_GRACE=30,
+    LEGACY_AUTOCOMPLETE_CACHE_STALE_IF_ERROR=300,
+    LEGACY_GAZETTEER_PATH="",
+)
+class AsyncStaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        autocomplete_cache.clear()
+        reset_breakers()
+
+    async def autocomplete(self):
+        request = AsyncRequestFactory().post(
+            "/api/legacy/autocomplete/",
+            json.dumps({"keyword": "cancun"}),
+            content_type="application/json",
+        )
+        return await AsyncAutocompleteProxyView.as_view()(request)
+
+    @patch(
+        "legacy_middleware.async_views.afetch_legacy_autocomplete",
+        new_callable=AsyncMock,
+    )
+    async def test_expired_served_while_refreshed(self, mock_fetch):
+        await autocomplete_cache.aset("cancun", {"items": [1]}, ttl=10)
+        mock_fetch.return_value = upstream_response(200, {"items": [2]})
+        tasks = []
+
+        with later(20), patch(
+            "legacy_middleware.async_views.start_async_refresh",
+            side_effect=lambda coroutine: tasks.append(
+                asyncio.ensure_future(coroutine)
+            ),
+        ):
+            response = await self.autocomplete()
+            await asyncio.gather(*tasks)
+            refreshed = await self.autocomplete()
+
+        self.assertEqual(response.data, {"items": [1]})
+        self.assertEqual(refreshed.data, {"items": [2]})
+        mock_fetch.assert_awaited_once_with("cancun")
+
+    @patch(
+        "legacy_middleware.async_views.afetch_legacy_autocomplete",
+        new_callable=AsyncMock,
+    )
+    async def test_stale_if_error(self, mock_fetch):
+        await autocomplete_cache.aset("cancun", {"items": [1]}, ttl=10)
+        mock_fetch.return_value = upstream_response(500, {})
+
+        with later(100):
+            response = await self.autocomplete()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"items": [1]})
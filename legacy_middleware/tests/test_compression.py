@@ -0,0 +1,160 @@
+import gzip
+import json
+import zlib
+from datetime import timedelta
+from unittest.mock import patch
+
+import brotli
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.cache import quote_cache
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.tests.test_passthrough import upstream_response
+from legacy_middleware.tokens import clear_token_cache
+from utils import compression
+from utils.compression import CompressionMiddleware, negotiate_encoding
+
+BODY = json.dumps({"items": [{"name": f"Private SUV {n}"} for n in range(100)]}).encode()
+
+
+class NegotiateEncodingTests(SimpleTestCase):
+    def test_brotli_preferred(self):
+        self.assertEqual(negotiate_encoding("gzip, deflate, br, zstd"), "br")
+
+    def test_gzip_only(self):
+        self.assertEqual(negotiate_encoding("gzip, deflate"), "gzip")
+
+    def test_weights(self):
+        self.assertEqual(negotiate_encoding("br;q=0.5, gzip;q=0.8"), "gzip")
+        self.assertEqual(negotiate_encoding("br;q=0, *"), "gzip")
+        self.assertEqual(negotiate_encoding("*;q=0.3"), "br")
+
+    def test_none(self):
+        self.assertIsNone(negotiate_encoding(""))
+        self.assertIsNone(negotiate_encoding("identity"))
+        self.assertIsNone(negotiate_encoding("gzip;q=0, br;q=invalid"))
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200, COMPRESSION_EXCLUDED_ROUTES=[])
+class CompressionMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def process(self, response, accept_encoding="gzip, br", path="/api/posts/"):
+        request = self.factory.get(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+        request.resolver_match = resolve(path)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def json_response(self, body=BODY, **kwargs):
+        return HttpResponse(body, content_type="application/json", **kwargs)
+
+    def test_brotli(self):
+        response = self.process(self.json_response())
+
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertEqual(brotli.decompress(response.content), BODY)
+
+    def test_gzip(self):
+        response = self.process(self.json_response(), accept_encoding="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), BODY)
+
+    def test_not_accepted(self):
+        response = self.process(self.json_response(), accept_encoding="")
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response.content, BODY)
+
+    def test_below_min_size(self):
+        response = self.process(self.json_response(b'{"items": []}'))
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertFalse(response.has_header("Vary"))
+
+    def test_html_left_alone(self):
+        response = self.process(HttpResponse(b"<p>csrf</p>" * 100))
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_excluded_route(self):
+        with override_settings(COMPRESSION_EXCLUDED_ROUTES=["api/legacy/my-booking/"]):
+            response = self.process(
+                self.json_response(), path="/api/legacy/my-booking/"
+            )
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_already_encoded(self):
+        original = self.json_response()
+        original["Content-Encoding"] = "identity"
+
+        response = self.process(original)
+
+        self.assertEqual(response.content, BODY)
+
+    def test_etag_weakened(self):
+        original = self.json_response()
+        original["ETag"] = '"abc"'
+
+        response = self.process(original)
+
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    def test_streaming_flushed_per_chunk(self):
+        lines = [b'{"n": %d}\n' % n for n in range(3)]
+        response = self.process(
+            StreamingHttpResponse(iter(lines), content_type="application/x-ndjson"),
+            accept_encoding="gzip",
+        )
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = [decompressor.decompress(chunk) for chunk in response.streaming_content]
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(chunks[:3], lines)
+        self.assertTrue(decompressor.eof)
+
+
+@override_settings(
+    LEGACY_PASSTHROUGH_ENDPOINTS=["quote"],
+    COMPRESSION_MIN_SIZE=200,
+)
+class PassthroughCompressionTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def post(self):
+        return self.client.post(
+            "/api/legacy/quote/",
+            {"passengers": 2},
+            content_type="application/json",
+            HTTP_ACCEPT_ENCODING="br",
+        )
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_cached_body_compressed_once(self, mock_fetch):
+        body = json.dumps({"items": [{"id": n} for n in range(100)], "places": {}})
+        mock_fetch.return_value = upstream_response(200, body.encode())
+
+        with patch.object(compression, "compress", wraps=compression.compress) as spy:
+            response = self.post()
+            cached = self.post()
+
+        self.assertEqual(cached["X-Cache-Status"], "HIT")
+        self.assertEqual(cached["Content-Encoding"], "br")
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(brotli.decompress(cached.content), body.encode())
+        spy.assert_called_once()
@@ -0,0 +1,262 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from legacy_middleware.autocomplete import narrow_result
+from legacy_middleware.cache import autocomplete_cache
+from legacy_middleware.gazetteer import (
+    GazetteerIndex,
+    build_snapshot,
+    get_gazetteer,
+    harvest_places,
+    reset_gazetteer,
+)
+
+PLACES = [
+    {
+        "id": 1,
+        "name": "Aeropuerto Internacional de Cancún",
+        "address": "Carretera Cancún-Chetumal km 22",
+        "geo": {"lat": 21.0365, "lng": -86.8771},
+    },
+    {
+        "id": 2,
+        "name": "Hotel Riu Palace Peninsula",
+        "address": "Blvd. Kukulcan, Zona Hotelera, Cancún",
+        "geo": {"lat": 21.1403, "lng": -86.7807},
+    },
+    {
+        "id": 3,
+        "name": "Tulum Centro",
+        "address": "Tulum, Quintana Roo",
+        "geo": {"lat": 20.2114, "lng": -87.4654},
+    },
+]
+
+# Keywords the upstream returned every place for
+COVERED = ["aeropuerto", "cancun", "hotel", "tulum"]
+
+
+class GazetteerTestMixin:
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "gazetteer.idx")
+        reset_gazetteer()
+        self.addCleanup(reset_gazetteer)
+
+
+@override_settings(LEGACY_GAZETTEER_RATE=0)
+class GazetteerIndexTests(GazetteerTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        build_snapshot(PLACES, self.path, COVERED)
+        self.index = GazetteerIndex(self.path)
+
+    def names(self, keyword):
+        return [
+            json.loads(self.index.record(record_id))["name"]
+            for record_id in self.index.search(keyword)
+        ]
+
+    def test_substring_with_accent_folding(self):
+        self.assertEqual(
+            self.names("CANCÚN"),
+            ["Aeropuerto Internacional de Cancún", "Hotel Riu Palace Peninsula"],
+        )
+        self.assertEqual(self.names("aeropuerto internacional"), [PLACES[0]["name"]])
+        self.assertEqual(self.names("cancun-chet"), [PLACES[0]["name"]])
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=10)
+    def test_same_matches_as_narrow_result(self):
+        build_snapshot(PLACES, self.path, ["a", "c", "h", "k", "t", "z"])
+        index = GazetteerIndex(self.path)
+
+        for keyword in [
+            "cancun",
+            "ancun",
+            "cancun tulum",
+            "ca",
+            "tulum, q",
+            "kukulcan zona",
+            "hotel tulum",
+            "zona hotelera, cancun",
+        ]:
+            with self.subTest(keyword=keyword):
+                narrowed = narrow_result({"items": PLACES}, keyword)["items"]
+                found = [json.loads(index.record(i)) for i in index.search(keyword)]
+                self.assertEqual(found, narrowed)
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.names("tulum hotel"), [])
+
+    def test_typo_is_miss(self):
+        self.assertEqual(self.names("tulun"), [])
+
+    def test_uncovered_keyword_is_miss(self):
+        # Other places with "riu" may not have been harvested
+        self.assertEqual(self.names("riu"), [])
+        self.assertTrue(self.index.covers("Hotel Riu"))
+
+    def test_miss(self):
+        self.assertEqual(self.names("merida"), [])
+
+    @override_settings(LEGACY_GAZETTEER_MAX_RESULTS=1)
+    def test_limit(self):
+        self.assertEqual(len(self.names("cancun")), 1)
+
+    def test_response_body(self):
+        body = self.index.response_body([2, 0])
+
+        self.assertEqual(json.loads(body), {"items": [PLACES[2], PLACES[0]]})
+
+    def test_not_a_snapshot(self):
+        with open(self.path, "wb") as fh:
+            fh.write(b"x" * 200)
+
+        with self.assertRaises(ValueError):
+            GazetteerIndex(self.path)
+
+    def test_new_snapshot_picked_up(self):
+        with override_settings(LEGACY_GAZETTEER_PATH=self.path):
+            self.assertEqual(get_gazetteer().count, 3)
+            build_snapshot(PLACES[:1], self.path, COVERED)
+            reset_gazetteer()
+            self.assertEqual(get_gazetteer().count, 1)
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=10)
+    def test_harvest_deduplicates(self):
+        def fetch(keyword):
+            if keyword == "fail":
+                raise ValueError("upstream down")
+            return {"items": PLACES[:2] if keyword == "cancun" else PLACES[1:]}
+
+        items, covered, failed = harvest_places(fetch, ["Cancún", "fail", "hotel"])
+
+        self.assertEqual(items, PLACES)
+        self.assertEqual(covered, ["cancun", "hotel"])
+        self.assertEqual(failed, 1)
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=2)
+    def test_full_page_expanded(self):
+        def fetch(keyword):
+            if keyword == "cancun":
+                return {"items": PLACES[:2]}
+            if keyword == "cancun ":
+                return {"items": PLACES[2:]}
+            return {"items": []}
+
+        items, covered, failed = harvest_places(fetch, ["cancun"])
+
+        self.assertEqual(items, PLACES)
+        self.assertNotIn("cancun", covered)
+        self.assertIn("cancuna", covered)
+        self.assertIn("cancun ", covered)
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=2)
+    def test_expansion_capped(self):
+        fetch = MagicMock(return_value={"items": PLACES[:2]})
+
+        items, covered, failed = harvest_places(fetch, ["cancun"], max_keywords=5)
+
+        self.assertEqual(fetch.call_count, 5)
+        self.assertEqual(covered, [])
+
+    @override_settings(LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT=10)
+    @patch("legacy_middleware.gazetteer.time.sleep")
+    def test_harvest_rate(self, mock_sleep):
+        fetch = MagicMock(return_value={"items": PLACES})
+
+        harvest_places(fetch, ["cancun", "hotel", "tulum"], rate=4)
+
+        self.assertEqual(fetch.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        for call in mock_sleep.call_args_list:
+            self.assertAlmostEqual(call.args[0], 0.25, delta=0.05)
+
+
+class GazetteerAutocompleteTests(GazetteerTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        autocomplete_cache.clear()
+        build_snapshot(PLACES, self.path, COVERED)
+        settings_override = override_settings(LEGACY_GAZETTEER_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_answered_from_index(self, mock_fetch):
+        response = self.client.post(
+            reverse("legacy_autocomplete"),
+            {"keyword": "tulum"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.json(), {"items": [PLACES[2]]})
+        self.assertIn("gazetteer", response["Server-Timing"])
+        mock_fetch.assert_not_called()
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_miss_goes_upstream(self, mock_fetch):
+        upstream = MagicMock(status_code=200)
+        upstream.json.return_value = {"items": [{"id": 9, "name": "Mérida"}]}
+        mock_fetch.return_value = upstream
+
+        response = self.client.post(
+            reverse("legacy_autocomplete"),
+            {"keyword": "merida"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.json(), {"items": [{"id": 9, "name": "Mérida"}]})
+        mock_fetch.assert_called_once_with("merida")
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_uncovered_keyword_goes_upstream(self, mock_fetch):
+        upstream = MagicMock(status_code=200)
+        upstream.json.return_value = {"items": [PLACES[1]]}
+        mock_fetch.return_value = upstream
+
+        self.client.post(
+            reverse("legacy_autocomplete"),
+            {"keyword": "riu"},
+            content_type="application/json",
+        )
+
+        mock_fetch.assert_called_once_with("riu")
+
+
+@override_settings(LEGACY_GAZETTEER_RATE=0)
+class SyncGazetteerCommandTests(GazetteerTestMixin, SimpleTestCase):
+    @patch("legacy_middleware.management.commands.sync_gazetteer.fetch_legacy_autocomplete")
+    def test_sync(self, mock_fetch):
+        upstream = MagicMock(status_code=200)
+        upstream.json.return_value = {"items": PLACES}
+        mock_fetch.return_value = upstream
+        out = StringIO()
+
+        call_command(
+            "sync_gazetteer", keywords=["cancun", "tulum"], path=self.path, stdout=out
+        )
+
+        self.assertIn("Indexed 3 places for 2 keywords", out.getvalue())
+        index = GazetteerIndex(self.path)
+        self.assertEqual(index.count, 3)
+        self.assertEqual(index.covered, {"cancun", "tulum"})
+
+    @patch("legacy_middleware.management.commands.sync_gazetteer.fetch_legacy_autocomplete")
+    def test_failed_keyword_keeps_snapshot(self, mock_fetch):
+        mock_fetch.side_effect = ValueError("upstream down")
+
+        with self.assertRaises(CommandError):
+            call_command("sync_gazetteer", keywords=["cancun"], path=self.path)
+
+        self.assertFalse(os.path.exists(self.path))
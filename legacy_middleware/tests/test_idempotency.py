@@ -0,0 +1,357 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import requests
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from legacy_middleware.async_views import AsyncReservationCreateProxyView
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.idempotency import claim_key, request_fingerprint
+from legacy_middleware.models import (
+    IdempotencyRecord,
+    LegacyAPIToken,
+    PaymentLinkJob,
+)
+from legacy_middleware.tokens import clear_token_cache
+
+PAYLOAD = {
+    "first_name": "John",
+    "email_address": "john@example.com",
+    "service_token": "valid_token_from_quote",
+    "payment_method": "cash",
+}
+
+
+def upstream_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    return response
+
+
+class IdempotentReservationCreateTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("legacy_reservation_create")
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def post(self, key="retry-1", payload=PAYLOAD):
+        return self.client.post(
+            self.url, payload, format="json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def processing_record(self, **kwargs):
+        now = timezone.now()
+        return IdempotencyRecord.objects.create(
+            endpoint="reservation_create",
+            key="retry-1",
+            request_hash=request_fingerprint(PAYLOAD),
+            locked_at=kwargs.pop("locked_at", now),
+            expires_at=kwargs.pop("expires_at", now + timedelta(days=1)),
+            **kwargs,
+        )
+
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_retry_replayed(self, mock_create, mock_payment):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/1"})
+        payload = {**PAYLOAD, "payment_method": "stripe"}
+
+        first = self.post(payload=payload)
+        retry = self.post(payload=payload)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertFalse(first.has_header("Idempotent-Replayed"))
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json(), {"payment_link": "https://pay/1"})
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        mock_create.assert_called_once()
+        mock_payment.assert_called_once()
+
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_keys_are_independent(self, mock_create):
+        mock_create.return_value = upstream_response(422, {"error": "Invalid email"})
+
+        self.post(key="a")
+        self.post(key="b")
+        replay = self.post(key="a")
+
+        self.assertEqual(replay.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(mock_create.call_count, 2)
+
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_key_reused_for_another_payload(self, mock_create):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        self.post(payload={**PAYLOAD, "first_name": "Jane"})
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        mock_create.assert_called_once()
+
+    def test_invalid_key(self):
+        response = self.post(key="x" * 256)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch("legacy_middleware.views.time.sleep")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_duplicate_waits_for_first(self, mock_create, mock_sleep):
+        record = self.processing_record()
+
+        def first_request_finishes(seconds):
+            record.status = IdempotencyRecord.COMPLETED
+            record.response_status = 200
+            record.response_body = {"reservation_id": "RES1"}
+            record.save()
+
+        mock_sleep.side_effect = first_request_finishes
+
+        response = self.post()
+
+        self.assertEqual(response.json(), {"reservation_id": "RES1"})
+        self.assertEqual(response["Idempotent-Replayed"], "true")
+        mock_sleep.assert_called_once()
+        mock_create.assert_not_called()
+
+    @override_settings(LEGACY_IDEMPOTENCY_WAIT=0)
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_duplicate_gives_up(self, mock_create):
+        self.processing_record()
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response["Retry-After"], "1")
+        mock_create.assert_not_called()
+
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_abandoned_request_taken_over(self, mock_create):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        self.processing_record(locked_at=timezone.now() - timedelta(minutes=10))
+
+        response = self.post(payload={**PAYLOAD, "first_name": "Jane"})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        response = self.post()
+        self.assertEqual(response.json(), {"reservation_id": "RES1"})
+        self.assertEqual(
+            IdempotencyRecord.objects.get().status, IdempotencyRecord.COMPLETED
+        )
+
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_expired_record_replaced(self, mock_create):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES2"})
+        self.processing_record(
+            status=IdempotencyRecord.COMPLETED,
+            response_status=200,
+            response_body={"reservation_id": "RES1"},
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+
+        response = self.post()
+
+        self.assertEqual(response.json(), {"reservation_id": "RES2"})
+        mock_create.assert_called_once()
+
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_unreachable_upstream_released(self, mock_create):
+        mock_create.side_effect = [
+            requests.ConnectionError(),
+            upstream_response(200, {"reservation_id": "RES1"}),
+        ]
+
+        failed = self.post()
+        retry = self.post()
+
+        self.assertEqual(failed.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(mock_create.call_count, 2)
+
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_payment_link_failure_kept(self, mock_create, mock_payment):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.side_effect = requests.ConnectionError()
+        payload = {**PAYLOAD, "payment_method": "paypal"}
+
+        self.post(payload=payload)
+        retry = self.post(payload=payload)
+
+        # The reservation exists, creating it again would duplicate it
+        self.assertEqual(retry.status_code, status.HTTP_502_BAD_GATEWAY)
+        mock_create.assert_called_once()
+        self.assertEqual(IdempotencyRecord.objects.get().reservation_id, "RES1")
+
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_payment_link_retried(self, mock_create, mock_payment):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.side_effect = requests.ConnectionError()
+        payload = {**PAYLOAD, "payment_method": "paypal"}
+
+        failed = self.post(payload=payload)
+        mock_payment.side_effect = None
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/1"})
+        payment_calls = mock_payment.call_count
+        retry = self.post(payload=payload)
+        replay = self.post(payload=payload)
+
+        self.assertEqual(failed.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(retry.json(), {"payment_link": "https://pay/1"})
+        self.assertEqual(mock_payment.call_args.kwargs["reservation_id"], "RES1")
+        self.assertEqual(replay.json(), {"payment_link": "https://pay/1"})
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        mock_create.assert_called_once()
+        self.assertEqual(mock_payment.call_count, payment_calls + 1)
+
+    @patch("legacy_middleware.views.start_payment_link_job")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_async_preference_headers_replayed(self, mock_create, mock_job):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_job.return_value = PaymentLinkJob.objects.create(
+            reservation_id="RES1", params={}
+        )
+        payload = {**PAYLOAD, "payment_method": "stripe"}
+
+        first = self.client.post(
+            self.url,
+            payload,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+            HTTP_PREFER="respond-async",
+        )
+        replay = self.client.post(
+            self.url,
+            payload,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+            HTTP_PREFER="respond-async",
+        )
+
+        self.assertEqual(replay.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(replay["Location"], first["Location"])
+        self.assertEqual(replay["Preference-Applied"], "respond-async")
+        mock_job.assert_called_once()
+
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_abandoned_after_creation_resumed(self, mock_create, mock_payment):
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/1"})
+        payload = {**PAYLOAD, "payment_method": "paypal"}
+        record = self.processing_record(
+            locked_at=timezone.now() - timedelta(minutes=10),
+            reservation_id="RES1",
+        )
+        record.request_hash = request_fingerprint(payload)
+        record.save()
+
+        response = self.post(payload=payload)
+
+        self.assertEqual(response.json(), {"payment_link": "https://pay/1"})
+        mock_create.assert_not_called()
+
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_without_key(self, mock_create):
+        mock_create.return_value = upstream_response(422, {"error": "Invalid"})
+
+        self.client.post(self.url, PAYLOAD, format="json")
+        self.client.post(self.url, PAYLOAD, format="json")
+
+        self.assertEqual(mock_create.call_count, 2)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+
+class IdempotencyStorageTests(TestCase):
+    def test_claim_once(self):
+        record, claimed = claim_key("reservation_create", "k", "hash")
+        again, claimed_again = claim_key("reservation_create", "k", "hash")
+
+        self.assertTrue(claimed)
+        self.assertFalse(claimed_again)
+        self.assertEqual(again.pk, record.pk)
+
+    def test_purge_command(self):
+        claim_key("reservation_create", "fresh", "hash")
+        expired, _ = claim_key("reservation_create", "expired", "hash")
+        IdempotencyRecord.objects.filter(pk=expired.pk).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        out = StringIO()
+
+        call_command("purge_idempotency_keys", stdout=out)
+
+        self.assertIn("Deleted 1", out.getvalue())
+        self.assertEqual(
+            list(IdempotencyRecord.objects.values_list("key", flat=True)), ["fresh"]
+        )
+
+
+class AsyncIdempotentReservationCreateTests(TestCase):
+    def setUp(self):
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    async def post(self, payload=None):
+        request = AsyncRequestFactory().post(
+            "/api/legacy/create/",
+            json.dumps(payload or {"payment_method": "cash"}),
+            content_type="application/json",
+            headers={"Idempotency-Key": "async-1"},
+        )
+        return await AsyncReservationCreateProxyView.as_view()(request)
+
+    @patch(
+        "legacy_middleware.async_views.afetch_reservation_create",
+        new_callable=AsyncMock,
+    )
+    async def test_retry_replayed(self, mock_create):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES9"})
+
+        await self.post()
+        retry = await self.post()
+
+        self.assertEqual(retry.data, {"reservation_id": "RES9"})
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        mock_create.assert_called_once()
+
+    @patch(
+        "legacy_middleware.async_views.afetch_payment_link", new_callable=AsyncMock
+    )
+    @patch(
+        "legacy_middleware.async_views.afetch_reservation_create",
+        new_callable=AsyncMock,
+    )
+    async def test_payment_link_retried(self, mock_create, mock_payment):
+        payload = {"payment_method": "paypal"}
+        now = timezone.now()
+        await IdempotencyRecord.objects.acreate(
+            endpoint="reservation_create",
+            key="async-1",
+            request_hash=request_fingerprint(payload),
+            status=IdempotencyRecord.COMPLETED,
+            response_status=502,
+            response_body={"error": "Failed to generate payment link"},
+            reservation_id="RES9",
+            expires_at=now + timedelta(days=1),
+        )
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/9"})
+
+        retry = await self.post(payload)
+
+        self.assertEqual(retry.data, {"payment_link": "https://pay/9"})
+        mock_create.assert_not_awaited()
@@ -0,0 +1,232 @@
+import json
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+import requests
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.cache import TieredCache, quote_cache
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.services import fetch_legacy_token, fetch_quote
+from legacy_middleware.singleflight import SingleFlight
+from legacy_middleware.tokens import clear_token_cache
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def mock_upstream_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    return response
+
+
+@override_settings(LEGACY_API_BASE_URL="http://test-api.com")
+class UpstreamCounterTests(TestCase):
+    def setUp(self):
+        reset_breakers()
+
+    @patch("legacy_middleware.services.requests.Session.post")
+    def test_status_counted_by_function(self, mock_post):
+        mock_post.return_value = mock_upstream_response(503, {})
+        before = sample(
+            "legacy_upstream_responses_total", function="fetch_quote", status="503"
+        )
+
+        fetch_quote("token", {})
+
+        after = sample(
+            "legacy_upstream_responses_total", function="fetch_quote", status="503"
+        )
+        self.assertEqual(after - before, 1)
+
+    @patch("legacy_middleware.services.requests.Session.post")
+    def test_errors_counted_by_type(self, mock_post):
+        mock_post.side_effect = requests.ConnectionError("Connection refused")
+        labels = {"function": "fetch_legacy_token", "status": "ConnectionError"}
+        before = sample("legacy_upstream_responses_total", **labels)
+
+        with self.assertRaises(requests.ConnectionError):
+            fetch_legacy_token()
+
+        self.assertEqual(sample("legacy_upstream_responses_total", **labels) - before, 1)
+
+
+class InternalCounterTests(TestCase):
+    def test_cache_events(self):
+        cache = TieredCache(
+            "metrics",
+            ttl_setting="LEGACY_AUTOCOMPLETE_CACHE_TTL",
+            max_entries_setting="LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES",
+        )
+        cache.clear()
+        events = ["misses", "sets", "local_hits"]
+        before = [
+            sample("legacy_cache_events_total", cache="metrics", event=event)
+            for event in events
+        ]
+
+        cache.get("hotel")
+        cache.set("hotel", {"items": []})
+        cache.get("hotel")
+
+        after = [
+            sample("legacy_cache_events_total", cache="metrics", event=event)
+            for event in events
+        ]
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 1, 1])
+        self.assertEqual(sample("legacy_cache_local_entries", cache="metrics"), 1)
+
+    def test_singleflight_calls(self):
+        flight = SingleFlight("metrics")
+        labels = {"flight": "metrics", "outcome": "leaders"}
+        before = sample("legacy_singleflight_calls_total", **labels)
+
+        flight.do("hotel", lambda: 1)
+
+        self.assertEqual(sample("legacy_singleflight_calls_total", **labels) - before, 1)
+        self.assertEqual(sample("legacy_singleflight_in_flight", flight="metrics"), 0)
+
+
+class StageLatencyTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_stages_observed(self, mock_quote):
+        mock_quote.return_value = mock_upstream_response(
+            200, {"items": [], "places": {}}
+        )
+        stages = ["token", "upstream", "json_parse", "validation"]
+        route = "api/legacy/quote/"
+
+        def counts():
+            return [
+                sample(
+                    "legacy_proxy_stage_duration_seconds_count", route=route, stage=stage
+                )
+                for stage in stages
+            ] + [
+                sample(
+                    "http_request_duration_seconds_count", route=route, method="POST"
+                )
+            ]
+
+        before = counts()
+        response = self.client.post(
+            "/api/legacy/quote/", {"passengers": 2}, content_type="application/json"
+        )
+        after = counts()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([b - a for a, b in zip(before, after)], [1] * 5)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_requires_staff(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        user = User.objects.create_user(username="visitor", password="pass")
+        token = Token.objects.create(user=user)
+        response = self.client.get(
+            "/metrics", HTTP_AUTHORIZATION=f"Token {token.key}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_exposition_format(self):
+        user = User.objects.create_superuser(username="admin", password="pass")
+        token = Token.objects.create(user=user)
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(b"legacy_upstream_responses_total", response.content)
+        self.assertIn(b"# TYPE http_request_duration_seconds histogram", response.content)
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def post_quote(self):
+        return self.client.post(
+            "/api/legacy/quote/", {"passengers": 2}, content_type="application/json"
+        )
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_header_lists_every_stage(self, mock_quote):
+        mock_quote.__name__ = "fetch_quote"
+        mock_quote.return_value = mock_upstream_response(
+            200, {"items": [], "places": {}}
+        )
+
+        with self.assertLogs("legacy_middleware.views", "DEBUG") as logs:
+            response = self.post_quote()
+
+        spans = [span.split(";")[0] for span in response["Server-Timing"].split(", ")]
+        self.assertEqual(
+            spans, ["token", "upstream", "json_parse", "validation", "serialization"]
+        )
+        self.assertIn('upstream;dur=', response["Server-Timing"])
+        self.assertIn('desc="fetch_quote"', response["Server-Timing"])
+
+        record = json.loads(logs.records[0].args[0])
+        self.assertEqual(record["route"], "api/legacy/quote/")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(len(record["spans"]), 5)
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_no_timing_log_at_info(self, mock_quote):
+        mock_quote.return_value = mock_upstream_response(
+            200, {"items": [], "places": {}}
+        )
+
+        with self.assertNoLogs("legacy_middleware.views", "INFO"):
+            response = self.post_quote()
+
+        self.assertIn("Server-Timing", response)
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_token_refresh_span(self, mock_quote, mock_oauth):
+        mock_oauth.return_value = ("fresh_token", timezone.now() + timedelta(hours=1))
+        mock_quote.side_effect = [
+            mock_upstream_response(401, {}),
+            mock_upstream_response(200, {"items": [], "places": {}}),
+        ]
+
+        response = self.post_quote()
+
+        self.assertIn("token_refresh;dur=", response["Server-Timing"])
+        self.assertEqual(response["Server-Timing"].count("upstream;dur="), 2)
+
+    @override_settings(LEGACY_SERVER_TIMING=False)
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_disabled(self, mock_quote):
+        mock_quote.return_value = mock_upstream_response(
+            200, {"items": [], "places": {}}
+        )
+
+        response = self.post_quote()
+
+        self.assertFalse(response.has_header("Server-Timing"))
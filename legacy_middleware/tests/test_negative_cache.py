@@ -0,0 +1,163 @@
+import json
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.cache import (
+    autocomplete_cache,
+    negative_cache_ttl,
+    negative_code,
+    quote_cache,
+)
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.passthrough import RawJSON
+from legacy_middleware.tokens import clear_token_cache
+
+NO_AVAILABILITY = {"error": {"code": "no_availability", "message": "Sold out"}}
+QUOTED = {"items": [{"id": 1, "price": 45.0}], "places": {}}
+TTLS = {"no_availability": 300, "empty": 120, "*": 30}
+
+
+def upstream_response(data):
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = data
+    return response
+
+
+def later(seconds):
+    return patch(
+        "legacy_middleware.cache.time.time", return_value=time.time() + seconds
+    )
+
+
+@override_settings(LEGACY_NEGATIVE_CACHE_TTLS=TTLS)
+class NegativeCodeTests(SimpleTestCase):
+    def test_codes(self):
+        self.assertEqual(negative_code(NO_AVAILABILITY), "no_availability")
+        self.assertEqual(negative_code({"error": "keyword too short"}), "error")
+        self.assertEqual(negative_code({"items": []}), "empty")
+        self.assertIsNone(negative_code(QUOTED))
+        self.assertIsNone(negative_code([]))
+
+    def test_raw_json(self):
+        self.assertEqual(
+            negative_code(RawJSON(json.dumps(NO_AVAILABILITY).encode())),
+            "no_availability",
+        )
+        self.assertEqual(negative_code(RawJSON(b'{"items": []}')), "empty")
+        self.assertIsNone(negative_code(RawJSON(json.dumps(QUOTED).encode())))
+
+    def test_ttls(self):
+        self.assertEqual(negative_cache_ttl(NO_AVAILABILITY), 300)
+        self.assertEqual(negative_cache_ttl({"items": []}), 120)
+        self.assertEqual(negative_cache_ttl({"error": {"code": "bad_date"}}), 30)
+        self.assertIsNone(negative_cache_ttl(QUOTED))
+
+    @override_settings(LEGACY_NEGATIVE_CACHE_TTLS={"empty": 120})
+    def test_unlisted_code_not_cached(self):
+        self.assertEqual(negative_cache_ttl(NO_AVAILABILITY), 0)
+
+
+@override_settings(LEGACY_QUOTE_CACHE_GRACE=30, LEGACY_QUOTE_CACHE_STALE_IF_ERROR=600)
+class NegativeEntryTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+
+    def test_never_served_stale(self):
+        quote_cache.set("sold-out", NO_AVAILABILITY, ttl=10, negative=True)
+
+        with later(15):
+            self.assertEqual(quote_cache.lookup("sold-out"), (None, None))
+
+    def test_clear_negative_keeps_quotes(self):
+        negative_sets = quote_cache.stats()["negative_sets"]
+        quote_cache.set("sold-out", NO_AVAILABILITY, ttl=10, negative=True)
+        quote_cache.set("quoted", QUOTED)
+
+        quote_cache.clear_negative()
+
+        self.assertIsNone(quote_cache.get("sold-out"))
+        self.assertEqual(quote_cache.get("quoted"), QUOTED)
+        self.assertEqual(quote_cache.stats()["negative_sets"], negative_sets + 1)
+
+
+@override_settings(LEGACY_NEGATIVE_CACHE_TTLS=TTLS, LEGACY_QUOTE_CACHE_TTL=60)
+class NegativeCacheViewTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+        autocomplete_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def post_quote(self):
+        return self.client.post(
+            reverse("legacy_quote"), {"passengers": 3}, content_type="application/json"
+        )
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_no_availability_cached(self, mock_quote):
+        mock_quote.return_value = upstream_response(NO_AVAILABILITY)
+
+        self.post_quote()
+        response = self.post_quote()
+
+        self.assertEqual(response["X-Cache-Status"], "HIT")
+        self.assertEqual(response.json(), NO_AVAILABILITY)
+        mock_quote.assert_called_once()
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_per_code_ttl(self, mock_quote):
+        mock_quote.return_value = upstream_response({"error": {"code": "bad_date"}})
+
+        self.post_quote()
+        with later(31):
+            response = self.post_quote()
+
+        # Past the "*" TTL, well within LEGACY_QUOTE_CACHE_TTL
+        self.assertEqual(response["X-Cache-Status"], "MISS")
+        self.assertEqual(mock_quote.call_count, 2)
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_empty_autocomplete_cached(self, mock_fetch):
+        mock_fetch.return_value = upstream_response({"items": []})
+
+        for _ in range(2):
+            self.client.post(
+                reverse("legacy_autocomplete"),
+                {"keyword": "xyzzy"},
+                content_type="application/json",
+            )
+
+        mock_fetch.assert_called_once()
+        with later(121):
+            self.assertIsNone(autocomplete_cache.get("xyzzy"))
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_admin_flush(self, mock_quote):
+        mock_quote.return_value = upstream_response(NO_AVAILABILITY)
+        self.post_quote()
+        url = reverse("legacy_flush_negative_cache")
+
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(mock_quote.call_count, 1)
+        self.assertEqual(self.post_quote()["X-Cache-Status"], "HIT")
+
+        user = User.objects.create_superuser(username="admin", password="pass")
+        self.client.force_login(user)
+        response = self.client.post(url)
+
+        self.assertRedirects(
+            response, reverse("admin:index"), fetch_redirect_response=False
+        )
+        self.assertEqual(self.post_quote()["X-Cache-Status"], "MISS")
+        self.assertEqual(mock_quote.call_count, 2)
@@ -0,0 +1,211 @@
+import json
+import pickle
+from datetime import timedelta
+from unittest.mock import patch
+
+import httpx
+import requests
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from legacy_middleware.async_views import AsyncQuoteProxyView
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.cache import autocomplete_cache, quote_cache
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.passthrough import RawJSON, peek_top_level
+from legacy_middleware.tokens import clear_token_cache
+
+
+def upstream_response(status_code, body, content_type="application/json; charset=utf-8"):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers["Content-Type"] = content_type
+    return response
+
+
+QUOTE_BODY = b'{"items": [{"id": 1, "name": "Caf\xc3\xa9 SUV"}], "places": {"from": "CUN"}}'
+
+
+class PeekTopLevelTests(SimpleTestCase):
+    def test_nested_values_replaced(self):
+        self.assertEqual(
+            peek_top_level(QUOTE_BODY), {"items": [], "places": {}}
+        )
+
+    def test_scalars_kept(self):
+        self.assertEqual(
+            peek_top_level(b'{"error": "no_availability", "code": 3}'),
+            {"error": "no_availability", "code": 3},
+        )
+
+    def test_invalid_json(self):
+        with self.assertRaises(ValueError):
+            peek_top_level(b"<html>")
+
+    def test_raw_json_pickles(self):
+        raw = RawJSON(QUOTE_BODY, "application/json", {"items": []})
+        restored = pickle.loads(pickle.dumps(raw))
+        self.assertEqual(restored.content, QUOTE_BODY)
+        self.assertIn("items", restored)
+
+
+@override_settings(LEGACY_PASSTHROUGH_ENDPOINTS=["autocomplete", "quote"])
+class PassthroughViewTests(TestCase):
+    def setUp(self):
+        autocomplete_cache.clear()
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type="application/json")
+
+    @patch("legacy_middleware.views.fetch_legacy_autocomplete")
+    def test_autocomplete_bytes_untouched(self, mock_fetch):
+        body = b'{"items":[{"name":"Canc\xc3\xban"}],"extra":  1}'
+        mock_fetch.return_value = upstream_response(200, body)
+
+        response = self.post("/api/legacy/autocomplete/", {"keyword": "cancun"})
+        cached = self.post("/api/legacy/autocomplete/", {"keyword": "Cancún "})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, body)
+        self.assertEqual(response["Content-Type"], "application/json; charset=utf-8")
+        self.assertEqual(cached.content, body)
+        mock_fetch.assert_called_once()
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_validated_and_cached(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(200, QUOTE_BODY)
+
+        response = self.post("/api/legacy/quote/", {"passengers": 2})
+        cached = self.post("/api/legacy/quote/", {"passengers": 2})
+
+        self.assertEqual(response.content, QUOTE_BODY)
+        self.assertEqual(response["X-Cache-Status"], "MISS")
+        self.assertEqual(cached.content, QUOTE_BODY)
+        self.assertEqual(cached["X-Cache-Status"], "HIT")
+        self.assertIn("validation;dur=", response["Server-Timing"])
+        self.assertNotIn("serialization", response["Server-Timing"])
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_malformed(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(200, b'{"places": {}}')
+
+        response = self.post("/api/legacy/quote/", {})
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertIn("malformed", response.json()["error"])
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_invalid_json(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(200, b"<html>oops</html>")
+
+        response = self.post("/api/legacy/quote/", {})
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(response.json(), {"error": "Invalid JSON from upstream"})
+
+    @override_settings(LEGACY_NEGATIVE_CACHE_TTLS={})
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_application_error_not_cached(self, mock_fetch):
+        body = b'{"error": "no_availability"}'
+        mock_fetch.return_value = upstream_response(200, body)
+
+        self.post("/api/legacy/quote/", {})
+        response = self.post("/api/legacy/quote/", {})
+
+        self.assertEqual(response.content, body)
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    @override_settings(LEGACY_NEGATIVE_CACHE_TTLS={"*": 60})
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_application_error_cached_briefly(self, mock_fetch):
+        body = b'{"error": "no_availability"}'
+        mock_fetch.return_value = upstream_response(200, body)
+
+        self.post("/api/legacy/quote/", {})
+        response = self.post("/api/legacy/quote/", {})
+
+        self.assertEqual(response.content, body)
+        self.assertEqual(response["X-Cache-Status"], "HIT")
+        mock_fetch.assert_called_once()
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_upstream_errors_still_mapped(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(503, b'{"message": "down"}')
+
+        response = self.post("/api/legacy/quote/", {})
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(response.json(), {"error": "Upstream service unavailable"})
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_unprocessable_passed_through(self, mock_fetch):
+        body = json.dumps({"errors": {"pickup": ["required"]}}).encode()
+        mock_fetch.return_value = upstream_response(422, body)
+
+        response = self.post("/api/legacy/quote/", {})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.content, body)
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_html_client_error_mapped(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(
+            404, b"<html>Not Found</html>", content_type="text/html"
+        )
+
+        response = self.post("/api/legacy/quote/", {})
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(response.json(), {"error": "Invalid JSON from upstream"})
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_batch_embeds_body(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(200, QUOTE_BODY)
+
+        response = self.post("/api/legacy/quote/batch/", {"quotes": [{}]})
+
+        self.assertEqual(
+            response.json()["results"][0]["data"], json.loads(QUOTE_BODY)
+        )
+
+    @override_settings(LEGACY_PASSTHROUGH_ENDPOINTS=[])
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_parse_mode(self, mock_fetch):
+        mock_fetch.return_value = upstream_response(200, QUOTE_BODY)
+
+        response = self.post("/api/legacy/quote/", {})
+
+        self.assertEqual(response.data, json.loads(QUOTE_BODY))
+        self.assertIn("serialization;dur=", response["Server-Timing"])
+
+
+@override_settings(LEGACY_PASSTHROUGH_ENDPOINTS=["quote"])
+class AsyncPassthroughViewTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+        clear_token_cache()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    @patch("legacy_middleware.async_views.afetch_quote")
+    async def test_quote_bytes_untouched(self, mock_fetch):
+        mock_fetch.return_value = httpx.Response(
+            200, content=QUOTE_BODY, headers={"Content-Type": "application/json"}
+        )
+        request = AsyncRequestFactory().post(
+            "/api/legacy/quote/", "{}", content_type="application/json"
+        )
+
+        response = await AsyncQuoteProxyView.as_view()(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, QUOTE_BODY)
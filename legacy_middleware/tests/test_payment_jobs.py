@@ -0,0 +1,216 @@
+import json
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import requests
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from legacy_middleware.async_views import (
+    AsyncPaymentLinkJobView,
+    AsyncReservationCreateProxyView,
+)
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.models import LegacyAPIToken, PaymentLinkJob
+from legacy_middleware.payment_jobs import (
+    FAILED_ERROR,
+    claim_job,
+    run_payment_link_job,
+)
+from legacy_middleware.tokens import clear_token_cache
+
+PAYLOAD = {
+    "first_name": "John",
+    "payment_method": "paypal",
+    "success_url": "https://example.com/thanks",
+}
+
+
+def upstream_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(response=response)
+    return response
+
+
+class PaymentLinkJobTests(APITestCase):
+    def setUp(self):
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def create(self, prefer="respond-async"):
+        return self.client.post(
+            reverse("legacy_reservation_create"),
+            PAYLOAD,
+            format="json",
+            HTTP_PREFER=prefer,
+        )
+
+    def job_status(self, job_id, query=""):
+        return self.client.get(
+            reverse("legacy_payment_link_job", args=[job_id]) + query
+        )
+
+    @patch("legacy_middleware.payment_jobs.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_link_made_in_background(self, mock_create, mock_payment):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/1"})
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.create()
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response["Preference-Applied"], "respond-async")
+        self.assertEqual(response.data["reservation_id"], "RES1")
+        job = response.data["payment_link_job"]
+        self.assertEqual(job["status"], PaymentLinkJob.PENDING)
+        self.assertEqual(response["Location"], job["status_url"])
+        mock_payment.assert_not_called()
+
+        pending = self.job_status(job["id"])
+        self.assertEqual(pending.data["status"], PaymentLinkJob.PENDING)
+        self.assertEqual(pending["Retry-After"], "1")
+
+        self.assertEqual(len(callbacks), 1)
+        run_payment_link_job(job["id"])
+
+        done = self.job_status(job["id"])
+        self.assertEqual(done.data["status"], PaymentLinkJob.SUCCEEDED)
+        self.assertEqual(done.data["payment_link"], "https://pay/1")
+        self.assertFalse(done.has_header("Retry-After"))
+        kwargs = mock_payment.call_args.kwargs
+        self.assertEqual(kwargs["token"], "valid_token")
+        self.assertEqual(kwargs["reservation_id"], "RES1")
+        self.assertEqual(kwargs["success_url"], "/thanks")
+
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_inline_without_preference(self, mock_create, mock_payment):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/1"})
+
+        response = self.create(prefer="return=minimal")
+
+        self.assertEqual(response.data, {"payment_link": "https://pay/1"})
+        self.assertFalse(PaymentLinkJob.objects.exists())
+
+    @patch("legacy_middleware.pipeline.time.sleep")
+    @patch("legacy_middleware.payment_jobs.fetch_payment_link")
+    def test_failed_job(self, mock_payment, mock_sleep):
+        mock_payment.return_value = upstream_response(503, {})
+        job = PaymentLinkJob.objects.create(reservation_id="RES1", params={})
+
+        run_payment_link_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, PaymentLinkJob.FAILED)
+        self.assertEqual(job.error, FAILED_ERROR)
+        self.assertIsNotNone(job.completed_at)
+
+    @patch("legacy_middleware.views.time.sleep")
+    def test_long_poll(self, mock_sleep):
+        job = PaymentLinkJob.objects.create(reservation_id="RES1", params={})
+
+        def job_finishes(seconds):
+            PaymentLinkJob.objects.filter(pk=job.pk).update(
+                status=PaymentLinkJob.SUCCEEDED, payment_link="https://pay/1"
+            )
+
+        mock_sleep.side_effect = job_finishes
+
+        response = self.job_status(job.pk, "?wait=10")
+
+        self.assertEqual(response.data["payment_link"], "https://pay/1")
+        mock_sleep.assert_called_once()
+
+    def test_unknown_job(self):
+        response = self.job_status(uuid.uuid4())
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PaymentLinkJobStorageTests(TestCase):
+    @override_settings(LEGACY_PAYMENT_LINK_JOB_LOCK_TTL=120)
+    def test_claim_once(self):
+        job = PaymentLinkJob.objects.create(reservation_id="RES1", params={})
+
+        self.assertTrue(claim_job(job.pk))
+        self.assertFalse(claim_job(job.pk))
+
+        # Left running by a dead worker
+        PaymentLinkJob.objects.filter(pk=job.pk).update(
+            started_at=timezone.now() - timedelta(minutes=5)
+        )
+        self.assertTrue(claim_job(job.pk))
+
+    @patch("legacy_middleware.payment_jobs.get_cached_token")
+    @patch("legacy_middleware.payment_jobs.fetch_payment_link")
+    def test_process_command(self, mock_payment, mock_token):
+        mock_token.return_value = MagicMock(token="valid_token")
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/1"})
+        lost = PaymentLinkJob.objects.create(reservation_id="RES1", params={})
+        expired = PaymentLinkJob.objects.create(
+            reservation_id="RES2", params={}, status=PaymentLinkJob.SUCCEEDED
+        )
+        PaymentLinkJob.objects.filter(pk=lost.pk).update(
+            created_at=timezone.now() - timedelta(minutes=1)
+        )
+        PaymentLinkJob.objects.filter(pk=expired.pk).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        out = StringIO()
+
+        call_command("process_payment_link_jobs", stdout=out)
+
+        self.assertIn("Ran 1 stale", out.getvalue())
+        self.assertIn("deleted 1 expired", out.getvalue())
+        lost.refresh_from_db()
+        self.assertEqual(lost.payment_link, "https://pay/1")
+
+
+class AsyncPaymentLinkJobTests(TestCase):
+    def setUp(self):
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    @patch("legacy_middleware.async_views.afetch_payment_link", new_callable=AsyncMock)
+    @patch(
+        "legacy_middleware.async_views.afetch_reservation_create",
+        new_callable=AsyncMock,
+    )
+    async def test_link_made_in_background(self, mock_create, mock_payment):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES9"})
+        factory = AsyncRequestFactory()
+        request = factory.post(
+            "/api/legacy/create/",
+            json.dumps(PAYLOAD),
+            content_type="application/json",
+            headers={"Prefer": "respond-async, wait=5"},
+        )
+
+        response = await AsyncReservationCreateProxyView.as_view()(request)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        mock_payment.assert_not_called()
+        job_id = response.data["payment_link_job"]["id"]
+
+        status_response = await AsyncPaymentLinkJobView.as_view()(
+            factory.get(f"/api/legacy/payment-link/{job_id}/"), job_id=job_id
+        )
+        self.assertEqual(status_response.data["reservation_id"], "RES9")
+        self.assertEqual(status_response.data["status"], PaymentLinkJob.PENDING)
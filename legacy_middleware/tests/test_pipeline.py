@@ -0,0 +1,282 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.test import (
+    AsyncRequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from legacy_middleware.async_views import AsyncReservationCreateProxyView
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.pipeline import BudgetExceeded, ReservationPipeline
+from legacy_middleware.tokens import (
+    TOKEN_REFRESH_LOCK_KEY,
+    clear_token_cache,
+    get_cached_token,
+)
+
+STRIPE_PAYLOAD = {"first_name": "John", "payment_method": "stripe"}
+
+
+def upstream_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(response=response)
+    return response
+
+
+@override_settings(LEGACY_PAYMENT_LINK_RETRIES=2, LEGACY_PAYMENT_LINK_BACKOFF=0.25)
+class ReservationPipelineTests(SimpleTestCase):
+    def test_timeout_capped_by_budget(self):
+        self.assertEqual(ReservationPipeline(budget=60).timeout(), 10)
+        self.assertLessEqual(ReservationPipeline(budget=3).timeout(), 3)
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(BudgetExceeded):
+            ReservationPipeline(budget=0.1).timeout()
+
+    def test_retry_delays(self):
+        self.assertEqual(list(ReservationPipeline(budget=25).retry_delays()), [0.25, 0.5])
+        # The second retry would not fit
+        self.assertEqual(list(ReservationPipeline(budget=1).retry_delays()), [0.25])
+
+
+class ReservationPipelineViewTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("legacy_reservation_create")
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def post(self):
+        return self.client.post(self.url, STRIPE_PAYLOAD, format="json")
+
+    @patch("legacy_middleware.views.get_cached_token", wraps=get_cached_token)
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_single_token_and_timeouts(self, mock_create, mock_payment, mock_token):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/1"})
+
+        response = self.post()
+
+        self.assertEqual(response.data, {"payment_link": "https://pay/1"})
+        mock_token.assert_called_once()
+        self.assertEqual(mock_payment.call_args.kwargs["token"], "valid_token")
+        self.assertLessEqual(mock_create.call_args.kwargs["timeout"], 10)
+        self.assertLessEqual(mock_payment.call_args.kwargs["timeout"], 10)
+        self.assertIn("fetch_payment_link", response["Server-Timing"])
+
+    @patch("legacy_middleware.pipeline.time.sleep")
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_payment_link_retried(self, mock_create, mock_payment, mock_sleep):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.side_effect = [
+            requests.ConnectionError(),
+            upstream_response(503, {}),
+            upstream_response(200, {"url": "https://pay/1"}),
+        ]
+
+        response = self.post()
+
+        self.assertEqual(response.data, {"payment_link": "https://pay/1"})
+        self.assertEqual(mock_payment.call_count, 3)
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [0.25, 0.5])
+        mock_create.assert_called_once()
+        self.assertIn('desc="fetch_payment_link retry 2"', response["Server-Timing"])
+
+    @patch("legacy_middleware.pipeline.time.sleep")
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_payment_link_retries_exhausted(
+        self, mock_create, mock_payment, mock_sleep
+    ):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.return_value = upstream_response(502, {})
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(mock_payment.call_count, 3)
+
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_client_errors_not_retried(self, mock_create, mock_payment):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.return_value = upstream_response(404, {})
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        mock_payment.assert_called_once()
+
+    @override_settings(LEGACY_RESERVATION_BUDGET=1)
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_budget_spent_by_create(self, mock_create, mock_payment):
+        def slow_create(token, payload, timeout):
+            time.sleep(0.6)
+            return upstream_response(200, {"reservation_id": "RES1"})
+
+        mock_create.side_effect = slow_create
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        mock_payment.assert_not_called()
+
+    @override_settings(LEGACY_RESERVATION_BUDGET=1, LEGACY_PAYMENT_LINK_RETRIES=0)
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_slow_read_spends_budget(self, mock_create, mock_payment):
+        def trickling_payment_link(token, timeout, **kwargs):
+            # Each read is within the timeout, the whole call is not
+            time.sleep(0.7)
+            return upstream_response(503, {})
+
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.side_effect = trickling_payment_link
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        mock_payment.assert_called_once()
+
+    @override_settings(LEGACY_RESERVATION_BUDGET=3)
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_token_refresh_within_budget(self, mock_create, mock_payment, mock_oauth):
+        mock_create.side_effect = [
+            upstream_response(401, {}),
+            upstream_response(200, {"reservation_id": "RES1"}),
+        ]
+        mock_payment.return_value = upstream_response(200, {"url": "https://pay/1"})
+        mock_oauth.return_value = ("new_token", timezone.now() + timedelta(hours=1))
+
+        response = self.post()
+
+        self.assertEqual(response.data, {"payment_link": "https://pay/1"})
+        self.assertLessEqual(mock_oauth.call_args.kwargs["timeout"], 3)
+        self.assertEqual(mock_payment.call_args.kwargs["token"], "new_token")
+
+    @override_settings(
+        LEGACY_RESERVATION_BUDGET=1, LEGACY_TOKEN_REFRESH_POLL_INTERVAL=0.05
+    )
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch("legacy_middleware.views.fetch_payment_link")
+    @patch("legacy_middleware.views.fetch_reservation_create")
+    def test_token_refresh_wait_spends_budget(
+        self, mock_create, mock_payment, mock_oauth
+    ):
+        mock_create.return_value = upstream_response(401, {})
+        # Another worker holds the refresh lock and never finishes
+        shared = caches[settings.LEGACY_CACHE_ALIAS]
+        shared.set(TOKEN_REFRESH_LOCK_KEY, 1)
+        self.addCleanup(shared.delete, TOKEN_REFRESH_LOCK_KEY)
+
+        started = time.monotonic()
+        response = self.post()
+
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertLess(time.monotonic() - started, 2)
+        mock_oauth.assert_not_called()
+        mock_create.assert_called_once()
+
+
+class AsyncReservationPipelineTests(TestCase):
+    def setUp(self):
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    @patch("legacy_middleware.pipeline.asyncio.sleep", new_callable=AsyncMock)
+    @patch("legacy_middleware.async_views.afetch_payment_link", new_callable=AsyncMock)
+    @patch(
+        "legacy_middleware.async_views.afetch_reservation_create",
+        new_callable=AsyncMock,
+    )
+    async def test_payment_link_retried(self, mock_create, mock_payment, mock_sleep):
+        mock_create.return_value = upstream_response(200, {"reservation_id": "RES1"})
+        mock_payment.side_effect = [
+            httpx.ConnectError("refused"),
+            upstream_response(200, {"url": "https://pay/1"}),
+        ]
+        request = AsyncRequestFactory().post(
+            "/api/legacy/create/",
+            json.dumps(STRIPE_PAYLOAD),
+            content_type="application/json",
+        )
+
+        response = await AsyncReservationCreateProxyView.as_view()(request)
+
+        self.assertEqual(response.data, {"payment_link": "https://pay/1"})
+        self.assertEqual(mock_payment.call_count, 2)
+        mock_sleep.assert_awaited_once_with(0.25)
+        self.assertIn("timeout", mock_create.call_args.kwargs)
+
+    @override_settings(
+        LEGACY_RESERVATION_BUDGET=1, LEGACY_TOKEN_REFRESH_POLL_INTERVAL=0.05
+    )
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch(
+        "legacy_middleware.async_views.afetch_reservation_create",
+        new_callable=AsyncMock,
+    )
+    async def test_token_refresh_wait_spends_budget(self, mock_create, mock_oauth):
+        mock_create.return_value = upstream_response(401, {})
+        shared = caches[settings.LEGACY_CACHE_ALIAS]
+        await shared.aset(TOKEN_REFRESH_LOCK_KEY, 1)
+        self.addCleanup(shared.delete, TOKEN_REFRESH_LOCK_KEY)
+        request = AsyncRequestFactory().post(
+            "/api/legacy/create/",
+            json.dumps(STRIPE_PAYLOAD),
+            content_type="application/json",
+        )
+
+        response = await AsyncReservationCreateProxyView.as_view()(request)
+
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        mock_oauth.assert_not_called()
+
+    @override_settings(LEGACY_RESERVATION_BUDGET=1)
+    @patch("legacy_middleware.async_views.afetch_payment_link", new_callable=AsyncMock)
+    @patch("legacy_middleware.async_views.afetch_reservation_create")
+    async def test_slow_create_cancelled_at_deadline(self, mock_create, mock_payment):
+        async def trickling_create(token, payload, timeout):
+            await asyncio.sleep(5)
+
+        mock_create.side_effect = trickling_create
+        request = AsyncRequestFactory().post(
+            "/api/legacy/create/",
+            json.dumps(STRIPE_PAYLOAD),
+            content_type="application/json",
+        )
+
+        started = time.monotonic()
+        response = await AsyncReservationCreateProxyView.as_view()(request)
+
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertLess(time.monotonic() - started, 2)
+        mock_payment.assert_not_awaited()
@@ -0,0 +1,255 @@
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from legacy_middleware.breaker import CircuitOpenError, reset_breakers
+from legacy_middleware.cache import GRACE, canonical_quote_key, quote_cache
+from legacy_middleware.models import LegacyAPIToken, QuoteRouteDemand
+from legacy_middleware.prewarm import (
+    RouteDemandRecorder,
+    prewarm_quotes,
+    route_template,
+    start_quote_prewarmer,
+)
+from legacy_middleware.tokens import clear_token_cache
+
+QUOTE = {
+    "type": "one-way",
+    "passengers": 2,
+    "start": {"lat": 21.0365, "lng": -86.8771, "pickup": "2026-11-02 10:00"},
+    "end": {"lat": 21.1403, "lng": -86.7807},
+}
+
+QUOTED = {"items": [{"id": 1, "price": 45.0}], "places": {}}
+
+
+def quote_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    return response
+
+
+def at_pickup(payload, pickup):
+    return {**payload, "start": {**payload["start"], "pickup": pickup}}
+
+
+def demand(payload, requests):
+    template = route_template(payload)
+    return QuoteRouteDemand.objects.create(
+        route_key=canonical_quote_key(template),
+        template=template,
+        requests=requests,
+        last_requested_at=timezone.now(),
+    )
+
+
+class RouteTemplateTests(TestCase):
+    def test_same_trip_other_day_same_route(self):
+        later = at_pickup(QUOTE, "2026-11-20T10:00:00")
+
+        self.assertEqual(route_template(QUOTE), route_template(later))
+        self.assertEqual(route_template(QUOTE)["start"]["pickup"], "2000-01-01 10:00")
+
+    def test_other_time_other_route(self):
+        evening = at_pickup(QUOTE, "2026-11-02 18:00")
+
+        self.assertNotEqual(route_template(QUOTE), route_template(evening))
+
+    def test_return_keeps_its_distance(self):
+        round_trip = {
+            **QUOTE,
+            "end": {**QUOTE["end"], "pickup": "2026-11-05 18:30"},
+        }
+
+        self.assertEqual(
+            route_template(round_trip)["end"]["pickup"], "2000-01-04 18:30"
+        )
+
+    def test_without_pickup(self):
+        self.assertIsNone(route_template({"passengers": 2}))
+        self.assertIsNone(route_template(at_pickup(QUOTE, "tomorrow")))
+
+
+@override_settings(LEGACY_QUOTE_DEMAND_FLUSH_INTERVAL=0)
+class RouteDemandRecorderTests(TestCase):
+    def test_counts_written(self):
+        recorder = RouteDemandRecorder()
+
+        recorder.record(QUOTE)
+        recorder.record(at_pickup(QUOTE, "2026-11-03 10:00"))
+        recorder.record({"passengers": 2})
+
+        route = QuoteRouteDemand.objects.get()
+        self.assertEqual(route.requests, 2)
+        self.assertEqual(route.template, route_template(QUOTE))
+
+    @patch("legacy_middleware.views.route_demand", new_callable=RouteDemandRecorder)
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_quote_view_records(self, mock_quote, mock_recorder):
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        mock_quote.return_value = quote_response(200, QUOTED)
+
+        self.client.post(
+            reverse("legacy_quote"), QUOTE, content_type="application/json"
+        )
+
+        self.assertEqual(QuoteRouteDemand.objects.get().requests, 1)
+
+    @override_settings(LEGACY_QUOTE_PREWARM_ROUTES=0)
+    def test_disabled(self):
+        RouteDemandRecorder().record(QUOTE)
+
+        self.assertFalse(QuoteRouteDemand.objects.exists())
+
+
+@override_settings(
+    LEGACY_QUOTE_CACHE_TTL=60,
+    LEGACY_QUOTE_CACHE_GRACE=30,
+    LEGACY_QUOTE_CACHE_STALE_IF_ERROR=0,
+    LEGACY_QUOTE_PREWARM_RATE=2,
+    LEGACY_QUOTE_PREWARM_MAX_REQUESTS=100,
+)
+@patch("legacy_middleware.prewarm.time.sleep")
+class PrewarmQuotesTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        self.morning = demand(QUOTE, requests=5)
+        self.afternoon = demand(at_pickup(QUOTE, "2026-11-02 14:00"), requests=1)
+        # At noon the morning pickup of today is already past
+        now = timezone.make_aware(datetime(2026, 11, 2, 12, 0))
+        clock = [
+            patch("django.utils.timezone.localdate", return_value=now.date()),
+            patch("django.utils.timezone.localtime", return_value=now),
+        ]
+        for patcher in clock:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch("legacy_middleware.prewarm.fetch_quote")
+    def test_popular_routes_warmed(self, mock_quote, mock_sleep):
+        mock_quote.return_value = quote_response(200, QUOTED)
+
+        result = prewarm_quotes(days=2)
+
+        self.assertEqual(result, {"routes": 2, "warmed": 3, "failed": 0, "skipped": 0})
+        pickups = [
+            call.args[1]["start"]["pickup"] for call in mock_quote.call_args_list
+        ]
+        self.assertEqual(
+            pickups, ["2026-11-02 14:00", "2026-11-03 10:00", "2026-11-03 14:00"]
+        )
+        self.assertEqual(mock_quote.call_args.args[0], "valid_token")
+        # Calls are spaced by 1 / LEGACY_QUOTE_PREWARM_RATE
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertAlmostEqual(mock_sleep.call_args.args[0], 0.5, places=1)
+        self.morning.refresh_from_db()
+        self.assertIsNotNone(self.morning.last_warmed_at)
+
+    @patch("legacy_middleware.views.fetch_quote")
+    @patch("legacy_middleware.prewarm.fetch_quote")
+    def test_first_visitor_hits_cache(self, mock_prewarm, mock_view, mock_sleep):
+        mock_prewarm.return_value = quote_response(200, QUOTED)
+        prewarm_quotes(days=2)
+
+        response = self.client.post(
+            reverse("legacy_quote"),
+            at_pickup(QUOTE, "2026-11-03T10:00:00"),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response["X-Cache-Status"], "HIT")
+        self.assertEqual(response.json(), QUOTED)
+        mock_view.assert_not_called()
+
+    @patch("legacy_middleware.prewarm.fetch_quote")
+    def test_quote_ttl(self, mock_quote, mock_sleep):
+        mock_quote.return_value = quote_response(200, QUOTED)
+        prewarm_quotes(days=1)
+        key = canonical_quote_key(at_pickup(QUOTE, "2026-11-02 14:00"))
+
+        with patch("legacy_middleware.cache.time.time", return_value=time.time() + 61):
+            self.assertEqual(quote_cache.lookup(key), (QUOTED, GRACE))
+        with patch("legacy_middleware.cache.time.time", return_value=time.time() + 91):
+            self.assertEqual(quote_cache.lookup(key), (None, None))
+
+    @patch("legacy_middleware.prewarm.fetch_quote")
+    def test_errors_not_cached(self, mock_quote, mock_sleep):
+        mock_quote.side_effect = [
+            quote_response(200, {"error": {"code": "no_availability"}}),
+            quote_response(503, {}),
+            quote_response(200, QUOTED),
+        ]
+
+        result = prewarm_quotes(days=2)
+
+        self.assertEqual(result["warmed"], 1)
+        self.assertEqual(result["failed"], 2)
+
+    @patch("legacy_middleware.prewarm.fetch_quote")
+    def test_request_cap(self, mock_quote, mock_sleep):
+        mock_quote.return_value = quote_response(200, QUOTED)
+
+        result = prewarm_quotes(days=2, max_requests=1)
+
+        self.assertEqual(result["warmed"], 1)
+        self.assertEqual(result["skipped"], 2)
+
+    @patch("legacy_middleware.prewarm.fetch_quote")
+    def test_open_circuit_stops(self, mock_quote, mock_sleep):
+        mock_quote.side_effect = CircuitOpenError("fetch_quote", 30)
+
+        result = prewarm_quotes(days=2)
+
+        self.assertEqual(result["skipped"], 3)
+        mock_quote.assert_called_once()
+
+    @patch("legacy_middleware.prewarm.fetch_quote")
+    def test_command(self, mock_quote, mock_sleep):
+        mock_quote.return_value = quote_response(200, QUOTED)
+        QuoteRouteDemand.objects.filter(pk=self.afternoon.pk).update(
+            last_requested_at=timezone.now() - timedelta(days=30)
+        )
+        out = StringIO()
+
+        call_command("prewarm_quotes", days=2, stdout=out)
+
+        self.assertIn("Warmed 1 quotes for 1 routes", out.getvalue())
+        self.assertIn("forgot 1 stale routes", out.getvalue())
+
+    @override_settings(LEGACY_QUOTE_PREWARM_INTERVAL=0)
+    def test_scheduler_disabled(self, mock_sleep):
+        self.assertIsNone(start_quote_prewarmer())
+
+    @override_settings(LEGACY_QUOTE_PREWARM_INTERVAL=60)
+    def test_scheduler_needs_shared_cache(self, mock_sleep):
+        with self.assertLogs("legacy_middleware.prewarm", "WARNING"):
+            self.assertIsNone(start_quote_prewarmer())
+
+    @override_settings(
+        LEGACY_QUOTE_PREWARM_INTERVAL=60,
+        LEGACY_CACHE_ALIAS="shared",
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "shared": {"BACKEND": "django.core.cache.backends.db.DatabaseCache"},
+        },
+    )
+    @patch("legacy_middleware.prewarm.threading.Thread")
+    def test_scheduler_started_with_shared_cache(self, mock_thread, mock_sleep):
+        mock_thread.return_value.is_alive.return_value = False
+
+        self.assertIs(start_quote_prewarmer(), mock_thread.return_value)
+        mock_thread.return_value.start.assert_called_once()
@@ -1,13 +1,24 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import MagicMock, patch
 
 from django.test import TestCase, override_settings
 
 from legacy_middleware.services import (
+    afetch_legacy_autocomplete,
+    get_legacy_async_client,
+    get_legacy_session,
+    get_pool_stats,
+    reset_legacy_session,
+    fetch_legacy_autocomplete,
     fetch_quote,
     fetch_reservation_create,
     fetch_payment_link,
     fetch_my_booking,
+    warm_up_first_async_client,
 )
+from legacy_middleware.warmup import awarm_up_connections, warm_up_connections
 
 
 class FetchReservationCreateTests(TestCase):
@@ -20,7 +31,7 @@ class FetchReservationCreateTests(TestCase):
         LEGACY_API_BASE_URL="http://test-api.com",
         LEGACY_API_SITE_ID="123",
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_fetch_reservation_create_injects_site_id(self, mock_post):
         """
         Verify site_id is injected from settings when missing in payload.
@@ -53,7 +64,7 @@ class FetchReservationCreateTests(TestCase):
         LEGACY_API_BASE_URL="http://test-api.com",
         LEGACY_API_SITE_ID="123",
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_fetch_reservation_create_preserves_site_id(self, mock_post):
         """
         Verify existing site_id in payload is not overwritten.
@@ -80,7 +91,7 @@ class FetchReservationCreateTests(TestCase):
         LEGACY_API_BASE_URL="http://test-api.com",
         LEGACY_API_SITE_ID="456",
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_fetch_reservation_create_auth_header(self, mock_post):
         """
         Verify correct Authorization: Bearer <token> header is sent.
@@ -117,7 +128,7 @@ class FetchQuoteTests(TestCase):
         LEGACY_API_BASE_URL="http://test-api.com",
         LEGACY_API_RATE_GROUP="premium",
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_fetch_quote_injects_rate_group(self, mock_post):
         """
         Verify rate_group is injected from settings when missing.
@@ -151,7 +162,7 @@ class FetchQuoteTests(TestCase):
         LEGACY_API_BASE_URL="http://test-api.com",
         LEGACY_API_RATE_GROUP="premium",
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_fetch_quote_preserves_rate_group(self, mock_post):
         """
         Verify existing rate_group in payload is not overwritten.
@@ -182,7 +193,7 @@ class FetchPaymentLinkTests(TestCase):
     @override_settings(
         LEGACY_API_BASE_URL="http://test-api.com",
     )
-    @patch("legacy_middleware.services.requests.get")
+    @patch("legacy_middleware.services.requests.Session.get")
     def test_fetch_payment_link_calls_correct_endpoint(self, mock_get):
         """
         Verify correct URL, method, and parameters are passed.
@@ -233,7 +244,7 @@ class FetchMyBookingServiceTests(TestCase):
     @override_settings(
         LEGACY_API_BASE_URL="http://test-api.com", LEGACY_API_SITE_ID="25"
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_fetch_my_booking_calls_correct_endpoint(self, mock_post):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -251,3 +262,119 @@ class FetchMyBookingServiceTests(TestCase):
         self.assertEqual(kwargs["json"]["site_id"], 25)
         self.assertEqual(kwargs["headers"]["Authorization"], "Bearer test_token")
         self.assertEqual(response.status_code, 200)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"items": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "visitor=abc; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CountingHTTPServer(ThreadingHTTPServer):
+    """Counts the TCP connections accepted."""
+
+    connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+class LegacySessionPoolTests(TestCase):
+    """
+    Verify all legacy calls share one pooled keep-alive session.
+    """
+
+    def setUp(self):
+        reset_legacy_session()
+        self.server = CountingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        reset_legacy_session()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_session_is_shared(self):
+        self.assertIs(get_legacy_session(), get_legacy_session())
+
+    @override_settings(LEGACY_API_POOL_SIZE=3)
+    def test_pool_size_from_settings(self):
+        adapter = get_legacy_session().get_adapter("https://test-api.com")
+        self.assertEqual(adapter._pool_maxsize, 3)
+
+    def test_connection_reused_between_calls(self):
+        """
+        Two sequential calls must open a single connection and reuse it.
+        """
+        before = get_pool_stats()
+        with override_settings(LEGACY_API_BASE_URL=self.base_url, LEGACY_API_KEY="k"):
+            first = fetch_legacy_autocomplete("cancun")
+            second = fetch_legacy_autocomplete("hotel")
+        after = get_pool_stats()
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json(), {"items": []})
+        self.assertEqual(after["new_connections"] - before["new_connections"], 1)
+        self.assertEqual(after["pool_misses"] - before["pool_misses"], 1)
+        self.assertEqual(after["pool_hits"] - before["pool_hits"], 1)
+
+        # Upstream cookies must never leak between visitors
+        self.assertEqual(len(get_legacy_session().cookies), 0)
+
+    def test_warm_up_connections(self):
+        """
+        Connections opened at worker boot are reused by the first request.
+        """
+        with override_settings(LEGACY_API_BASE_URL=self.base_url, LEGACY_API_KEY="k"):
+            self.assertEqual(warm_up_connections(2), 2)
+            before = get_pool_stats()
+            fetch_legacy_autocomplete("cancun")
+        after = get_pool_stats()
+
+        self.assertEqual(after["new_connections"], before["new_connections"])
+
+    def test_async_client_warmed_on_first_loop(self):
+        """
+        The first event loop's client opens its connections in the background.
+        """
+        warmed = []
+
+        async def first_requests():
+            done = asyncio.Event()
+
+            async def warm_up(client):
+                warmed.append(await awarm_up_connections(client, 2))
+                done.set()
+
+            warm_up_first_async_client(warm_up)
+            client = get_legacy_async_client()
+            await asyncio.wait_for(done.wait(), 5)
+            response = await afetch_legacy_autocomplete("cancun")
+            await client.aclose()
+            return response
+
+        with override_settings(LEGACY_API_BASE_URL=self.base_url, LEGACY_API_KEY="k"):
+            response = asyncio.run(first_requests())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(warmed, [2])
+        self.assertEqual(self.server.connections, 2)
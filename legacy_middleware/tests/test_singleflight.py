@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from legacy_middleware.singleflight import SingleFlight
+
+
+@override_settings(LEGACY_SINGLEFLIGHT_TIMEOUT=5, LEGACY_SINGLEFLIGHT_SHARED=False)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight("test")
+
+    def wait_for_waiters(self, key, count):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            call = self.flight._calls.get(key)
+            if call is not None and call.waiters >= count:
+                return
+            time.sleep(0.01)
+        self.fail("Followers never joined the in-flight call")
+
+    def test_concurrent_calls_are_coalesced(self):
+        release = threading.Event()
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            release.wait(5)
+            return {"items": ["hotel"]}, 200
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(self.flight.do("hotel", upstream))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        self.wait_for_waiters("hotel", 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [({"items": ["hotel"]}, 200)] * 5)
+        stats = self.flight.stats()
+        self.assertEqual(stats["leaders"], 1)
+        self.assertEqual(stats["coalesced"], 4)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_leader_error_is_shared(self):
+        release = threading.Event()
+
+        def upstream():
+            release.wait(5)
+            raise ValueError("boom")
+
+        errors = []
+
+        def call():
+            try:
+                self.flight.do("hotel", upstream)
+            except ValueError as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        self.wait_for_waiters("hotel", 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 3)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        self.flight.do("hotel", lambda: 1)
+        self.flight.do("hotel", lambda: 2)
+        self.assertEqual(self.flight.stats()["leaders"], 2)
+
+    @override_settings(
+        LEGACY_SINGLEFLIGHT_SHARED=True,
+        LEGACY_SINGLEFLIGHT_LOCK_TTL=5,
+        LEGACY_SINGLEFLIGHT_POLL_INTERVAL=0.01,
+    )
+    def test_waits_for_leader_on_other_worker(self):
+        """
+        When another worker holds the shared lock, reuse its cached result.
+        """
+        cache.add(self.flight.lock_key("hotel"), 1)
+        lookups = iter([None, None, ({"items": []}, 200)])
+
+        result = self.flight.do(
+            "hotel", lambda: self.fail("Upstream must not be called"), lambda: next(lookups)
+        )
+
+        self.assertEqual(result, ({"items": []}, 200))
+        self.assertEqual(self.flight.stats()["coalesced_shared"], 1)
+
+    @override_settings(
+        LEGACY_SINGLEFLIGHT_SHARED=True,
+        LEGACY_SINGLEFLIGHT_LOCK_TTL=5,
+        LEGACY_SINGLEFLIGHT_POLL_INTERVAL=0.01,
+    )
+    def test_shared_lock_released(self):
+        self.flight.do("hotel", lambda: 1, lambda: None)
+        self.assertIsNone(cache.get(self.flight.lock_key("hotel")))
+
+    def test_async_calls_are_coalesced(self):
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"items": []}, 200
+
+        async def run():
+            return await asyncio.gather(
+                *[self.flight.ado("hotel", upstream) for _ in range(10)]
+            )
+
+        results = asyncio.run(run())
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [({"items": []}, 200)] * 10)
+        self.assertEqual(self.flight.stats()["coalesced"], 9)
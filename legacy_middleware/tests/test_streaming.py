@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from legacy_middleware.async_views import AsyncQuoteBatchProxyView
+from legacy_middleware.breaker import reset_breakers
+from legacy_middleware.cache import quote_cache
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.streaming import NDJSON, SSE, encode_record
+from legacy_middleware.tokens import clear_token_cache
+
+VALID_QUOTE = {"items": [{"id": 1, "price": 89.0}], "places": {}}
+
+
+def quote_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    return response
+
+
+def read_ndjson(chunks):
+    return [json.loads(line) for line in b"".join(chunks).splitlines()]
+
+
+class EncodeRecordTests(SimpleTestCase):
+    def test_ndjson(self):
+        self.assertEqual(
+            encode_record(NDJSON, {"type": "result", "index": 0}),
+            b'{"type":"result","index":0}\n',
+        )
+
+    def test_sse(self):
+        self.assertEqual(
+            encode_record(SSE, {"type": "summary", "count": 1}),
+            b'event: summary\ndata: {"type":"summary","count":1}\n\n',
+        )
+
+
+class StreamingQuoteBatchTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type="application/json")
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_results_in_completion_order(self, mock_quote):
+        def fetch(token, payload):
+            time.sleep(payload["delay"])
+            if payload["delay"] == 0:
+                return quote_response(503, {})
+            return quote_response(200, VALID_QUOTE)
+
+        mock_quote.side_effect = fetch
+
+        response = self.post(
+            reverse("legacy_quote_batch") + "?stream=ndjson",
+            {"quotes": [{"delay": 0.1}, {"delay": 0}]},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = read_ndjson(response.streaming_content)
+        self.assertEqual(
+            [record["type"] for record in records], ["result", "result", "summary"]
+        )
+        self.assertEqual([record.get("index") for record in records[:2]], [1, 0])
+        self.assertEqual(records[0]["status"], 502)
+        self.assertEqual(records[1]["data"], VALID_QUOTE)
+        self.assertEqual(
+            {key: records[2][key] for key in ("count", "ok", "errors", "cache_hits")},
+            {"count": 2, "ok": 1, "errors": 1, "cache_hits": 0},
+        )
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_server_sent_events(self, mock_quote):
+        mock_quote.return_value = quote_response(200, VALID_QUOTE)
+
+        response = self.post(
+            reverse("legacy_quote_batch") + "?stream=sse", {"quotes": [{}]}
+        )
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = b"".join(response.streaming_content).decode().split("\n\n")
+        self.assertTrue(events[0].startswith("event: result\ndata: {"))
+        self.assertTrue(events[1].startswith("event: summary\ndata: {"))
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_calendar_days(self, mock_quote):
+        mock_quote.return_value = quote_response(200, VALID_QUOTE)
+
+        response = self.post(
+            reverse("legacy_quote_calendar") + "?stream=ndjson",
+            {
+                "quote": {"start": {"pickup": "2026-11-02 10:00"}},
+                "start_date": "2026-11-02",
+                "end_date": "2026-11-03",
+            },
+        )
+
+        records = read_ndjson(response.streaming_content)
+        days = sorted(
+            (record["date"], record["min_price"])
+            for record in records
+            if record["type"] == "day"
+        )
+        self.assertEqual(days, [("2026-11-02", 89.0), ("2026-11-03", 89.0)])
+        self.assertEqual(records[-1]["count"], 2)
+
+    def test_unknown_format(self):
+        response = self.post(
+            reverse("legacy_quote_batch") + "?stream=xml", {"quotes": [{}]}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncStreamingQuoteBatchTests(TestCase):
+    def setUp(self):
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    @patch("legacy_middleware.async_views.afetch_quote", new_callable=AsyncMock)
+    async def test_results_in_completion_order(self, mock_quote):
+        async def fetch(token, payload):
+            await asyncio.sleep(payload["delay"])
+            return quote_response(200, VALID_QUOTE)
+
+        mock_quote.side_effect = fetch
+        request = AsyncRequestFactory().post(
+            "/api/legacy/quote/batch/?stream=ndjson",
+            json.dumps({"quotes": [{"delay": 0.05}, {"delay": 0}]}),
+            content_type="application/json",
+        )
+
+        response = await AsyncQuoteBatchProxyView.as_view()(request)
+
+        self.assertTrue(response.is_async)
+        records = read_ndjson([chunk async for chunk in response.streaming_content])
+        self.assertEqual([record.get("index") for record in records], [1, 0, None])
+        self.assertEqual(records[-1]["ok"], 2)
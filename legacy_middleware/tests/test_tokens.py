@@ -0,0 +1,217 @@
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.services import fetch_quote
+from legacy_middleware.tokens import (
+    TOKEN_REFRESH_LOCK_KEY,
+    TOKEN_VERSION_KEY,
+    clear_token_cache,
+    get_cached_token,
+    refresh_token,
+    renew_token_if_due,
+)
+from legacy_middleware.warmup import warm_up_worker
+from legacy_middleware.views import QuoteProxyView
+
+
+@override_settings(LEGACY_TOKEN_VERSION_CHECK_INTERVAL=5)
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_token_cache()
+        self.token_obj = LegacyAPIToken.get_solo()
+        self.token_obj.token = "valid_token"
+        self.token_obj.expires_at = timezone.now() + timedelta(hours=1)
+        self.token_obj.save()
+
+    def test_hot_path_does_not_query(self):
+        clear_token_cache()
+        self.assertEqual(get_cached_token().token, "valid_token")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_token().token, "valid_token")
+
+    def test_save_primes_local_cache(self):
+        self.token_obj.token = "refreshed_token"
+        self.token_obj.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_token().token, "refreshed_token")
+
+    def test_refresh_on_other_worker_invalidates(self):
+        get_cached_token()
+
+        # Another worker saved a new token: DB row and version key change
+        LegacyAPIToken.objects.filter(pk=self.token_obj.pk).update(token="other_worker")
+        cache.incr(TOKEN_VERSION_KEY)
+
+        # Still served locally until the next version check
+        self.assertEqual(get_cached_token().token, "valid_token")
+
+        with patch("legacy_middleware.tokens.time.monotonic", return_value=10**9):
+            self.assertEqual(get_cached_token().token, "other_worker")
+
+    def test_unchanged_version_keeps_token(self):
+        get_cached_token()
+        with patch("legacy_middleware.tokens.time.monotonic", return_value=10**9):
+            with self.assertNumQueries(0):
+                self.assertEqual(get_cached_token().token, "valid_token")
+
+    def test_expired_token_not_served(self):
+        get_cached_token()
+        self.token_obj.expires_at = timezone.now() - timedelta(minutes=1)
+        self.token_obj.save()
+
+        self.assertIsNone(get_cached_token())
+
+    def test_delete_clears_cache(self):
+        get_cached_token()
+        LegacyAPIToken.objects.all().delete()
+        self.assertIsNone(get_cached_token())
+
+
+@override_settings(
+    LEGACY_API_BASE_URL="http://test-api.com",
+    LEGACY_TOKEN_REFRESH_WAIT=5,
+    LEGACY_TOKEN_REFRESH_POLL_INTERVAL=0.01,
+)
+class TokenRefreshCoordinatorTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        clear_token_cache()
+        LegacyAPIToken.objects.create(
+            token="stale_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def upstream(self, url, json=None, headers=None, **kwargs):
+        """Fake legacy API: OAuth issues fresh_token, quotes reject stale_token."""
+        response = MagicMock()
+        if url.endswith("api/v1/oauth"):
+            time.sleep(0.05)
+            response.status_code = 200
+            response.json.return_value = {"token": "fresh_token", "expires_in": 172800}
+        elif headers["Authorization"] == "Bearer stale_token":
+            response.status_code = 401
+        else:
+            response.status_code = 200
+            response.json.return_value = {"items": [], "places": {}}
+        return response
+
+    @patch("legacy_middleware.services.requests.Session.post")
+    def test_concurrent_401s_refresh_once(self, mock_post):
+        """
+        50 concurrent requests rejected with 401 must trigger a single OAuth call.
+        """
+        mock_post.side_effect = self.upstream
+        get_cached_token()  # warm this worker like a running server
+        statuses = []
+
+        def request_quote():
+            view = QuoteProxyView()
+            response = view.execute_proxy_request(
+                fetch_quote, {}, validate_func=view.validate_quote_structure
+            )
+            statuses.append(response.status_code)
+            connection.close()
+
+        threads = [threading.Thread(target=request_quote) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        oauth_calls = [
+            call for call in mock_post.call_args_list if call.args[0].endswith("api/v1/oauth")
+        ]
+        self.assertEqual(len(oauth_calls), 1)
+        self.assertEqual(statuses, [200] * 50)
+        self.assertEqual(LegacyAPIToken.get_solo().token, "fresh_token")
+        self.assertIsNone(cache.get(TOKEN_REFRESH_LOCK_KEY))
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    def test_waits_for_refresh_on_other_worker(self, mock_oauth):
+        """
+        While another worker holds the refresh lock, reuse the token it stores.
+        """
+        cache.add(TOKEN_REFRESH_LOCK_KEY, 1)
+
+        def other_worker_refresh():
+            time.sleep(0.05)
+            LegacyAPIToken.objects.update(token="other_worker_token")
+            cache.delete(TOKEN_REFRESH_LOCK_KEY)
+            connection.close()
+
+        thread = threading.Thread(target=other_worker_refresh)
+        thread.start()
+        token_obj = refresh_token(stale_token="stale_token")
+        thread.join()
+
+        self.assertEqual(token_obj.token, "other_worker_token")
+        mock_oauth.assert_not_called()
+
+
+@override_settings(
+    LEGACY_TOKEN_RENEW_FRACTION=0.8, LEGACY_TOKEN_RENEW_CHECK_INTERVAL=300
+)
+class TokenRenewalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_token_cache()
+
+    def save_token(self, issued_ago, lifetime):
+        token_obj = LegacyAPIToken.get_solo()
+        token_obj.token = "current_token"
+        token_obj.refreshed_at = timezone.now() - issued_ago
+        token_obj.expires_at = token_obj.refreshed_at + lifetime
+        token_obj.save()
+        return token_obj
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    def test_fresh_token_is_kept(self, mock_oauth):
+        self.save_token(timedelta(hours=1), timedelta(hours=48))
+
+        delay = renew_token_if_due()
+
+        mock_oauth.assert_not_called()
+        self.assertLessEqual(delay, 305)
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    def test_token_renewed_past_fraction(self, mock_oauth):
+        mock_oauth.return_value = ("renewed_token", timezone.now() + timedelta(hours=48))
+        self.save_token(timedelta(hours=40), timedelta(hours=48))
+
+        renew_token_if_due()
+
+        mock_oauth.assert_called_once()
+        token_obj = LegacyAPIToken.get_solo()
+        self.assertEqual(token_obj.token, "renewed_token")
+        self.assertIsNotNone(token_obj.refreshed_at)
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    def test_missing_token_is_fetched(self, mock_oauth):
+        mock_oauth.return_value = ("new_token", timezone.now() + timedelta(hours=48))
+
+        renew_token_if_due()
+
+        self.assertEqual(get_cached_token().token, "new_token")
+
+    @patch("legacy_middleware.warmup.start_token_renewer")
+    @patch("legacy_middleware.warmup.warm_up_connections", return_value=2)
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    def test_warm_up_worker(self, mock_oauth, mock_connections, mock_renewer):
+        mock_oauth.return_value = ("boot_token", timezone.now() + timedelta(hours=48))
+
+        warm_up_worker()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_token().token, "boot_token")
+        mock_connections.assert_called_once()
+        mock_renewer.assert_called_once()
@@ -1,3 +1,5 @@
+import threading
+import time
 from datetime import timedelta
 from unittest.mock import MagicMock, patch
 
@@ -8,7 +10,11 @@ from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
+from legacy_middleware import views
+from legacy_middleware.breaker import CircuitOpenError, reset_breakers
+from legacy_middleware.cache import autocomplete_cache, quote_cache
 from legacy_middleware.models import LegacyAPIToken
+from legacy_middleware.tokens import clear_token_cache
 import unittest
 import os
 from django.test import tag
@@ -18,11 +24,12 @@ class AutocompleteProxyViewTests(TestCase):
     def setUp(self):
         self.client = APIClient()
         self.url = reverse("legacy_autocomplete")
+        autocomplete_cache.clear()
 
     @override_settings(
         LEGACY_API_KEY="test-api-key", LEGACY_API_BASE_URL="http://test-api.com"
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_autocomplete_success(self, mock_post):
         """
         Verify the Django view returns 200 OK with the mocked list of locations.
@@ -48,6 +55,41 @@ class AutocompleteProxyViewTests(TestCase):
         self.assertIn("http://test-api.com", args[0])
         self.assertEqual(kwargs["json"]["keyword"], "cancun")
 
+    @override_settings(
+        LEGACY_API_KEY="test-api-key", LEGACY_API_BASE_URL="http://test-api.com"
+    )
+    @patch("legacy_middleware.services.requests.Session.post")
+    def test_autocomplete_cached(self, mock_post):
+        """
+        Verify repeated keywords are served from cache, folding case and accents.
+        """
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"items": [{"id": 1, "name": "Cancún"}]}
+        mock_post.return_value = mock_response
+
+        first = self.client.post(self.url, {"keyword": "Cancún"}, format="json")
+        second = self.client.post(self.url, {"keyword": " cancun "}, format="json")
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json(), first.json())
+        mock_post.assert_called_once()
+
+    @override_settings(
+        LEGACY_API_KEY="test-api-key", LEGACY_API_BASE_URL="http://test-api.com"
+    )
+    @patch("legacy_middleware.services.requests.Session.post")
+    def test_autocomplete_errors_not_cached(self, mock_post):
+        """
+        Verify upstream failures are not cached.
+        """
+        mock_post.side_effect = requests.RequestException("Connection error")
+        self.client.post(self.url, {"keyword": "hotel"}, format="json")
+        self.client.post(self.url, {"keyword": "hotel"}, format="json")
+
+        self.assertEqual(mock_post.call_count, 2)
+
     def test_autocomplete_validation(self):
         """
         Verify 400 Bad Request when keyword is missing.
@@ -55,7 +97,7 @@ class AutocompleteProxyViewTests(TestCase):
         response = self.client.post(self.url, {}, format="json")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         # Should verify service is NOT called, but we need to mock it to fail if called
-        with patch("legacy_middleware.services.requests.post") as mock_post:
+        with patch("legacy_middleware.services.requests.Session.post") as mock_post:
             response = self.client.post(self.url, {}, format="json")
             self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
             mock_post.assert_not_called()
@@ -63,7 +105,7 @@ class AutocompleteProxyViewTests(TestCase):
     @override_settings(
         LEGACY_API_KEY="test-api-key", LEGACY_API_BASE_URL="http://test-api.com"
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_autocomplete_external_error(self, mock_post):
         """
         Verify graceful error handling (502) when legacy API fails.
@@ -77,7 +119,7 @@ class AutocompleteProxyViewTests(TestCase):
     @override_settings(
         LEGACY_API_KEY="test-api-key", LEGACY_API_BASE_URL="http://test-api.com"
     )
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_autocomplete_legacy_500(self, mock_post):
         """
         Verify handling of 500 from legacy API.
@@ -96,6 +138,9 @@ class AutocompleteProxyViewTests(TestCase):
 class QuoteProxyViewTestCase(APITestCase):
     def setUp(self):
         self.url = reverse("legacy_quote")
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
 
     def test_model_constraints(self):
         token = "test_token"
@@ -105,7 +150,7 @@ class QuoteProxyViewTestCase(APITestCase):
         self.assertEqual(LegacyAPIToken.objects.count(), 1)
         self.assertEqual(LegacyAPIToken.objects.first().token, token)
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_quote")
     def test_view_happy_path_no_token(self, mock_quote, mock_oauth):
         # Start with empty DB
@@ -126,7 +171,7 @@ class QuoteProxyViewTestCase(APITestCase):
         mock_oauth.assert_called_once()
         mock_quote.assert_called_once()
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_quote")
     def test_view_happy_path_reuse_token(self, mock_quote, mock_oauth):
         # Pre-fill DB
@@ -148,7 +193,7 @@ class QuoteProxyViewTestCase(APITestCase):
         args, _ = mock_quote.call_args
         self.assertEqual(args[0], "existing_token")
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_quote")
     def test_view_expired_token_auto_refresh(self, mock_quote, mock_oauth):
         # Pre-fill DB with expired token
@@ -175,7 +220,7 @@ class QuoteProxyViewTestCase(APITestCase):
         args, _ = mock_quote.call_args
         self.assertEqual(args[0], "refreshed_token")
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_quote")
     def test_view_upstream_auth_failure_retry(self, mock_quote, mock_oauth):
         # Valid token in DB but upstream rejects it with 401
@@ -208,7 +253,7 @@ class QuoteProxyViewTestCase(APITestCase):
         args2, _ = mock_quote.call_args_list[1]
         self.assertEqual(args2[0], "fresh_token")
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_quote")
     def test_view_upstream_error_handling(self, mock_quote, mock_oauth):
         # Mock token existence
@@ -227,7 +272,7 @@ class QuoteProxyViewTestCase(APITestCase):
         self.assertEqual(response.status_code, 422)
         self.assertEqual(response.data, {"error": "Validation error"})
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_quote")
     def test_view_no_availability(self, mock_quote, mock_oauth):
         # Mock token existence
@@ -248,7 +293,7 @@ class QuoteProxyViewTestCase(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data, error_payload)
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_quote")
     def test_view_malformed_response(self, mock_quote, mock_oauth):
         # Mock token existence
@@ -271,7 +316,57 @@ class QuoteProxyViewTestCase(APITestCase):
         response = self.client.post(self.url, {}, format="json")
         self.assertEqual(response.status_code, 502)
 
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_view_quote_cache(self, mock_quote):
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        mock_quote_resp = MagicMock()
+        mock_quote_resp.status_code = 200
+        mock_quote_resp.json.return_value = {"items": [{"id": 1}], "places": {}}
+        mock_quote.return_value = mock_quote_resp
+
+        payload = {
+            "start": {"lat": 21.036512, "pickup": "2026-11-02 10:00"},
+            "passengers": 2,
+        }
+        reordered = {
+            "passengers": 2,
+            "start": {"pickup": "2026-11-02T10:00:00", "lat": "21.03651"},
+        }
+        first = self.client.post(self.url, payload, format="json")
+        second = self.client.post(self.url, reordered, format="json")
+
+        self.assertEqual(first["X-Cache-Status"], "MISS")
+        self.assertEqual(second["X-Cache-Status"], "HIT")
+        self.assertEqual(second.data, {"items": [{"id": 1}], "places": {}})
+        mock_quote.assert_called_once()
+
+        # Clients can force a fresh quote
+        third = self.client.post(
+            self.url, payload, format="json", HTTP_CACHE_CONTROL="no-cache"
+        )
+        self.assertEqual(third["X-Cache-Status"], "BYPASS")
+        self.assertEqual(mock_quote.call_count, 2)
+
+    @override_settings(LEGACY_NEGATIVE_CACHE_TTLS={})
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_view_quote_cache_skips_errors(self, mock_quote):
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        mock_quote_resp = MagicMock()
+        mock_quote_resp.status_code = 200
+        mock_quote_resp.json.return_value = {"error": {"code": "no_availability"}}
+        mock_quote.return_value = mock_quote_resp
+
+        self.client.post(self.url, {"passengers": 3}, format="json")
+        response = self.client.post(self.url, {"passengers": 3}, format="json")
+
+        self.assertEqual(response["X-Cache-Status"], "MISS")
+        self.assertEqual(mock_quote.call_count, 2)
+
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_service_fetch_token_success(self, mock_post):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
@@ -287,7 +382,7 @@ class QuoteProxyViewTestCase(APITestCase):
         # We can check if it returns correct datetime object
         pass
 
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_service_fetch_token_success_large_expiry(self, mock_post):
         mock_resp = MagicMock()
         mock_resp.status_code = 200
@@ -300,7 +395,7 @@ class QuoteProxyViewTestCase(APITestCase):
         self.assertEqual(token, "abc")
         self.assertTrue(expires_at > timezone.now())
 
-    @patch("legacy_middleware.services.requests.post")
+    @patch("legacy_middleware.services.requests.Session.post")
     def test_service_fetch_token_failure(self, mock_post):
         mock_resp = MagicMock()
         mock_resp.status_code = 401
@@ -313,6 +408,269 @@ class QuoteProxyViewTestCase(APITestCase):
             fetch_legacy_token()
 
 
+
+def quote_response(status_code, data):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    return response
+
+
+# Upstream answer for each "route" of the batch tests
+BATCH_UPSTREAM = {
+    "ok": (200, {"items": [{"id": 1}], "places": {}}),
+    "malformed": (200, {"places": {}}),
+    "no_availability": (200, {"error": "no_availability"}),
+    "down": (503, {"message": "down"}),
+}
+
+
+class QuoteBatchProxyViewTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("legacy_quote_batch")
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+    def fake_fetch_quote(self, token, payload):
+        return quote_response(*BATCH_UPSTREAM[payload["route"]])
+
+    @patch("legacy_middleware.views.get_cached_token", wraps=views.get_cached_token)
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_results_in_order(self, mock_quote, mock_token):
+        mock_quote.side_effect = self.fake_fetch_quote
+        routes = ["ok", "malformed", "no_availability", "down"]
+
+        response = self.client.post(
+            self.url, {"quotes": [{"route": route} for route in routes]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()["results"]
+        self.assertEqual(
+            [result["status"] for result in results], [200, 502, 200, 502]
+        )
+        self.assertEqual(results[0]["data"], BATCH_UPSTREAM["ok"][1])
+        self.assertIn("malformed", results[1]["data"]["error"])
+        self.assertEqual(results[2]["data"], {"error": "no_availability"})
+        self.assertEqual(results[3]["data"], {"error": "Upstream service unavailable"})
+        self.assertEqual(mock_quote.call_count, 4)
+        self.assertEqual(
+            {call.args[0] for call in mock_quote.call_args_list}, {"valid_token"}
+        )
+        mock_token.assert_called_once()
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_shares_quote_cache(self, mock_quote):
+        mock_quote.side_effect = self.fake_fetch_quote
+        self.client.post(reverse("legacy_quote"), {"route": "ok"}, format="json")
+
+        response = self.client.post(
+            self.url, {"quotes": [{"route": "ok"}, {"route": "ok"}]}, format="json"
+        )
+
+        self.assertEqual(
+            [result["cache"] for result in response.json()["results"]], ["HIT", "HIT"]
+        )
+        mock_quote.assert_called_once()
+
+    @override_settings(LEGACY_QUOTE_BATCH_CONCURRENCY=2)
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_bounded_concurrency(self, mock_quote):
+        lock = threading.Lock()
+        in_flight = {"now": 0, "max": 0}
+
+        def slow_fetch(token, payload):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            time.sleep(0.02)
+            with lock:
+                in_flight["now"] -= 1
+            return quote_response(*BATCH_UPSTREAM["ok"])
+
+        mock_quote.side_effect = slow_fetch
+
+        response = self.client.post(
+            self.url,
+            {"quotes": [{"route": "ok", "n": n} for n in range(6)]},
+            format="json",
+        )
+
+        self.assertEqual(len(response.json()["results"]), 6)
+        self.assertEqual(in_flight["max"], 2)
+
+    @override_settings(LEGACY_QUOTE_BATCH_MAX_SIZE=2)
+    def test_invalid_batches(self):
+        for data in (
+            {},
+            {"quotes": []},
+            {"quotes": {"route": "ok"}},
+            {"quotes": ["ok"]},
+            {"quotes": [{}, {}, {}]},
+        ):
+            response = self.client.post(self.url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_token_failure(self, mock_quote, mock_oauth):
+        LegacyAPIToken.objects.all().delete()
+        mock_oauth.side_effect = requests.ConnectionError()
+
+        response = self.client.post(
+            self.url, {"quotes": [{"route": "ok"}]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        mock_quote.assert_not_called()
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_token_circuit_open(self, mock_quote, mock_oauth):
+        LegacyAPIToken.objects.all().delete()
+        mock_oauth.side_effect = CircuitOpenError("oauth/token", 30)
+
+        response = self.client.post(
+            self.url, {"quotes": [{"route": "ok"}]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "30")
+        mock_quote.assert_not_called()
+
+
+
+class QuoteCalendarProxyViewTests(APITestCase):
+    def setUp(self):
+        self.url = reverse("legacy_quote_calendar")
+        quote_cache.clear()
+        clear_token_cache()
+        reset_breakers()
+        LegacyAPIToken.objects.create(
+            token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        self.quote = {
+            "type": "round-trip",
+            "currency": "USD",
+            "passengers": 2,
+            "start": {"lat": 21.03, "pickup": "2026-11-02 10:00"},
+            "end": {"lat": 21.13, "pickup": "2026-11-05T18:30:00"},
+        }
+
+    def test_shift_pickups(self):
+        shifted = views.shift_pickups(self.quote, 3)
+
+        self.assertEqual(shifted["start"], {"lat": 21.03, "pickup": "2026-11-05 10:00"})
+        self.assertEqual(shifted["end"]["pickup"], "2026-11-08 18:30")
+        self.assertEqual(self.quote["start"]["pickup"], "2026-11-02 10:00")
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_min_price_per_day(self, mock_quote):
+        def fake_fetch_quote(token, payload):
+            day = payload["start"]["pickup"][:10]
+            if day == "2026-11-11":
+                return quote_response(200, {"error": {"code": "no_availability"}})
+            if day == "2026-11-12":
+                return quote_response(503, {})
+            items = [{"id": 1, "price": 120.0}, {"id": 2, "price": 89.5}, {"id": 3}]
+            return quote_response(200, {"items": items, "places": {}})
+
+        mock_quote.side_effect = fake_fetch_quote
+
+        response = self.client.post(
+            self.url,
+            {"quote": self.quote, "start_date": "2026-11-10", "end_date": "2026-11-12"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["currency"], "USD")
+        days = response.json()["days"]
+        self.assertEqual(
+            [(day["date"], day["min_price"], day["options"]) for day in days],
+            [("2026-11-10", 89.5, 3), ("2026-11-11", None, 0), ("2026-11-12", None, 0)],
+        )
+        self.assertEqual(days[1]["error"], "no_availability")
+        self.assertEqual(days[2]["status"], 502)
+        self.assertNotIn("items", days[0])
+        # Round trip legs keep their gap
+        payloads = {
+            call.args[1]["start"]["pickup"]: call.args[1]["end"]["pickup"]
+            for call in mock_quote.call_args_list
+        }
+        self.assertEqual(payloads["2026-11-10 10:00"], "2026-11-13 18:30")
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_falsy_error_without_items(self, mock_quote):
+        mock_quote.return_value = quote_response(200, {"error": None})
+
+        response = self.client.post(
+            self.url,
+            {"quote": self.quote, "start_date": "2026-11-02", "end_date": "2026-11-02"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        day = response.json()["days"][0]
+        self.assertEqual((day["min_price"], day["options"]), (None, 0))
+        self.assertNotIn("error", day)
+
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_reuses_quote_cache(self, mock_quote):
+        mock_quote.return_value = quote_response(
+            200, {"items": [{"price": 70}], "places": {}}
+        )
+        self.client.post(reverse("legacy_quote"), self.quote, format="json")
+
+        response = self.client.post(
+            self.url,
+            {"quote": self.quote, "start_date": "2026-11-02", "end_date": "2026-11-03"},
+            format="json",
+        )
+
+        self.assertEqual(
+            [day["cache"] for day in response.json()["days"]], ["HIT", "MISS"]
+        )
+        self.assertEqual(mock_quote.call_count, 2)
+
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
+    @patch("legacy_middleware.views.fetch_quote")
+    def test_token_circuit_open(self, mock_quote, mock_oauth):
+        LegacyAPIToken.objects.all().delete()
+        mock_oauth.side_effect = CircuitOpenError("oauth/token", 30)
+
+        response = self.client.post(
+            self.url,
+            {"quote": self.quote, "start_date": "2026-11-02", "end_date": "2026-11-03"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "30")
+        mock_quote.assert_not_called()
+
+    @override_settings(LEGACY_QUOTE_CALENDAR_MAX_DAYS=14)
+    def test_invalid_requests(self):
+        for data in (
+            {"start_date": "2026-11-02", "end_date": "2026-11-03"},
+            {"quote": {"start": {}}, "start_date": "2026-11-02", "end_date": "2026-11-03"},
+            {"quote": self.quote, "start_date": "tomorrow", "end_date": "2026-11-03"},
+            {"quote": self.quote, "start_date": "2026-11-03", "end_date": "2026-11-02"},
+            {"quote": self.quote, "start_date": "2026-11-01", "end_date": "2026-11-15"},
+            {
+                "quote": {**self.quote, "end": {"pickup": "later"}},
+                "start_date": "2026-11-02",
+                "end_date": "2026-11-03",
+            },
+        ):
+            response = self.client.post(self.url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+
+
 @tag("integration")
 @unittest.skipUnless(
     os.environ.get("LIVE_API_TESTS") == "True", "Integration tests skipped"
@@ -398,8 +756,10 @@ class ReservationCreateProxyViewTestCase(APITestCase):
 
     def setUp(self):
         self.url = reverse("legacy_reservation_create")
+        clear_token_cache()
+        reset_breakers()
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     def test_create_success(self, mock_create, mock_oauth):
         """
@@ -432,7 +792,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(response.data["reservation_id"], "RES123")
         mock_create.assert_called_once()
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     def test_create_validation_error(self, mock_create, mock_oauth):
         """
@@ -461,7 +821,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
         self.assertIn("error", response.data)
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     def test_token_refresh_retry(self, mock_create, mock_oauth):
         """
@@ -497,7 +857,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         mock_oauth.assert_called_once()
         self.assertEqual(mock_create.call_count, 2)
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     def test_upstream_failure(self, mock_create, mock_oauth):
         """
@@ -521,7 +881,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
         self.assertIn("error", response.data)
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     def test_malformed_response_non_dict(self, mock_create, mock_oauth):
         """
@@ -548,7 +908,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
         self.assertIn("Upstream response malformed", str(response.data))
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     def test_malformed_response_missing_id(self, mock_create, mock_oauth):
         """
@@ -575,7 +935,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
         self.assertIn("missing reservation ID", str(response.data))
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     def test_application_error_passthrough(self, mock_create, mock_oauth):
         """
@@ -605,7 +965,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("error", response.data)
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     @patch("legacy_middleware.views.fetch_payment_link")
     def test_create_success_stripe(self, mock_payment, mock_create, mock_oauth):
@@ -650,7 +1010,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(kwargs["reservation_id"], "RES100")
         self.assertEqual(kwargs["payment_provider"], "STRIPE")
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     @patch("legacy_middleware.views.fetch_payment_link")
     def test_create_success_paypal(self, mock_payment, mock_create, mock_oauth):
@@ -690,7 +1050,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(kwargs["reservation_id"], "RES200")
         self.assertEqual(kwargs["payment_provider"], "PAYPAL")
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     @patch("legacy_middleware.views.fetch_payment_link")
     def test_create_payment_link_failure(self, mock_payment, mock_create, mock_oauth):
@@ -720,7 +1080,7 @@ class ReservationCreateProxyViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
         self.assertIn("error", response.data)
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_reservation_create")
     @patch("legacy_middleware.views.fetch_payment_link")
     def test_create_cash_ignored(self, mock_payment, mock_create, mock_oauth):
@@ -770,6 +1130,8 @@ class MyBookingProxyViewTests(TestCase):
     def setUp(self):
         self.client = APIClient()
         self.url = reverse("legacy_my_booking")
+        clear_token_cache()
+        reset_breakers()
         LegacyAPIToken.objects.create(
             token="valid_token", expires_at=timezone.now() + timedelta(hours=1)
         )
@@ -795,7 +1157,7 @@ class MyBookingProxyViewTests(TestCase):
         args, _ = mock_fetch.call_args
         self.assertEqual(args[0], "valid_token")
 
-    @patch("legacy_middleware.views.fetch_legacy_token")
+    @patch("legacy_middleware.tokens.fetch_legacy_token")
     @patch("legacy_middleware.views.fetch_my_booking")
     def test_my_booking_token_refresh_retry(self, mock_fetch, mock_oauth):
         """Test token expiration and retry logic"""
@@ -818,6 +1180,21 @@ class MyBookingProxyViewTests(TestCase):
         self.assertEqual(mock_fetch.call_count, 2)
         mock_oauth.assert_called_once()
 
+    @patch("legacy_middleware.views.fetch_my_booking")
+    def test_my_booking_token_lookup_cached(self, mock_fetch):
+        """Authenticated requests must not query the token table once cached."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"status": "CONFIRMED"}
+        mock_fetch.return_value = mock_response
+
+        payload = {"code": "ABC123", "email": "john@example.com"}
+        self.client.post(self.url, payload, format="json")
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_my_booking_missing_params(self):
         # Missing email
         response = self.client.post(self.url, {"code": "ABC123"}, format="json")
@@ -0,0 +1,230 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import LegacyAPIToken
+from .services import fetch_legacy_token
+
+logger = logging.getLogger(__name__)
+
+# Bumped every time the token row changes, so other workers drop their copy
+TOKEN_VERSION_KEY = "legacy_middleware:token_version"
+
+# Held by the single worker allowed to call api/v1/oauth
+TOKEN_REFRESH_LOCK_KEY = "legacy_middleware:token_refresh_lock"
+
+_local = {"token_obj": None, "version": None, "checked_at": 0}
+_local_lock = threading.Lock()
+
+# Serializes refreshes within this worker
+_refresh_lock = threading.Lock()
+
+_renewer = {"thread": None, "stop": threading.Event()}
+
+
+def _shared_cache():
+    return caches[settings.LEGACY_CACHE_ALIAS]
+
+
+def _store_local(token_obj, version):
+    with _local_lock:
+        _local["token_obj"] = token_obj
+        _local["version"] = version
+        _local["checked_at"] = time.monotonic()
+
+
+def get_cached_token():
+    """
+    Return the valid LegacyAPIToken, reading the database only when needed.
+
+    The token is kept in process memory until its expires_at. The shared
+    version key is checked at most every LEGACY_TOKEN_VERSION_CHECK_INTERVAL
+    seconds to pick up refreshes made by other workers.
+
+    Returns:
+        LegacyAPIToken or None if there is no valid token.
+    """
+    with _local_lock:
+        token_obj = _local["token_obj"]
+        version = _local["version"]
+        checked_at = _local["checked_at"]
+
+    if token_obj is not None and token_obj.expires_at > timezone.now():
+        elapsed = time.monotonic() - checked_at
+        if elapsed < settings.LEGACY_TOKEN_VERSION_CHECK_INTERVAL:
+            return token_obj
+        if _shared_cache().get(TOKEN_VERSION_KEY) == version:
+            _store_local(token_obj, version)
+            return token_obj
+
+    return _reload_token()
+
+
+def _reload_token():
+    """Read the token row, bypassing the local copy."""
+    # Read the version first so a concurrent refresh can't be missed
+    version = _shared_cache().get(TOKEN_VERSION_KEY)
+    token_obj = LegacyAPIToken.get_valid_token()
+    _store_local(token_obj, version)
+    return token_obj
+
+
+def _is_usable(token_obj, stale_token):
+    return token_obj is not None and token_obj.token != stale_token
+
+
+def refresh_token(stale_token=None, get_timeout=None):
+    """
+    Refresh the legacy API token, calling api/v1/oauth once per cluster.
+
+    Threads of a worker queue on a local lock, and workers compete for a lock
+    in the shared cache. Callers that lose wait up to LEGACY_TOKEN_REFRESH_WAIT
+    seconds for the winner's token instead of refreshing again.
+
+    Args:
+        stale_token (str): Token the upstream just rejected, if any. A cached
+            token equal to it is not reused.
+        get_timeout (callable): Returns the seconds left to the caller, used
+            to cut the lock wait and the api/v1/oauth call short. It may
+            raise once nothing is left, e.g. ReservationPipeline.timeout.
+
+    Returns:
+        LegacyAPIToken: The new valid token.
+    """
+    with _refresh_lock:
+        return _refresh_locked(stale_token, get_timeout)
+
+
+def _refresh_locked(stale_token, get_timeout):
+    # Another thread may have refreshed while we were queued
+    token_obj = get_cached_token()
+    if _is_usable(token_obj, stale_token):
+        return token_obj
+    if token_obj is not None:
+        # Our copy is the rejected one, another worker may have a newer one
+        token_obj = _reload_token()
+        if _is_usable(token_obj, stale_token):
+            return token_obj
+
+    shared = _shared_cache()
+    acquired = shared.add(
+        TOKEN_REFRESH_LOCK_KEY, 1, timeout=settings.LEGACY_TOKEN_REFRESH_LOCK_TTL
+    )
+    if not acquired:
+        wait = settings.LEGACY_TOKEN_REFRESH_WAIT
+        if get_timeout is not None:
+            wait = min(wait, get_timeout())
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(settings.LEGACY_TOKEN_REFRESH_POLL_INTERVAL)
+            token_obj = _reload_token()
+            if _is_usable(token_obj, stale_token):
+                return token_obj
+            # The other worker gave up, take over
+            if shared.get(TOKEN_REFRESH_LOCK_KEY) is None:
+                break
+
+    try:
+        if get_timeout is None:
+            token, expires_at = fetch_legacy_token()
+        else:
+            token, expires_at = fetch_legacy_token(timeout=get_timeout())
+        token_obj = LegacyAPIToken.get_solo()
+        token_obj.token = token
+        token_obj.expires_at = expires_at
+        token_obj.refreshed_at = timezone.now()
+        token_obj.save()
+        return token_obj
+    finally:
+        if acquired:
+            shared.delete(TOKEN_REFRESH_LOCK_KEY)
+
+
+def renew_token_if_due():
+    """
+    Refresh the token once LEGACY_TOKEN_RENEW_FRACTION of its lifetime passed.
+
+    Returns:
+        float: Seconds to wait before the next check.
+    """
+    fraction = settings.LEGACY_TOKEN_RENEW_FRACTION
+    token_obj = get_cached_token()
+    if token_obj is None:
+        token_obj = refresh_token()
+    elif token_obj.get_renewal_time(fraction) <= timezone.now():
+        # Workers renewing at the same time end up with a single OAuth call
+        token_obj = refresh_token(stale_token=token_obj.token)
+
+    delay = (token_obj.get_renewal_time(fraction) - timezone.now()).total_seconds()
+    delay = min(max(delay, 0), settings.LEGACY_TOKEN_RENEW_CHECK_INTERVAL)
+    # Spread the workers so they don't all check at the same moment
+    return delay + random.uniform(0, 5)
+
+
+def _renewer_loop(stop):
+    while not stop.is_set():
+        try:
+            delay = renew_token_if_due()
+        except Exception:
+            logger.exception("Legacy API token renewal failed")
+            delay = settings.LEGACY_TOKEN_RENEW_RETRY_DELAY
+        finally:
+            close_old_connections()
+        stop.wait(delay)
+
+
+def start_token_renewer():
+    """Start the background renewal thread of this worker (idempotent)."""
+    thread = _renewer["thread"]
+    if thread is not None and thread.is_alive():
+        return thread
+
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=_renewer_loop, args=(stop,), name="legacy-token-renewer", daemon=True
+    )
+    _renewer.update(thread=thread, stop=stop)
+    thread.start()
+    return thread
+
+
+def stop_token_renewer():
+    _renewer["stop"].set()
+
+
+def clear_token_cache():
+    """Forget the token held by this worker."""
+    _store_local(None, None)
+
+
+def _bump_token_version():
+    shared = _shared_cache()
+    shared.add(TOKEN_VERSION_KEY, 0, timeout=None)
+    try:
+        return shared.incr(TOKEN_VERSION_KEY)
+    except ValueError:
+        # Evicted between add() and incr()
+        shared.set(TOKEN_VERSION_KEY, 1, timeout=None)
+        return 1
+
+
+@receiver(post_save, sender=LegacyAPIToken)
+def token_saved(sender, instance, **kwargs):
+    """Publish the new token to this worker and invalidate the others."""
+    version = _bump_token_version()
+    valid = instance.token and instance.expires_at and instance.expires_at > timezone.now()
+    _store_local(instance if valid else None, version)
+
+
+@receiver(post_delete, sender=LegacyAPIToken)
+def token_deleted(sender, instance, **kwargs):
+    _bump_token_version()
+    clear_token_cache()
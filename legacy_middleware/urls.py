@@ -1,10 +1,26 @@
+from django.conf import settings
 from django.urls import path
-from .views import (
-    AutocompleteProxyView,
-    QuoteProxyView,
-    ReservationCreateProxyView,
-    MyBookingProxyView,
-)
+
+if settings.LEGACY_PROXY_ASYNC:
+    from .async_views import (
+        AsyncAutocompleteProxyView as AutocompleteProxyView,
+        AsyncQuoteProxyView as QuoteProxyView,
+        AsyncQuoteBatchProxyView as QuoteBatchProxyView,
+        AsyncQuoteCalendarProxyView as QuoteCalendarProxyView,
+        AsyncReservationCreateProxyView as ReservationCreateProxyView,
+        AsyncMyBookingProxyView as MyBookingProxyView,
+        AsyncPaymentLinkJobView as PaymentLinkJobView,
+    )
+else:
+    from .views import (
+        AutocompleteProxyView,
+        QuoteProxyView,
+        QuoteBatchProxyView,
+        QuoteCalendarProxyView,
+        ReservationCreateProxyView,
+        MyBookingProxyView,
+        PaymentLinkJobView,
+    )
 
 urlpatterns = [
     path(
@@ -13,11 +29,26 @@ urlpatterns = [
         name="legacy_autocomplete",
     ),
     path("legacy/quote/", QuoteProxyView.as_view(), name="legacy_quote"),
+    path(
+        "legacy/quote/batch/",
+        QuoteBatchProxyView.as_view(),
+        name="legacy_quote_batch",
+    ),
+    path(
+        "legacy/quote/calendar/",
+        QuoteCalendarProxyView.as_view(),
+        name="legacy_quote_calendar",
+    ),
     path(
         "legacy/create/",
         ReservationCreateProxyView.as_view(),
         name="legacy_reservation_create",
     ),
+    path(
+        "legacy/payment-link/<uuid:job_id>/",
+        PaymentLinkJobView.as_view(),
+        name="legacy_payment_link_job",
+    ),
     path(
         "legacy/my-booking/",
         MyBookingProxyView.as_view(),
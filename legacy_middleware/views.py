@@ -1,19 +1,113 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 import requests
 
+from utils.metrics import get_route
+
+from .breaker import CircuitOpenError
+from .metrics import (
+    DEBOUNCE_STAGE,
+    GAZETTEER_STAGE,
+    JSON_PARSE_STAGE,
+    SERIALIZATION_STAGE,
+    TOKEN_REFRESH_STAGE,
+    TOKEN_STAGE,
+    UPSTREAM_STAGE,
+    VALIDATION_STAGE,
+    RequestTimings,
+)
+from .passthrough import (
+    DEFAULT_CONTENT_TYPE,
+    PassthroughResponse,
+    RawJSON,
+    load_raw,
+    peek_top_level,
+)
+from .cache import (
+    FRESH,
+    GRACE,
+    SERVABLE_STATES,
+    STALE,
+    autocomplete_cache,
+    canonical_quote_key,
+    negative_cache_ttl,
+    normalize_keyword,
+    quote_cache,
+    shift_pickups,
+    start_refresh,
+)
+from .autocomplete import (
+    SESSION_HEADER,
+    autocomplete_debouncer,
+    narrow_result,
+    prefix_keys,
+)
+from .gazetteer import get_gazetteer
+from .idempotency import (
+    IDEMPOTENCY_KEY_HEADER,
+    IDEMPOTENT_REPLAYED_HEADER,
+    MAX_KEY_LENGTH,
+    REPLAYED_HEADERS,
+    claim_key,
+    complete_key,
+    reclaim_key,
+    release_key,
+    remember_reservation,
+    request_fingerprint,
+)
+from .pipeline import BudgetExceeded, ReservationPipeline
+from .prewarm import route_demand
+from .singleflight import autocomplete_flight, quote_flight
+from .streaming import STREAM_CONTENT_TYPES, stream_records, streaming_response
 from .services import fetch_legacy_autocomplete
-from .models import LegacyAPIToken
+from .models import PaymentLinkJob
+from .payment_jobs import job_status, start_payment_link_job
+from .tokens import get_cached_token, refresh_token
 from .services import (
-    fetch_legacy_token,
     fetch_quote,
     fetch_reservation_create,
     fetch_payment_link,
     fetch_my_booking,
 )
 
+# Payment methods that require a payment link after the reservation is created
+PAYMENT_LINK_METHODS = ["STRIPE", "PAYPAL"]
+
+# Prefer header token asking for the payment link to be made in the background
+ASYNC_PREFERENCE = "respond-async"
+
+# Response header reporting HIT, MISS or BYPASS for cached proxy responses, or
+# UPDATING for an expired entry being refreshed and STALE for one served
+# because the upstream failed
+CACHE_STATUS_HEADER = "X-Cache-Status"
+
+# Headers kept when a response is shared between coalesced requests
+SHARED_RESPONSE_HEADERS = ["Retry-After"]
+
+SERVER_TIMING_HEADER = "Server-Timing"
+
+logger = logging.getLogger(__name__)
+
+
+def get_shared_headers(response):
+    return {
+        name: response[name]
+        for name in SHARED_RESPONSE_HEADERS
+        if response.has_header(name)
+    }
+
 
 class BaseLegacyProxyView(APIView):
     """
@@ -22,80 +116,306 @@ class BaseLegacyProxyView(APIView):
 
     permission_classes = [AllowAny]
 
+    # Key in LEGACY_PASSTHROUGH_ENDPOINTS, None if the body must be parsed
+    passthrough_name = None
+
     def get_legacy_token(self):
         """Get a valid token from cache/DB or fetch a new one."""
-        token_obj = LegacyAPIToken.get_valid_token()
+        token_obj = get_cached_token()
         if not token_obj:
-            token, expires_at = fetch_legacy_token()
-            token_obj = LegacyAPIToken.get_solo()
-            token_obj.token = token
-            token_obj.expires_at = expires_at
-            token_obj.save()
+            token_obj = self.refresh_legacy_token()
         return token_obj
 
+    def refresh_legacy_token(self, stale_token=None):
+        """Get a new token, refreshing it upstream at most once per cluster."""
+        return refresh_token(stale_token)
+
+    def budget_exceeded_response(self):
+        return Response(
+            {"error": "Upstream not answered within the time budget"},
+            status=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
+
+    def get_metrics_route(self):
+        """Route label of the stage latency histograms."""
+        request = getattr(self, "request", None)
+        if getattr(request, "resolver_match", None) is None:
+            # Called outside of the URLconf, e.g. by another view
+            return type(self).__name__
+        return get_route(request)
+
+    def get_request_timings(self):
+        """Stage spans of the current request."""
+        if getattr(self, "timings", None) is None:
+            self.timings = RequestTimings(self.get_metrics_route())
+        return self.timings
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Render the response to time serialization, then report the spans."""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if not settings.LEGACY_SERVER_TIMING:
+            return response
+
+        timings = self.get_request_timings()
+        if isinstance(response, Response):
+            with timings.span(SERIALIZATION_STAGE):
+                response.render()
+        response[SERVER_TIMING_HEADER] = timings.server_timing()
+
+        # Already in the header and STAGE_LATENCY, only logged at DEBUG level
+        if logger.isEnabledFor(logging.DEBUG):
+            record = timings.as_dict()
+            record["status"] = response.status_code
+            logger.debug("proxy_timings %s", json.dumps(record))
+        return response
+
+    def build_proxy_response(self, status_code, data, validate_func=None):
+        """Validate the parsed upstream payload and map upstream errors."""
+        # Optional application-level validation
+        if status_code == 200 and validate_func:
+            with self.get_request_timings().span(VALIDATION_STAGE):
+                validation_error = validate_func(data)
+            if validation_error:
+                return validation_error
+
+        # Error mapping
+        if status_code >= 400:
+            if status_code == 422:
+                return Response(data, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            elif status_code >= 500:
+                return Response(
+                    {"error": "Upstream service unavailable"},
+                    status=status.HTTP_502_BAD_GATEWAY,
+                )
+            return Response(data, status=status_code)
+
+        return Response(data, status=status_code)
+
+    def use_passthrough(self):
+        """Whether upstream bodies are sent as is instead of parsed and re-encoded."""
+        return self.passthrough_name in settings.LEGACY_PASSTHROUGH_ENDPOINTS
+
+    def build_upstream_response(self, response, validate_func=None):
+        """Turn the upstream response into the client response."""
+        timings = self.get_request_timings()
+
+        if self.use_passthrough() and response.status_code < 500:
+            raw = RawJSON(
+                response.content,
+                response.headers.get("Content-Type", DEFAULT_CONTENT_TYPE),
+            )
+            validated = response.status_code == 200 and validate_func
+            # Validators only look at top-level keys, but the body is still
+            # fully decoded to get them (see peek_top_level). Error bodies are
+            # decoded too, an HTML error page maps to 502 as when parsing.
+            if validated or not 200 <= response.status_code < 300:
+                try:
+                    with timings.span(JSON_PARSE_STAGE):
+                        raw.top_level = peek_top_level(raw.content)
+                except ValueError:
+                    return Response(
+                        {"error": "Invalid JSON from upstream"},
+                        status=status.HTTP_502_BAD_GATEWAY,
+                    )
+            if validated:
+                with timings.span(VALIDATION_STAGE):
+                    validation_error = validate_func(raw.top_level)
+                if validation_error:
+                    return validation_error
+            return PassthroughResponse(raw, status=response.status_code)
+
+        # JSON Parsing
+        try:
+            with timings.span(JSON_PARSE_STAGE):
+                data = response.json()
+        except ValueError:
+            return Response(
+                {"error": "Invalid JSON from upstream"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+
+        return self.build_proxy_response(response.status_code, data, validate_func)
+
+    def make_proxy_response(self, data, status_code, headers=None):
+        """Response for a cached or shared payload, parsed or raw."""
+        if isinstance(data, RawJSON):
+            return PassthroughResponse(data, status=status_code, headers=headers)
+        return Response(data, status=status_code, headers=headers)
+
+    def circuit_open_response(self, exc):
+        """Fail fast while the upstream endpoint's circuit breaker is open."""
+        return Response(
+            {"error": "Upstream service temporarily unavailable"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+    def negative_ttl(self, response):
+        """
+        TTL of a 200 response carrying an application-level error or no
+        results, None for the other responses.
+        """
+        if response.status_code != status.HTTP_200_OK:
+            return None
+        return negative_cache_ttl(response.data)
+
+    def store_result(
+        self, cache, cache_key, response, is_cacheable, cost=None, ttl=None
+    ):
+        """
+        Cache a response if cacheable, for `ttl` seconds or the cache TTL.
+        Negative answers are cached for their LEGACY_NEGATIVE_CACHE_TTLS TTL
+        instead (capped by `ttl`), so retries of a search that found nothing
+        don't reach the upstream.
+        """
+        negative_ttl = self.negative_ttl(response)
+        if negative_ttl is None:
+            if is_cacheable(response):
+                cache.set(cache_key, response.data, ttl=ttl, cost=cost)
+        elif negative_ttl > 0:
+            if ttl is not None:
+                negative_ttl = min(negative_ttl, ttl)
+            cache.set(
+                cache_key, response.data, ttl=negative_ttl, cost=cost, negative=True
+            )
+
+    def store_fetched(self, cache, cache_key, fetch_func, is_cacheable):
+        """Fetch a response and cache it if cacheable, with what it cost."""
+        started = time.monotonic()
+        response = fetch_func()
+        cost = time.monotonic() - started
+        self.store_result(cache, cache_key, response, is_cacheable, cost=cost)
+        return response
+
+    def refresh_cached(self, cache, cache_key, fetch_func, is_cacheable):
+        """Refresh an entry in the background, once for all the workers."""
+        if not cache.claim_refresh(cache_key):
+            return
+
+        def refresh():
+            try:
+                self.store_fetched(cache, cache_key, fetch_func, is_cacheable)
+            finally:
+                cache.release_refresh(cache_key)
+
+        start_refresh(refresh)
+
+    def cache_lookup(self, cache, cache_key, fetch_func, is_cacheable):
+        """
+        Look a key up and start the background refresh of an entry that is
+        expiring or expired.
+
+        Returns:
+            tuple: (cached value, TieredCache.lookup() state)
+        """
+        cached, state = cache.lookup(cache_key)
+        if state in SERVABLE_STATES and state != FRESH:
+            self.refresh_cached(cache, cache_key, fetch_func, is_cacheable)
+        return cached, state
+
+    def cached_status(self, state):
+        return "UPDATING" if state == GRACE else "HIT"
+
+    def fetch_through_cache(
+        self, cache, flight, cache_key, fetch_func, is_cacheable, stale=None
+    ):
+        """
+        Fetch a response once for every concurrent request with the same key
+        and store it if cacheable. When the upstream fails, the `stale` value
+        is served instead if there is one.
+
+        Returns:
+            tuple: (Response, X-Cache-Status value)
+        """
+
+        def fetch():
+            response = self.store_fetched(cache, cache_key, fetch_func, is_cacheable)
+            return response.data, response.status_code, get_shared_headers(response)
+
+        def lookup():
+            cached = cache.get(cache_key)
+            return None if cached is None else (cached, status.HTTP_200_OK, {})
+
+        data, status_code, headers = flight.do(cache_key, fetch, lookup)
+        if stale is not None and status_code >= 500:
+            return self.make_proxy_response(stale, status.HTTP_200_OK), "STALE"
+        return self.make_proxy_response(data, status_code, headers), "MISS"
+
+    def cached_proxy_request(self, cache, flight, cache_key, fetch_func, is_cacheable):
+        """
+        Serve a response from cache, or fetch it once for every concurrent
+        request with the same key and store it if cacheable.
+
+        Entries picked for early recomputation or within their grace window
+        are served while one request refreshes them in the background.
+        Entries within their stale-if-error window are only served when the
+        upstream fails.
+
+        Returns:
+            tuple: (Response, X-Cache-Status value)
+        """
+        cached, state = self.cache_lookup(cache, cache_key, fetch_func, is_cacheable)
+        if state in SERVABLE_STATES:
+            response = self.make_proxy_response(cached, status.HTTP_200_OK)
+            return response, self.cached_status(state)
+        return self.fetch_through_cache(
+            cache,
+            flight,
+            cache_key,
+            fetch_func,
+            is_cacheable,
+            stale=cached if state == STALE else None,
+        )
+
     def execute_proxy_request(
         self, request_func, payload, requires_auth=True, validate_func=None
     ):
         """Standard flow for all proxy requests."""
+        timings = self.get_request_timings()
+        endpoint = getattr(request_func, "__name__", None)
         try:
             token = None
             if requires_auth:
                 try:
-                    token_obj = self.get_legacy_token()
+                    with timings.span(TOKEN_STAGE):
+                        token_obj = self.get_legacy_token()
                     token = token_obj.token
+                except BudgetExceeded:
+                    return self.budget_exceeded_response()
                 except requests.RequestException:
                     return Response(
                         {"error": "Upstream authentication failed"},
                         status=status.HTTP_502_BAD_GATEWAY,
                     )
 
-            response = (
-                request_func(token, payload) if requires_auth else request_func(payload)
-            )
+            with timings.span(UPSTREAM_STAGE, endpoint):
+                response = (
+                    request_func(token, payload)
+                    if requires_auth
+                    else request_func(payload)
+                )
 
             # Retry on 401
             if requires_auth and response.status_code == 401:
                 try:
-                    token, expires_at = fetch_legacy_token()
-                    token_obj = LegacyAPIToken.get_solo()
-                    token_obj.token = token
-                    token_obj.expires_at = expires_at
-                    token_obj.save()
-                    response = request_func(token, payload)
+                    with timings.span(TOKEN_REFRESH_STAGE):
+                        token = self.refresh_legacy_token(stale_token=token).token
+                    with timings.span(UPSTREAM_STAGE, endpoint):
+                        response = request_func(token, payload)
+                except BudgetExceeded:
+                    return self.budget_exceeded_response()
                 except requests.RequestException:
                     return Response(
                         {"error": "Upstream authentication failed during retry"},
                         status=status.HTTP_502_BAD_GATEWAY,
                     )
 
-            # JSON Parsing
-            try:
-                data = response.json()
-            except ValueError:
-                return Response(
-                    {"error": "Invalid JSON from upstream"},
-                    status=status.HTTP_502_BAD_GATEWAY,
-                )
-
-            # Optional application-level validation
-            if response.status_code == 200 and validate_func:
-                validation_error = validate_func(data)
-                if validation_error:
-                    return validation_error
-
-            # Error mapping
-            if response.status_code >= 400:
-                if response.status_code == 422:
-                    return Response(data, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-                elif response.status_code >= 500:
-                    return Response(
-                        {"error": "Upstream service unavailable"},
-                        status=status.HTTP_502_BAD_GATEWAY,
-                    )
-                return Response(data, status=response.status_code)
-
-            return Response(data, status=response.status_code)
+            return self.build_upstream_response(response, validate_func)
 
+        except CircuitOpenError as exc:
+            return self.circuit_open_response(exc)
+        except BudgetExceeded:
+            return self.budget_exceeded_response()
         except requests.RequestException:
             return Response(
                 {"error": "Upstream service unreachable"},
@@ -106,18 +426,157 @@ class BaseLegacyProxyView(APIView):
 class AutocompleteProxyView(BaseLegacyProxyView):
     """
     Proxy view for the legacy autocomplete API.
+
+    A keyword is answered, in order, from the gazetteer snapshot, from the
+    cached result of the keyword (refreshed in the background once it
+    expires), or by filtering the cached result of a shorter prefix that the
+    upstream did not truncate. Only then does it go upstream, unless the
+    client session already sent a newer keyword (LEGACY_AUTOCOMPLETE_DEBOUNCE),
+    and fall back to the expired result if that fails.
     """
 
+    passthrough_name = "autocomplete"
+
+    def is_cacheable_autocomplete(self, response):
+        return response.status_code == 200
+
+    def keyword_too_short_response(self):
+        return Response(
+            {
+                "error": "Keyword must be at least "
+                f"{settings.LEGACY_AUTOCOMPLETE_MIN_LENGTH} characters"
+            },
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    def gazetteer_response(self, keyword):
+        """Answer from the local gazetteer snapshot, None on a miss."""
+        index = get_gazetteer()
+        if index is None:
+            return None
+        with self.get_request_timings().span(GAZETTEER_STAGE):
+            record_ids = index.search(keyword)
+            if not record_ids:
+                return None
+            raw = RawJSON(index.response_body(record_ids))
+        return PassthroughResponse(raw, status=status.HTTP_200_OK)
+
+    def reuse_cached(self, keyword, cached_key, cached):
+        """
+        Response from the cached result of the keyword or of a prefix.
+
+        Returns:
+            tuple: (Response or None, narrowed result to cache or None)
+        """
+        if cached_key is None:
+            return None, None
+        if cached_key == keyword:
+            return self.make_proxy_response(cached, status.HTTP_200_OK), None
+        narrowed = narrow_result(cached, keyword)
+        if narrowed is None:
+            return None, None
+        return Response(narrowed, status=status.HTTP_200_OK), narrowed
+
+    def cached_response(self, keyword):
+        """
+        Response from the cached result of the keyword or of a prefix. A
+        narrowed result is cached until the prefix result it came from
+        expires, so it never outlives the upstream data.
+        """
+        cached_key, cached, ttl = autocomplete_cache.get_first(prefix_keys(keyword))
+        response, narrowed = self.reuse_cached(keyword, cached_key, cached)
+        if narrowed is not None:
+            self.store_result(
+                autocomplete_cache,
+                keyword,
+                response,
+                self.is_cacheable_autocomplete,
+                ttl=ttl,
+            )
+        return response
+
+    def get_debounce_session(self, request):
+        """Typing session of the client, None when it isn't debounced."""
+        if settings.LEGACY_AUTOCOMPLETE_DEBOUNCE <= 0:
+            return None
+        return request.headers.get(SESSION_HEADER) or None
+
+    def mark_keyword(self, request):
+        """
+        Mark the keyword as the latest of its session.
+
+        Returns:
+            tuple: (session, token, marked_at) or None when it isn't debounced
+        """
+        session = self.get_debounce_session(request)
+        if session is None:
+            return None
+        return session, autocomplete_debouncer.mark(session), time.monotonic()
+
+    def debounce_wait(self, mark):
+        """Seconds left of the LEGACY_AUTOCOMPLETE_DEBOUNCE window of `mark`."""
+        elapsed = time.monotonic() - mark[2]
+        return max(settings.LEGACY_AUTOCOMPLETE_DEBOUNCE - elapsed, 0)
+
+    def is_superseded(self, mark):
+        """
+        True if the session sent a newer keyword within the debounce window
+        of `mark`. The worker sleeps out what the cache lookups left of the
+        window, only for clients sending a session header.
+        """
+        if mark is None:
+            return False
+        wait = self.debounce_wait(mark)
+        if wait:
+            with self.get_request_timings().span(DEBOUNCE_STAGE):
+                time.sleep(wait)
+        session, token, _ = mark
+        return not autocomplete_debouncer.is_latest(session, token)
+
     def post(self, request, *args, **kwargs):
         keyword = request.data.get("keyword")
         if not keyword:
             return Response(
                 {"error": "Keyword is required"}, status=status.HTTP_400_BAD_REQUEST
             )
+        normalized = normalize_keyword(keyword)
+        if len(normalized) < settings.LEGACY_AUTOCOMPLETE_MIN_LENGTH:
+            return self.keyword_too_short_response()
 
-        return self.execute_proxy_request(
-            fetch_legacy_autocomplete, keyword, requires_auth=False
+        response = self.gazetteer_response(keyword)
+        if response is not None:
+            return response
+
+        mark = self.mark_keyword(request)
+
+        def fetch():
+            return self.execute_proxy_request(
+                fetch_legacy_autocomplete, keyword, requires_auth=False
+            )
+
+        cached, state = self.cache_lookup(
+            autocomplete_cache, normalized, fetch, self.is_cacheable_autocomplete
+        )
+        if state in SERVABLE_STATES:
+            return self.make_proxy_response(cached, status.HTTP_200_OK)
+
+        response = self.cached_response(normalized)
+        if response is not None:
+            return response
+
+        if self.is_superseded(mark):
+            # The client already moved on to a longer keyword
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        response, _ = self.fetch_through_cache(
+            autocomplete_cache,
+            autocomplete_flight,
+            normalized,
+            fetch,
+            self.is_cacheable_autocomplete,
+            stale=cached if state == STALE else None,
         )
+        return response
 
 
 class QuoteProxyView(BaseLegacyProxyView):
@@ -126,6 +585,8 @@ class QuoteProxyView(BaseLegacyProxyView):
     Handles token authentication internally.
     """
 
+    passthrough_name = "quote"
+
     def validate_quote_structure(self, data):
         # 1. Pass through if upstream reports an application-level error (e.g. no_availability)
         if "error" in data:
@@ -142,9 +603,355 @@ class QuoteProxyView(BaseLegacyProxyView):
             )
         return None
 
+    def get_quote_cache_key(self, request, payload=None):
+        """Canonical cache key for the request, or None to bypass the cache."""
+        payload = request.data if payload is None else payload
+        cache_control = request.headers.get("Cache-Control", "")
+        if "no-cache" in cache_control or "no-store" in cache_control:
+            return None
+        if not isinstance(payload, dict) or not settings.LEGACY_QUOTE_CACHE_TTL:
+            return None
+        return canonical_quote_key(payload)
+
+    def is_cacheable_quote(self, response):
+        """
+        Only store valid quotes, application errors are only cached as
+        negative answers.
+        """
+        return (
+            response.status_code == 200
+            and isinstance(response.data, (dict, RawJSON))
+            and "error" not in response.data
+        )
+
+    def quote(self, payload, cache_key):
+        """
+        Quote one payload, through the quote cache unless cache_key is None.
+
+        Returns:
+            tuple: (Response, X-Cache-Status value)
+        """
+        if cache_key is None:
+            response = self.execute_proxy_request(
+                fetch_quote, payload, validate_func=self.validate_quote_structure
+            )
+            return response, "BYPASS"
+
+        return self.cached_proxy_request(
+            quote_cache,
+            quote_flight,
+            cache_key,
+            lambda: self.execute_proxy_request(
+                fetch_quote, payload, validate_func=self.validate_quote_structure
+            ),
+            self.is_cacheable_quote,
+        )
+
     def post(self, request, *args, **kwargs):
-        return self.execute_proxy_request(
-            fetch_quote, request.data, validate_func=self.validate_quote_structure
+        # Popular routes are pre-warmed into the quote cache
+        route_demand.record(request.data)
+        response, cache_status = self.quote(
+            request.data, self.get_quote_cache_key(request)
+        )
+        response[CACHE_STATUS_HEADER] = cache_status
+        return response
+
+
+class QuoteBatchProxyView(QuoteProxyView):
+    """
+    Quote several payloads in one request.
+
+    Expects {"quotes": [payload, ...]} with at most LEGACY_QUOTE_BATCH_MAX_SIZE
+    payloads. The token is acquired once for the whole batch, and quotes are
+    fetched LEGACY_QUOTE_BATCH_CONCURRENCY at a time through the quote cache.
+    Results keep the order of the payloads, each with the status and body the
+    single quote endpoint would have returned.
+
+    With ?stream=ndjson or ?stream=sse, each result is sent as soon as its
+    quote completes, tagged with its index, followed by a summary record.
+    """
+
+    token_obj = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.token_lock = threading.Lock()
+
+    def get_legacy_token(self):
+        if self.token_obj is None:
+            self.token_obj = super().get_legacy_token()
+        return self.token_obj
+
+    def refresh_legacy_token(self, stale_token=None):
+        with self.token_lock:
+            # Another quote of the batch may have refreshed it already
+            if self.token_obj is None or self.token_obj.token == stale_token:
+                self.token_obj = super().refresh_legacy_token(stale_token)
+            return self.token_obj
+
+    def get_batch_payloads(self, request):
+        """
+        Returns:
+            tuple: (list of payloads, None) or (None, error Response)
+        """
+        quotes = request.data.get("quotes") if isinstance(request.data, dict) else None
+        if (
+            not isinstance(quotes, list)
+            or not quotes
+            or not all(isinstance(payload, dict) for payload in quotes)
+        ):
+            return None, Response(
+                {"error": "'quotes' must be a non-empty list of quote payloads"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(quotes) > settings.LEGACY_QUOTE_BATCH_MAX_SIZE:
+            return None, Response(
+                {
+                    "error": f"At most {settings.LEGACY_QUOTE_BATCH_MAX_SIZE} "
+                    "quotes per batch"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return quotes, None
+
+    @property
+    def concurrency(self):
+        """Upstream calls in flight at once."""
+        return settings.LEGACY_QUOTE_BATCH_CONCURRENCY
+
+    def get_stream_format(self, request):
+        """
+        Returns:
+            tuple: (?stream= value or None, None) or (None, error Response)
+        """
+        stream_format = request.query_params.get("stream")
+        if stream_format is None or stream_format in STREAM_CONTENT_TYPES:
+            return stream_format, None
+        return None, Response(
+            {"error": f"'stream' must be one of: {', '.join(STREAM_CONTENT_TYPES)}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def batch_result(self, response, cache_status):
+        """Entry of the results list for one quote."""
+        result = {
+            "status": response.status_code,
+            "cache": cache_status,
+            "data": load_raw(response.data),
+        }
+        if response.has_header("Retry-After"):
+            result["retry_after"] = int(response["Retry-After"])
+        return result
+
+    def stream_record(self, index, response, cache_status):
+        """Streamed record of the quote at `index`."""
+        return {
+            "type": "result",
+            "index": index,
+            **self.batch_result(response, cache_status),
+        }
+
+    def acquire_batch_token(self):
+        """Acquire the token shared by the batch, or return the error Response."""
+        try:
+            with self.get_request_timings().span(TOKEN_STAGE):
+                self.get_legacy_token()
+        except CircuitOpenError as exc:
+            return self.circuit_open_response(exc)
+        except requests.RequestException:
+            return Response(
+                {"error": "Upstream authentication failed"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+        return None
+
+    def quote_batch_item(self, payload):
+        try:
+            return self.quote(payload, self.get_quote_cache_key(self.request, payload))
+        finally:
+            # Only opened by a token refresh, don't leak it with the thread
+            connection.close()
+
+    def quote_many(self, payloads):
+        """
+        Quote every payload, `concurrency` at a time.
+
+        Returns:
+            list: (Response, X-Cache-Status value) in the order of the payloads
+        """
+        workers = min(self.concurrency, len(payloads))
+        pool = ThreadPoolExecutor(workers, thread_name_prefix="legacy-quote-batch")
+        with pool:
+            return list(pool.map(self.quote_batch_item, payloads))
+
+    def iter_quotes(self, payloads):
+        """Yield (index, Response, X-Cache-Status value) as quotes complete."""
+        workers = min(self.concurrency, len(payloads))
+        pool = ThreadPoolExecutor(workers, thread_name_prefix="legacy-quote-batch")
+        try:
+            futures = {
+                pool.submit(self.quote_batch_item, payload): index
+                for index, payload in enumerate(payloads)
+            }
+            for future in as_completed(futures):
+                yield (futures[future], *future.result())
+        finally:
+            # The client may have gone away, drop the quotes not started yet
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def post(self, request, *args, **kwargs):
+        stream_format, error = self.get_stream_format(request)
+        if error:
+            return error
+
+        quotes, error = self.get_batch_payloads(request)
+        if error:
+            return error
+
+        error = self.acquire_batch_token()
+        if error:
+            return error
+
+        if stream_format:
+            return streaming_response(
+                stream_format,
+                stream_records(
+                    stream_format, self.iter_quotes(quotes), self.stream_record
+                ),
+            )
+
+        results = [self.batch_result(*quoted) for quoted in self.quote_many(quotes)]
+        return Response({"results": results})
+
+
+class QuoteCalendarProxyView(QuoteBatchProxyView):
+    """
+    Cheapest price of a route for every day of a date range.
+
+    Expects {"quote": payload, "start_date": "YYYY-MM-DD", "end_date":
+    "YYYY-MM-DD"}, both dates included. The pickup times of the payload are
+    moved to each day, keeping their time and the gap between the legs, and
+    the quotes are fetched like a batch. Each day reports the minimum item
+    price and the number of options instead of the full item list.
+
+    Days can be streamed as they complete, like batch results.
+    """
+
+    calendar_dates = ()
+
+    @property
+    def concurrency(self):
+        return settings.LEGACY_QUOTE_CALENDAR_CONCURRENCY
+
+    def get_calendar_payloads(self, request):
+        """
+        Returns:
+            tuple: (list of (date, payload), None) or (None, error Response)
+        """
+        data = request.data if isinstance(request.data, dict) else {}
+        payload = data.get("quote")
+        try:
+            start_date = date.fromisoformat(str(data.get("start_date")))
+            end_date = date.fromisoformat(str(data.get("end_date")))
+            pickup = datetime.fromisoformat(str(payload["start"]["pickup"]).strip())
+            # Also rejects an unparseable end.pickup
+            shift_pickups(payload, 0)
+        except (KeyError, TypeError, ValueError):
+            return None, Response(
+                {
+                    "error": "'quote' with a start.pickup, 'start_date' and "
+                    "'end_date' (YYYY-MM-DD) are required"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        days = (end_date - start_date).days + 1
+        if not 0 < days <= settings.LEGACY_QUOTE_CALENDAR_MAX_DAYS:
+            return None, Response(
+                {
+                    "error": "The date range must span 1 to "
+                    f"{settings.LEGACY_QUOTE_CALENDAR_MAX_DAYS} days"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        first_shift = (start_date - pickup.date()).days
+        return [
+            (
+                start_date + timedelta(days=offset),
+                shift_pickups(payload, first_shift + offset),
+            )
+            for offset in range(days)
+        ], None
+
+    def calendar_day(self, day, response, cache_status):
+        """Compact entry of the calendar for one day."""
+        data = load_raw(response.data)
+        entry = {
+            "date": day.isoformat(),
+            "status": response.status_code,
+            "cache": cache_status,
+            "min_price": None,
+            "options": 0,
+        }
+        error = data.get("error") if isinstance(data, dict) else None
+        if error:
+            if isinstance(error, dict):
+                error = error.get("code", error)
+            entry["error"] = error
+        elif response.status_code == 200:
+            # A falsy "error" skips the quote validator, "items" may be missing
+            items = data.get("items") if isinstance(data, dict) else None
+            items = items if isinstance(items, list) else []
+            prices = [
+                item["price"]
+                for item in items
+                if isinstance(item, dict)
+                and isinstance(item.get("price"), (int, float))
+            ]
+            entry["min_price"] = min(prices, default=None)
+            entry["options"] = len(items)
+        return entry
+
+    def stream_record(self, index, response, cache_status):
+        return {
+            "type": "day",
+            "index": index,
+            **self.calendar_day(self.calendar_dates[index], response, cache_status),
+        }
+
+    def post(self, request, *args, **kwargs):
+        stream_format, error = self.get_stream_format(request)
+        if error:
+            return error
+
+        days, error = self.get_calendar_payloads(request)
+        if error:
+            return error
+
+        error = self.acquire_batch_token()
+        if error:
+            return error
+
+        payloads = [payload for _, payload in days]
+        if stream_format:
+            self.calendar_dates = [day for day, _ in days]
+            return streaming_response(
+                stream_format,
+                stream_records(
+                    stream_format, self.iter_quotes(payloads), self.stream_record
+                ),
+            )
+
+        quoted = self.quote_many(payloads)
+        return Response(
+            {
+                "currency": request.data["quote"].get("currency"),
+                "days": [
+                    self.calendar_day(day, *result)
+                    for (day, _), result in zip(days, quoted)
+                ],
+            }
         )
 
 
@@ -152,8 +959,48 @@ class ReservationCreateProxyView(BaseLegacyProxyView):
     """
     Proxy view for the legacy Reservation Create API.
     Handles token authentication internally.
+
+    Requests with an Idempotency-Key header create at most one reservation:
+    duplicates sent while the first is running wait for it, and later ones
+    get its response replayed without calling the upstream. When the
+    reservation was created but its payment link failed, a retry generates
+    the link again instead of replaying the failure.
     """
 
+    # IdempotencyRecord.endpoint of this view
+    idempotency_endpoint = "reservation_create"
+
+    # Set once the upstream created the reservation
+    reservation_created = False
+
+    # IdempotencyRecord claimed by the request, if it sent a key
+    idempotency_record = None
+
+    # ReservationPipeline of the request, set by create_reservation()
+    pipeline = None
+
+    def get_legacy_token(self):
+        """The token of the pipeline, read once for all its stages."""
+        if self.pipeline is None:
+            return super().get_legacy_token()
+        if self.pipeline.token_obj is None:
+            self.pipeline.token_obj = super().get_legacy_token()
+        return self.pipeline.token_obj
+
+    def refresh_legacy_token(self, stale_token=None):
+        """A new token, waited for and fetched within the pipeline budget."""
+        if self.pipeline is None:
+            return super().refresh_legacy_token(stale_token)
+        token_obj = refresh_token(stale_token, get_timeout=self.pipeline.timeout)
+        self.pipeline.token_obj = token_obj
+        return token_obj
+
+    def payment_link_timeout_response(self):
+        return Response(
+            {"error": "Payment link not generated within the time budget"},
+            status=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
+
     def validate_reservation_response(self, data):
         """
         Validate the structure of a successful reservation creation response.
@@ -205,23 +1052,204 @@ class ReservationCreateProxyView(BaseLegacyProxyView):
                     return data["config"]["code"]
         return None
 
+    def get_payment_method(self, request):
+        """Normalized payment method requested by the client."""
+        # Convert to string to avoid AttributeError if None
+        val = request.data.get("payment_method")
+        return str(val).upper() if val else ""
+
+    def get_payment_link_kwargs(self, request, reservation_id, payment_method):
+        """Keyword arguments for fetch_payment_link, minus the token."""
+        # WORKAROUND: Force relative paths to avoid "http://..." doubling
+        # This means localhost users will be redirected to cancunsairporttransportation.com
+        from urllib.parse import urlparse
+
+        cancel_val = request.data.get("cancel_url")
+        success_val = request.data.get("success_url")
+
+        # Helper to strip domain
+        def to_relative(url):
+            if not url:
+                return url
+            parsed = urlparse(str(url))
+            return parsed.path if parsed.path else str(url)
+
+        return {
+            "reservation_id": reservation_id,
+            "payment_provider": payment_method,
+            "language": request.data.get("language", "en"),
+            "success_url": to_relative(success_val),
+            "cancel_url": to_relative(cancel_val),
+        }
+
+    def build_payment_link_response(self, payment_response):
+        """Map the upstream payment handler response to the client response."""
+        # Parse JSON
+        try:
+            link_data = payment_response.json()
+        except ValueError:
+            return Response(
+                {"error": "Invalid JSON from payment provider upstream"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+
+        # Return ONLY the payment link
+        return Response({"payment_link": link_data.get("url")}, status=status.HTTP_200_OK)
+
+    def prefers_async(self, request):
+        """Whether the client sent Prefer: respond-async."""
+        preferences = request.headers.get("Prefer", "").lower().split(",")
+        return ASYNC_PREFERENCE in (item.split(";")[0].strip() for item in preferences)
+
+    def payment_link_job_response(self, request, job):
+        """202 with the reservation and the handle of its payment link job."""
+        status_url = request.build_absolute_uri(
+            reverse("legacy_payment_link_job", args=[job.pk])
+        )
+        return Response(
+            {
+                "reservation_id": job.reservation_id,
+                "payment_link_job": {
+                    "id": str(job.pk),
+                    "status": job.status,
+                    "status_url": status_url,
+                },
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": status_url, "Preference-Applied": ASYNC_PREFERENCE},
+        )
+
+    def get_idempotency_key(self, request):
+        """
+        Returns:
+            tuple: (key or None, None) or (None, error Response)
+        """
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None:
+            return None, None
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return None, Response(
+                {
+                    "error": f"{IDEMPOTENCY_KEY_HEADER} must be 1 to "
+                    f"{MAX_KEY_LENGTH} characters"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return key, None
+
+    def replay_idempotent(self, record, fingerprint):
+        """Response for a key claimed by another request, None while it runs."""
+        if record.request_hash != fingerprint:
+            return Response(
+                {"error": f"{IDEMPOTENCY_KEY_HEADER} was used for another request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record.status != record.COMPLETED:
+            return None
+        return Response(
+            record.response_body,
+            status=record.response_status,
+            headers={**record.response_headers, IDEMPOTENT_REPLAYED_HEADER: "true"},
+        )
+
+    def is_resumable(self, record, fingerprint):
+        """Whether a completed key's reservation still lacks its payment link."""
+        return (
+            record.status == record.COMPLETED
+            and record.request_hash == fingerprint
+            and bool(record.reservation_id)
+            and record.response_status >= 500
+        )
+
+    def idempotency_conflict_response(self):
+        return Response(
+            {"error": "A request with this Idempotency-Key is still in progress"},
+            status=status.HTTP_409_CONFLICT,
+            headers={"Retry-After": "1"},
+        )
+
+    def finish_idempotent(self, record, response):
+        """Keep the response for retries, unless no reservation was made."""
+        if response.status_code < 500 or self.reservation_created:
+            headers = {
+                name: response[name]
+                for name in REPLAYED_HEADERS
+                if response.has_header(name)
+            }
+            complete_key(record, response.status_code, response.data, headers)
+        else:
+            # Upstream unreachable or failing, a retry may go through
+            release_key(record)
+
+    def abandon_idempotent(self, record):
+        """
+        Forget the key of a request that raised, unless it created the
+        reservation: the record then stays "processing", and the request
+        taking it over once stale resumes from the reservation.
+        """
+        if not self.reservation_created:
+            release_key(record)
+
+    def remember_reservation(self, data):
+        """Store the created reservation on the claimed key, if any."""
+        reservation_id = self.extract_reservation_id(data)
+        if self.idempotency_record is not None and reservation_id:
+            remember_reservation(self.idempotency_record, reservation_id)
+
     def post(self, request, *args, **kwargs):
+        key, error = self.get_idempotency_key(request)
+        if error:
+            return error
+        if key is None:
+            return self.create_reservation(request)
+
+        fingerprint = request_fingerprint(request.data)
+        deadline = time.monotonic() + settings.LEGACY_IDEMPOTENCY_WAIT
+        while True:
+            record, claimed = claim_key(self.idempotency_endpoint, key, fingerprint)
+            if not claimed and self.is_resumable(record, fingerprint):
+                claimed = reclaim_key(record)
+            if claimed:
+                break
+            response = self.replay_idempotent(record, fingerprint)
+            if response is not None:
+                return response
+            if time.monotonic() >= deadline:
+                return self.idempotency_conflict_response()
+            time.sleep(settings.LEGACY_IDEMPOTENCY_POLL_INTERVAL)
+
+        self.idempotency_record = record
+        try:
+            if record.reservation_id:
+                response = self.resume_reservation(request, record.reservation_id)
+            else:
+                response = self.create_reservation(request)
+        except BaseException:
+            self.abandon_idempotent(record)
+            raise
+        self.finish_idempotent(record, response)
+        return response
+
+    def create_reservation(self, request):
+        self.pipeline = ReservationPipeline()
+
         # 1. Create Reservation
         response = self.execute_proxy_request(
-            fetch_reservation_create,
+            self.pipeline.bind(fetch_reservation_create),
             request.data,
             validate_func=self.validate_reservation_response,
         )
 
         if response.status_code != 200:
             return response
+        self.reservation_created = True
+        self.remember_reservation(response.data)
 
         # 2. Check for Payment Generation Requirement (Stripe/PayPal)
-        # Convert to string to avoid AttributeError if None
-        val = request.data.get("payment_method")
-        payment_method = str(val).upper() if val else ""
+        payment_method = self.get_payment_method(request)
 
-        if payment_method in ["STRIPE", "PAYPAL"]:
+        if payment_method in PAYMENT_LINK_METHODS:
             reservation_data = response.data
             reservation_id = self.extract_reservation_id(reservation_data)
 
@@ -234,60 +1262,93 @@ class ReservationCreateProxyView(BaseLegacyProxyView):
                     status=status.HTTP_502_BAD_GATEWAY,
                 )
 
-            # 3. Get Payment Link
-            try:
-                # Reuse token from cache handling in base view
-                token_obj = self.get_legacy_token()
-
-                # WORKAROUND: Force relative paths to avoid "http://..." doubling
-                # This means localhost users will be redirected to cancunsairporttransportation.com
-                from urllib.parse import urlparse
-
-                cancel_val = request.data.get("cancel_url")
-                success_val = request.data.get("success_url")
-
-                # Helper to strip domain
-                def to_relative(url):
-                    if not url:
-                        return url
-                    parsed = urlparse(str(url))
-                    return parsed.path if parsed.path else str(url)
-
-                # Fetch payment link
-                payment_response = fetch_payment_link(
-                    token=token_obj.token,
-                    reservation_id=reservation_id,
-                    payment_provider=payment_method,
-                    language=request.data.get("language", "en"),
-                    success_url=to_relative(success_val),
-                    cancel_url=to_relative(cancel_val),
-                )
+            return self.payment_link_response(request, reservation_id)
 
-                # Raise error if non-200
-                payment_response.raise_for_status()
+        return response
 
-                # Parse JSON
-                try:
-                    link_data = payment_response.json()
-                except ValueError:
-                    return Response(
-                        {"error": "Invalid JSON from payment provider upstream"},
-                        status=status.HTTP_502_BAD_GATEWAY,
-                    )
+    def resume_reservation(self, request, reservation_id):
+        """
+        Finish a reservation created by an earlier request with the same key,
+        whose payment link failed or whose worker died.
+        """
+        self.pipeline = ReservationPipeline()
+        self.reservation_created = True
+        if self.get_payment_method(request) in PAYMENT_LINK_METHODS:
+            return self.payment_link_response(request, reservation_id)
+        return Response({"reservation_id": reservation_id}, status=status.HTTP_200_OK)
 
-                # 4. Return ONLY the payment link
-                return Response(
-                    {"payment_link": link_data.get("url")}, status=status.HTTP_200_OK
-                )
+    def payment_link_response(self, request, reservation_id):
+        """Payment link of a created reservation, or the job generating it."""
+        payment_kwargs = self.get_payment_link_kwargs(
+            request, reservation_id, self.get_payment_method(request)
+        )
+        if self.prefers_async(request):
+            # 3. Let a background job get the link, the client polls it
+            job = start_payment_link_job(reservation_id, payment_kwargs)
+            return self.payment_link_job_response(request, job)
 
-            except Exception:
-                # Catch requests.RequestException or other errors
-                return Response(
-                    {"error": "Failed to generate payment link"},
-                    status=status.HTTP_502_BAD_GATEWAY,
-                )
+        # 3. Get Payment Link
+        try:
+            payment_response = self.get_payment_link(payment_kwargs)
 
-        return response
+            # Raise error if non-200
+            payment_response.raise_for_status()
+
+            # 4. Return ONLY the payment link
+            return self.build_payment_link_response(payment_response)
+
+        except BudgetExceeded:
+            return self.payment_link_timeout_response()
+        except Exception:
+            # Catch requests.RequestException or other errors
+            return Response(
+                {"error": "Failed to generate payment link"},
+                status=status.HTTP_502_BAD_GATEWAY,
+            )
+
+    def get_payment_link(self, payment_kwargs):
+        """Fetch the payment link with the pipeline token and budget."""
+        timings = self.get_request_timings()
+        with timings.span(TOKEN_STAGE):
+            token = self.get_legacy_token().token
+        return self.pipeline.fetch_payment_link(
+            fetch_payment_link, timings, token, **payment_kwargs
+        )
+
+
+class PaymentLinkJobView(APIView):
+    """
+    Status of a payment link job started by the reservation create endpoint.
+
+    With ?wait=<seconds> the request is held until the job is done or the
+    wait (capped at LEGACY_PAYMENT_LINK_JOB_MAX_WAIT) runs out, so clients can
+    long-poll instead of polling.
+    """
+
+    permission_classes = [AllowAny]
+
+    def get_wait(self, request):
+        try:
+            wait = float(request.query_params.get("wait", 0))
+        except ValueError:
+            wait = 0
+        return min(max(wait, 0), settings.LEGACY_PAYMENT_LINK_JOB_MAX_WAIT)
+
+    def job_response(self, job):
+        if job is None:
+            return Response(
+                {"error": "Unknown payment link job"}, status=status.HTTP_404_NOT_FOUND
+            )
+        headers = {} if job.is_done else {"Retry-After": "1"}
+        return Response(job_status(job), headers=headers)
+
+    def get(self, request, job_id, *args, **kwargs):
+        deadline = time.monotonic() + self.get_wait(request)
+        while True:
+            job = PaymentLinkJob.objects.filter(pk=job_id).first()
+            if job is None or job.is_done or time.monotonic() >= deadline:
+                return self.job_response(job)
+            time.sleep(settings.LEGACY_PAYMENT_LINK_JOB_POLL_INTERVAL)
 
 
 class MyBookingProxyView(BaseLegacyProxyView):
@@ -295,6 +1356,8 @@ class MyBookingProxyView(BaseLegacyProxyView):
     Proxy view for retrieving existing reservation details.
     """
 
+    passthrough_name = "my_booking"
+
     def validate_my_booking_response(self, data):
         """
         Validate the structure of a successful reservation retrieval response.
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+from django.conf import settings
+
+from .prewarm import start_quote_prewarmer
+from .services import get_legacy_session, warm_up_first_async_client
+from .tokens import get_cached_token, refresh_token, start_token_renewer
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_connections(count=None):
+    """
+    Open `count` keep-alive connections to the legacy API in parallel so the
+    first user requests skip the TCP/TLS handshake.
+
+    Returns:
+        int: Number of connections successfully opened.
+    """
+    count = settings.LEGACY_WARMUP_CONNECTIONS if count is None else count
+    session = get_legacy_session()
+    url = settings.LEGACY_API_BASE_URL
+
+    def open_connection(_):
+        try:
+            # Read the full response so the connection goes back to the pool
+            session.head(url, timeout=5).close()
+            return True
+        except requests.RequestException:
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(count, 1)) as executor:
+        return sum(executor.map(open_connection, range(count)))
+
+
+async def awarm_up_connections(client, count=None):
+    """
+    Async variant of warm_up_connections(), for the httpx client of an event
+    loop.
+
+    Returns:
+        int: Number of connections successfully opened.
+    """
+    count = settings.LEGACY_WARMUP_CONNECTIONS if count is None else count
+    url = settings.LEGACY_API_BASE_URL
+
+    async def open_connection():
+        try:
+            await client.head(url, timeout=5)
+            return True
+        except httpx.HTTPError:
+            return False
+
+    return sum(await asyncio.gather(*(open_connection() for _ in range(count))))
+
+
+async def _warm_up_async_client(client):
+    opened = await awarm_up_connections(client)
+    logger.info("Legacy API async warm-up opened %s connection(s)", opened)
+
+
+def warm_up_worker():
+    """
+    Prepare a freshly forked worker: load (or refresh) the legacy token,
+    open pooled upstream connections and start the background token renewer
+    and quote pre-warmer.
+
+    With LEGACY_PROXY_ASYNC the async client is warmed up too, on the first
+    event loop, as soon as it exists.
+    """
+    try:
+        if get_cached_token() is None:
+            refresh_token()
+    except Exception:
+        logger.exception("Legacy API token warm-up failed")
+
+    opened = warm_up_connections()
+    logger.info("Legacy API warm-up opened %s connection(s)", opened)
+    if settings.LEGACY_PROXY_ASYNC:
+        warm_up_first_async_client(_warm_up_async_client)
+
+    start_token_renewer()
+    start_quote_prewarmer()
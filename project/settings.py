@@ -2,6 +2,7 @@ import os
 import sys
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 from django.templatetags.static import static
@@ -38,6 +39,206 @@ LEGACY_API_SECRET = os.getenv("LEGACY_API_SECRET")
 LEGACY_API_RATE_GROUP = os.getenv("LEGACY_API_RATE_GROUP")
 LEGACY_API_SITE_ID = os.getenv("LEGACY_API_SITE_ID", "25")
 
+# Pooled keep-alive client for the legacy API (per worker process)
+LEGACY_API_POOL_SIZE = int(os.getenv("LEGACY_API_POOL_SIZE", "10"))
+LEGACY_API_POOL_CONNECTIONS = int(os.getenv("LEGACY_API_POOL_CONNECTIONS", "4"))
+LEGACY_API_ASYNC_POOL_SIZE = int(os.getenv("LEGACY_API_ASYNC_POOL_SIZE", "200"))
+
+# Serve the legacy proxy views with native async handlers (ASGI deployments)
+LEGACY_PROXY_ASYNC = os.getenv("LEGACY_PROXY_ASYNC", "False") == "True"
+
+# Legacy proxy caches (local LRU per worker + shared Django cache)
+LEGACY_CACHE_ALIAS = os.getenv("LEGACY_CACHE_ALIAS", "default")
+LEGACY_CACHE_SYNC_INTERVAL = int(os.getenv("LEGACY_CACHE_SYNC_INTERVAL", "5"))
+LEGACY_AUTOCOMPLETE_CACHE_TTL = int(os.getenv("LEGACY_AUTOCOMPLETE_CACHE_TTL", "86400"))
+LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES = int(
+    os.getenv("LEGACY_AUTOCOMPLETE_CACHE_MAX_ENTRIES", "2000")
+)
+# Seconds an expired entry is still served while one request refreshes it
+LEGACY_AUTOCOMPLETE_CACHE_GRACE = int(
+    os.getenv("LEGACY_AUTOCOMPLETE_CACHE_GRACE", "3600")
+)
+# Seconds an expired entry is still served when the legacy API fails
+LEGACY_AUTOCOMPLETE_CACHE_STALE_IF_ERROR = int(
+    os.getenv("LEGACY_AUTOCOMPLETE_CACHE_STALE_IF_ERROR", "604800")
+)
+# Shorter keywords are refused without calling the legacy API
+LEGACY_AUTOCOMPLETE_MIN_LENGTH = int(os.getenv("LEGACY_AUTOCOMPLETE_MIN_LENGTH", "2"))
+# Page size of the upstream autocomplete: smaller cached results are complete,
+# and the result of a longer keyword is filtered out of them (0 disables it)
+LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT = int(
+    os.getenv("LEGACY_AUTOCOMPLETE_UPSTREAM_LIMIT", "10")
+)
+# Debounce of the autocomplete keywords of a client session, named by the
+# X-Autocomplete-Session header: a keyword is dropped (204) when the session
+# sends a newer one within this many seconds. Sync views sleep out the window
+# in their worker thread, keep it short (0 disables it)
+LEGACY_AUTOCOMPLETE_DEBOUNCE = float(os.getenv("LEGACY_AUTOCOMPLETE_DEBOUNCE", "0"))
+# Local snapshot of the autocomplete places, built by `manage.py sync_gazetteer`
+LEGACY_GAZETTEER_PATH = os.getenv(
+    "LEGACY_GAZETTEER_PATH", os.path.join(BASE_DIR, "var", "gazetteer.idx")
+)
+# Keywords the sync sends upstream to collect the places
+LEGACY_GAZETTEER_SEEDS = [
+    keyword.strip()
+    for keyword in os.getenv(
+        "LEGACY_GAZETTEER_SEEDS",
+        "cancun,aeropuerto,airport,hotel,zona hotelera,playa del carmen,tulum,"
+        "puerto morelos,puerto aventuras,akumal,costa mujeres,isla mujeres,"
+        "riviera maya,cozumel,holbox,bacalar,chetumal,valladolid,merida",
+    ).split(",")
+    if keyword.strip()
+]
+LEGACY_GAZETTEER_MAX_RESULTS = int(os.getenv("LEGACY_GAZETTEER_MAX_RESULTS", "20"))
+# Upstream calls of a sync: seeds whose page is full are expanded into longer
+# keywords, the ones left when it runs out are not answered from the snapshot
+LEGACY_GAZETTEER_MAX_KEYWORDS = int(
+    os.getenv("LEGACY_GAZETTEER_MAX_KEYWORDS", "1000")
+)
+# Upstream calls per second of a sync (0 doesn't space them)
+LEGACY_GAZETTEER_RATE = float(os.getenv("LEGACY_GAZETTEER_RATE", "2"))
+LEGACY_QUOTE_CACHE_TTL = int(os.getenv("LEGACY_QUOTE_CACHE_TTL", "60"))
+LEGACY_QUOTE_CACHE_MAX_ENTRIES = int(os.getenv("LEGACY_QUOTE_CACHE_MAX_ENTRIES", "500"))
+LEGACY_QUOTE_CACHE_COORD_PRECISION = int(
+    os.getenv("LEGACY_QUOTE_CACHE_COORD_PRECISION", "4")
+)
+# Prices go stale fast: a short grace window, and no stale-if-error by default
+LEGACY_QUOTE_CACHE_GRACE = int(os.getenv("LEGACY_QUOTE_CACHE_GRACE", "30"))
+LEGACY_QUOTE_CACHE_STALE_IF_ERROR = int(
+    os.getenv("LEGACY_QUOTE_CACHE_STALE_IF_ERROR", "0")
+)
+# XFetch beta of the probabilistic early refresh of cached entries, higher
+# refreshes earlier (0 disables it)
+LEGACY_CACHE_EARLY_RECOMPUTE_BETA = float(
+    os.getenv("LEGACY_CACHE_EARLY_RECOMPUTE_BETA", "1.0")
+)
+# Threads of each worker refreshing cache entries in the background
+LEGACY_CACHE_REFRESH_WORKERS = int(os.getenv("LEGACY_CACHE_REFRESH_WORKERS", "4"))
+# Seconds negative answers of the legacy API are cached, per error code as
+# "code=seconds,...": "empty" is an empty items list, "*" any other code,
+# and 0 never caches them. Negative answers are never served stale.
+LEGACY_NEGATIVE_CACHE_TTLS = {
+    code.strip(): int(seconds)
+    for code, _, seconds in (
+        entry.partition("=")
+        for entry in os.getenv(
+            "LEGACY_NEGATIVE_CACHE_TTLS", "no_availability=300,empty=300,*=60"
+        ).split(",")
+    )
+    if code.strip()
+}
+# Pre-warming of the quote cache for the most quoted routes (0 disables it)
+LEGACY_QUOTE_PREWARM_ROUTES = int(os.getenv("LEGACY_QUOTE_PREWARM_ROUTES", "30"))
+# Days ahead, today included, each route is quoted for
+LEGACY_QUOTE_PREWARM_DAYS = int(os.getenv("LEGACY_QUOTE_PREWARM_DAYS", "3"))
+# Upstream quote calls per second, and per run, left for pre-warming
+LEGACY_QUOTE_PREWARM_RATE = float(os.getenv("LEGACY_QUOTE_PREWARM_RATE", "2"))
+LEGACY_QUOTE_PREWARM_MAX_REQUESTS = int(
+    os.getenv("LEGACY_QUOTE_PREWARM_MAX_REQUESTS", "200")
+)
+# Seconds between runs by one of the workers, 0 leaves it to
+# `manage.py prewarm_quotes` on a cron. Pre-warmed quotes expire like the
+# others (LEGACY_QUOTE_CACHE_TTL plus its grace), so runs should be as close.
+# Needs a LEGACY_CACHE_ALIAS shared by the workers (not LocMem) to elect one.
+LEGACY_QUOTE_PREWARM_INTERVAL = int(os.getenv("LEGACY_QUOTE_PREWARM_INTERVAL", "0"))
+# Seconds each worker buffers its quoted routes before writing them
+LEGACY_QUOTE_DEMAND_FLUSH_INTERVAL = int(
+    os.getenv("LEGACY_QUOTE_DEMAND_FLUSH_INTERVAL", "60")
+)
+# Routes nobody quoted for this many days are no longer pre-warmed
+LEGACY_QUOTE_DEMAND_WINDOW_DAYS = int(
+    os.getenv("LEGACY_QUOTE_DEMAND_WINDOW_DAYS", "14")
+)
+LEGACY_TOKEN_VERSION_CHECK_INTERVAL = int(
+    os.getenv("LEGACY_TOKEN_VERSION_CHECK_INTERVAL", "5")
+)
+LEGACY_TOKEN_REFRESH_LOCK_TTL = int(os.getenv("LEGACY_TOKEN_REFRESH_LOCK_TTL", "30"))
+LEGACY_TOKEN_REFRESH_WAIT = float(os.getenv("LEGACY_TOKEN_REFRESH_WAIT", "10"))
+LEGACY_TOKEN_REFRESH_POLL_INTERVAL = float(
+    os.getenv("LEGACY_TOKEN_REFRESH_POLL_INTERVAL", "0.1")
+)
+
+# Background token renewal and warm-up of each gunicorn worker
+LEGACY_WORKER_WARMUP = os.getenv("LEGACY_WORKER_WARMUP", "True") == "True"
+LEGACY_WARMUP_CONNECTIONS = int(os.getenv("LEGACY_WARMUP_CONNECTIONS", "2"))
+LEGACY_TOKEN_RENEW_FRACTION = float(os.getenv("LEGACY_TOKEN_RENEW_FRACTION", "0.8"))
+LEGACY_TOKEN_RENEW_CHECK_INTERVAL = int(
+    os.getenv("LEGACY_TOKEN_RENEW_CHECK_INTERVAL", "300")
+)
+LEGACY_TOKEN_RENEW_RETRY_DELAY = int(os.getenv("LEGACY_TOKEN_RENEW_RETRY_DELAY", "60"))
+
+# Per-endpoint circuit breaker around the legacy API, state shared via LEGACY_CACHE_ALIAS
+LEGACY_BREAKER_ENABLED = os.getenv("LEGACY_BREAKER_ENABLED", "True") == "True"
+LEGACY_BREAKER_WINDOW = int(os.getenv("LEGACY_BREAKER_WINDOW", "30"))
+LEGACY_BREAKER_MIN_CALLS = int(os.getenv("LEGACY_BREAKER_MIN_CALLS", "10"))
+LEGACY_BREAKER_FAILURE_RATE = float(os.getenv("LEGACY_BREAKER_FAILURE_RATE", "0.5"))
+LEGACY_BREAKER_SLOW_CALL_SECONDS = float(
+    os.getenv("LEGACY_BREAKER_SLOW_CALL_SECONDS", "5")
+)
+LEGACY_BREAKER_OPEN_SECONDS = int(os.getenv("LEGACY_BREAKER_OPEN_SECONDS", "30"))
+LEGACY_BREAKER_PROBE_TIMEOUT = int(os.getenv("LEGACY_BREAKER_PROBE_TIMEOUT", "15"))
+LEGACY_BREAKER_SYNC_INTERVAL = float(os.getenv("LEGACY_BREAKER_SYNC_INTERVAL", "1"))
+
+# Server-Timing header on every legacy proxy response, and a timing log line
+# at DEBUG level
+LEGACY_SERVER_TIMING = os.getenv("LEGACY_SERVER_TIMING", "True") == "True"
+
+# Quote batch endpoint: payloads per request and upstream calls in flight
+LEGACY_QUOTE_BATCH_MAX_SIZE = int(os.getenv("LEGACY_QUOTE_BATCH_MAX_SIZE", "10"))
+LEGACY_QUOTE_BATCH_CONCURRENCY = int(os.getenv("LEGACY_QUOTE_BATCH_CONCURRENCY", "4"))
+
+# Price calendar endpoint: longest date range and upstream calls in flight
+LEGACY_QUOTE_CALENDAR_MAX_DAYS = int(os.getenv("LEGACY_QUOTE_CALENDAR_MAX_DAYS", "31"))
+LEGACY_QUOTE_CALENDAR_CONCURRENCY = int(
+    os.getenv("LEGACY_QUOTE_CALENDAR_CONCURRENCY", "4")
+)
+
+# Idempotency-Key support of the reservation create endpoint
+LEGACY_IDEMPOTENCY_TTL = int(os.getenv("LEGACY_IDEMPOTENCY_TTL", "86400"))
+# How long a duplicate waits for the first request, and how often it checks
+LEGACY_IDEMPOTENCY_WAIT = float(os.getenv("LEGACY_IDEMPOTENCY_WAIT", "30"))
+LEGACY_IDEMPOTENCY_POLL_INTERVAL = float(
+    os.getenv("LEGACY_IDEMPOTENCY_POLL_INTERVAL", "0.25")
+)
+# After this many seconds a request still "processing" is considered dead
+LEGACY_IDEMPOTENCY_LOCK_TTL = int(os.getenv("LEGACY_IDEMPOTENCY_LOCK_TTL", "120"))
+
+# Seconds the reservation create + payment link flow may take end to end. Sync
+# views bound each socket read by it, a trickling upstream may overrun it once
+LEGACY_RESERVATION_BUDGET = float(os.getenv("LEGACY_RESERVATION_BUDGET", "25"))
+# Retries of the payment link lookup, with the backoff doubling from this delay
+LEGACY_PAYMENT_LINK_RETRIES = int(os.getenv("LEGACY_PAYMENT_LINK_RETRIES", "2"))
+LEGACY_PAYMENT_LINK_BACKOFF = float(os.getenv("LEGACY_PAYMENT_LINK_BACKOFF", "0.25"))
+
+# Payment links made in the background (create sent with "Prefer: respond-async")
+LEGACY_PAYMENT_LINK_WORKERS = int(os.getenv("LEGACY_PAYMENT_LINK_WORKERS", "4"))
+LEGACY_PAYMENT_LINK_JOB_TTL = int(os.getenv("LEGACY_PAYMENT_LINK_JOB_TTL", "86400"))
+# Longest ?wait= of the job status endpoint, and how often it checks the job
+LEGACY_PAYMENT_LINK_JOB_MAX_WAIT = float(
+    os.getenv("LEGACY_PAYMENT_LINK_JOB_MAX_WAIT", "20")
+)
+LEGACY_PAYMENT_LINK_JOB_POLL_INTERVAL = float(
+    os.getenv("LEGACY_PAYMENT_LINK_JOB_POLL_INTERVAL", "0.25")
+)
+# After this many seconds a running job is considered dead
+LEGACY_PAYMENT_LINK_JOB_LOCK_TTL = int(
+    os.getenv("LEGACY_PAYMENT_LINK_JOB_LOCK_TTL", "120")
+)
+
+# Proxy views sending upstream bytes as is (autocomplete, quote, my_booking).
+# quote and my_booking still decode the whole body once to validate it.
+LEGACY_PASSTHROUGH_ENDPOINTS = [
+    name for name in os.getenv("LEGACY_PASSTHROUGH_ENDPOINTS", "").split(",") if name
+]
+
+# Coalesce identical in-flight upstream calls (optionally across workers)
+LEGACY_SINGLEFLIGHT_TIMEOUT = float(os.getenv("LEGACY_SINGLEFLIGHT_TIMEOUT", "10"))
+LEGACY_SINGLEFLIGHT_SHARED = os.getenv("LEGACY_SINGLEFLIGHT_SHARED", "False") == "True"
+LEGACY_SINGLEFLIGHT_LOCK_TTL = int(os.getenv("LEGACY_SINGLEFLIGHT_LOCK_TTL", "15"))
+LEGACY_SINGLEFLIGHT_POLL_INTERVAL = float(
+    os.getenv("LEGACY_SINGLEFLIGHT_POLL_INTERVAL", "0.05")
+)
+
 print(f"DEBUG: {DEBUG}")
 
 print(f"HOST: {HOST}")
@@ -72,6 +273,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Request latency histograms, first so it times everything else
+    "utils.metrics.MetricsMiddleware",
+    # Brotli/gzip for API payloads, before anything reading the body
+    "utils.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     # Manage static files
@@ -144,6 +349,34 @@ else:
     }
 
 
+# Cache
+# Use a shared backend (e.g. django.core.cache.backends.redis.RedisCache)
+# in production so every gunicorn worker sees the same entries
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+
+# Logging
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "legacy_middleware": {
+            "handlers": ["console"],
+            "level": os.getenv("LEGACY_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -196,6 +429,37 @@ if cors_allowed and cors_allowed != "None":
         origin.strip().rstrip("/") for origin in cors_allowed.split(",") if origin.strip()
     ]
 
+# Response compression (utils.compression.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_CONTENT_TYPES = [
+    "application/json",
+    "application/x-ndjson",
+    "text/event-stream",
+]
+# Routes reflecting user input next to personal data or secrets (BREACH)
+COMPRESSION_EXCLUDED_ROUTES = [
+    route
+    for route in os.getenv(
+        "COMPRESSION_EXCLUDED_ROUTES", "api/legacy/create/,api/legacy/my-booking/"
+    ).split(",")
+    if route
+]
+
+# Custom request headers the landing pages may send
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key", "prefer")
+
+# Custom response headers the landing pages are allowed to read
+CORS_EXPOSE_HEADERS = [
+    "X-Cache-Status",
+    "Retry-After",
+    "Server-Timing",
+    "Idempotent-Replayed",
+    "Location",
+    "Preference-Applied",
+]
+
 csrf_trusted = os.getenv("CSRF_TRUSTED_ORIGINS")
 if csrf_trusted and csrf_trusted != "None":
     CSRF_TRUSTED_ORIGINS = [
@@ -261,8 +525,28 @@ else:
 
 
 # Setup drf
+# JSON engine of the REST API: "orjson" (same output, faster) or "stdlib"
+API_JSON_ENGINE = os.getenv("API_JSON_ENGINE", "orjson")
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
+    "DEFAULT_RENDERER_CLASSES": (
+        (
+            "utils.renderers.ORJSONRenderer"
+            if API_JSON_ENGINE == "orjson"
+            else "rest_framework.renderers.JSONRenderer"
+        ),
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        (
+            "utils.parsers.ORJSONParser"
+            if API_JSON_ENGINE == "orjson"
+            else "rest_framework.parsers.JSONParser"
+        ),
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "project.pagination.CustomPageNumberPagination",
     "PAGE_SIZE": 12,
     "DEFAULT_AUTHENTICATION_CLASSES": (
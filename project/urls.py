@@ -7,6 +7,8 @@ from django.urls import include
 from rest_framework import routers
 
 from blog import views as blog_views
+from legacy_middleware.admin import flush_negative_cache
+from utils.metrics import MetricsView
 
 router = routers.DefaultRouter()
 
@@ -15,12 +17,19 @@ router.register(r"posts", blog_views.PostViewSet, basename="posts")
 
 urlpatterns = [
     # Admin
+    path(
+        "admin/legacy-cache/flush-negative/",
+        admin.site.admin_view(flush_negative_cache),
+        name="legacy_flush_negative_cache",
+    ),
     path("admin/", admin.site.urls),
     # Redirects
     path("", RedirectView.as_view(url="/admin/"), name="home-redirect-admin"),
     # API URLs
     path("api/", include("legacy_middleware.urls")),
     path("api/", include(router.urls)),
+    # Prometheus scrape endpoint
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -7,5 +7,15 @@ echo "Running migrations..."
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
 
+echo "Preparing metrics directory..."
+# Every gunicorn worker writes its Prometheus samples here, /metrics merges them
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 echo "Starting Gunicorn..."
+if [ "$LEGACY_PROXY_ASYNC" = "True" ]; then
+    # Async proxy views need an ASGI worker
+    exec gunicorn --bind 0.0.0.0:80 -k uvicorn_worker.UvicornWorker project.asgi:application
+fi
 exec gunicorn --bind 0.0.0.0:80 project.wsgi:application
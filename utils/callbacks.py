@@ -47,6 +47,34 @@ def dashboard_callback(request, context):
     context.update(
         {
             "sample": "example",  # this will be injected into templates/admin/index.html
+            "legacy_breakers_table": legacy_breakers_table(),
         }
     )
     return context
+
+
+def legacy_breakers_table():
+    """
+    Circuit breaker state of every legacy API endpoint, shared by all workers.
+    Failure counts are those seen by the worker rendering the dashboard.
+    """
+    from legacy_middleware.breaker import get_breaker
+    from legacy_middleware.services import LEGACY_ENDPOINTS
+
+    rows = []
+    for endpoint in LEGACY_ENDPOINTS:
+        snapshot = get_breaker(endpoint).snapshot()
+        rows.append(
+            [
+                endpoint,
+                snapshot["state"].replace("_", "-"),
+                f"{snapshot['retry_after']}s" if snapshot["retry_after"] else "-",
+                snapshot["calls"],
+                f"{snapshot['failure_rate']:.0%}",
+            ]
+        )
+
+    return {
+        "headers": ["Endpoint", "State", "Retry after", "Recent calls", "Failure rate"],
+        "rows": rows,
+    }
@@ -0,0 +1,159 @@
+import gzip
+import zlib
+
+import brotli
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from utils.metrics import get_route
+
+# Preferred first when the client accepts both with the same weight
+BROTLI = "br"
+GZIP = "gzip"
+ENCODINGS = (BROTLI, GZIP)
+
+
+def negotiate_encoding(accept_encoding) -> str | None:
+    """
+    Pick the content coding for an Accept-Encoding header.
+
+    Returns:
+        str: "br", "gzip" or None to send the body as is.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in ENCODINGS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(content, encoding) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0 so the same body always gives the same bytes
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """
+    Incremental compressor flushing after every chunk, so NDJSON lines and
+    server-sent events reach the client as soon as they are produced.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == BROTLI:
+            self._compressor = brotli.Compressor(
+                quality=settings.COMPRESSION_BROTLI_QUALITY
+            )
+        else:
+            self._compressor = zlib.compressobj(
+                settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+
+    def compress(self, chunk) -> bytes:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if self.encoding == BROTLI:
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+    def wrap(self, chunks):
+        for chunk in chunks:
+            yield self.compress(chunk)
+        yield self.finish()
+
+    async def awrap(self, chunks):
+        async for chunk in chunks:
+            yield self.compress(chunk)
+        yield self.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress API responses with brotli or gzip, as negotiated with the client.
+
+    Only COMPRESSION_CONTENT_TYPES bodies of at least COMPRESSION_MIN_SIZE
+    bytes are compressed. HTML pages carrying CSRF tokens are therefore left
+    alone, and API routes mixing secrets with reflected input can be listed
+    in COMPRESSION_EXCLUDED_ROUTES to rule out BREACH.
+
+    Responses with a ``compressed_content`` dict (passthrough responses)
+    share their compressed bodies with the cached upstream payload, so a
+    cache hit is compressed once per worker instead of once per request.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding") or not self.is_compressible(
+            request, response
+        ):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            compressor = StreamCompressor(encoding)
+            if response.is_async:
+                response.streaming_content = compressor.awrap(response.streaming_content)
+            else:
+                response.streaming_content = compressor.wrap(response.streaming_content)
+            # The compressed size is unknown until the stream ends
+            del response.headers["Content-Length"]
+        else:
+            content = self.get_compressed(response, encoding)
+            # Tiny gains aren't worth the client's CPU
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers["Content-Length"] = str(len(content))
+
+        # A strong ETag must not match a different encoding (RFC 9110 8.8.1)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    def is_compressible(self, request, response) -> bool:
+        content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type not in settings.COMPRESSION_CONTENT_TYPES:
+            return False
+        return get_route(request) not in settings.COMPRESSION_EXCLUDED_ROUTES
+
+    def get_compressed(self, response, encoding) -> bytes:
+        store = getattr(response, "compressed_content", None)
+        if store is None:
+            return compress(response.content, encoding)
+        content = store.get(encoding)
+        if content is None:
+            content = store[encoding] = compress(response.content, encoding)
+        return content
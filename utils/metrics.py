@@ -0,0 +1,89 @@
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Total time spent serving a request, by route.",
+    ["route", "method"],
+)
+
+
+def get_route(request) -> str:
+    """Route pattern of the request, so URL parameters don't explode the labels."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.route or match.view_name
+
+
+def get_registry():
+    """
+    Registry to expose. Under gunicorn every worker writes its samples to
+    PROMETHEUS_MULTIPROC_DIR and the scrape aggregates all of them.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+class MetricsMiddleware:
+    """
+    Record the total latency of every request in REQUEST_LATENCY.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self.observe(request, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.observe(request, started)
+
+    def observe(self, request, started):
+        REQUEST_LATENCY.labels(get_route(request), request.method).observe(
+            time.perf_counter() - started
+        )
+
+
+class MetricsView(APIView):
+    """
+    Prometheus scrape endpoint, restricted to staff users (token or session).
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+        )
@@ -0,0 +1,53 @@
+import re
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Types orjson would format differently from DRF's encoder are handed back to it
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+_default = JSONEncoder().default
+
+# Floats under 1e-4 in orjson's notation ("0.00001", "1e-7"), the stdlib writes
+# "1e-05" and "1e-07". Strings that happen to match only cost a slower render.
+_SMALL_FLOAT = re.compile(rb"0\.0000[0-9]|[0-9]e-[0-9]")
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer backed by orjson, producing the same bytes.
+
+    datetimes, Decimals, lazy strings and every other non-JSON type go through
+    DRF's own encoder. Indented or ASCII-only output, anything orjson
+    rejects (e.g. integers over 64 bits) and output holding floats under 1e-4,
+    which orjson writes differently, fall back to the stdlib renderer.
+    Known difference: NaN and Infinity become null here, where DRF's strict
+    encoder raises ValueError.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if _SMALL_FLOAT.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, these break JavaScript string literals
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028")
+            ret = ret.replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret